@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import platform
+import subprocess
+import threading
+import resource
+try:
+    import psutil
+    _psutil_available = True
+except ImportError:
+    _psutil_available = False
+
+_default_results_dir = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_result(benchmark: str, config: dict, results: dict, output_path: str = None):
+    if output_path is None:
+        os.makedirs(_default_results_dir, exist_ok=True)
+        output_path = os.path.join(_default_results_dir, f'{benchmark}-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    result = {'benchmark': benchmark, 'time': time.time(), 'git_commit': get_git_commit(),
+              'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+              'config': config, 'results': results}
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f'Results saved to {output_path}')
+    return output_path
+
+
+class ResourceMonitor:
+    # CPU time and peak RSS of this process and its children (the browser), sampled with psutil when installed
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak_rss = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _get_cpu_time(self):
+        if _psutil_available:
+            process = psutil.Process()
+            cpu_time = sum(process.cpu_times()[:2])
+            for child in process.children(recursive=True):
+                try:
+                    cpu_time += sum(child.cpu_times()[:2])
+                except psutil.Error:
+                    pass
+            return cpu_time
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def _get_rss(self):
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self._get_rss())
+
+    def __enter__(self):
+        self.begin_time = time.perf_counter()
+        self.begin_cpu_time = self._get_cpu_time()
+        if _psutil_available:
+            self.peak_rss = self._get_rss()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+        self.elapsed_time = time.perf_counter() - self.begin_time
+        self.cpu_time = self._get_cpu_time() - self.begin_cpu_time
+        if not _psutil_available:
+            # kilobytes on Linux
+            self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def get_summary(self):
+        return {'seconds': self.elapsed_time, 'cpu_seconds': self.cpu_time,
+                'cpu_utilization': self.cpu_time / self.elapsed_time if self.elapsed_time > 0 else 0,
+                'peak_rss_mb': self.peak_rss / (1024 * 1024)}
@@ -0,0 +1,43 @@
+import json
+
+
+def _flatten(value, prefix=''):
+    if isinstance(value, dict):
+        flattened = {}
+        for key, child in value.items():
+            flattened.update(_flatten(child, f'{prefix}.{key}' if prefix else key))
+        return flattened
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(baseline_path: str, candidate_path: str):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(candidate_path, 'r', encoding='utf-8') as f:
+        candidate = json.load(f)
+    if baseline['benchmark'] != candidate['benchmark']:
+        print(f"Warning: comparing {baseline['benchmark']} with {candidate['benchmark']}")
+    baseline_results = _flatten(baseline['results'])
+    candidate_results = _flatten(candidate['results'])
+    print(f"baseline  {baseline.get('git_commit')}\ncandidate {candidate.get('git_commit')}")
+    for key in sorted(baseline_results.keys() | candidate_results.keys()):
+        old = baseline_results.get(key)
+        new = candidate_results.get(key)
+        if old is None or new is None:
+            print(f'{key:60s} {old!s:>14} {new!s:>14}')
+            continue
+        change = f'{(new - old) / old * 100:+.1f}%' if old != 0 else ''
+        print(f'{key:60s} {old:14.4f} {new:14.4f} {change:>8}')
+
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline', type=str, help='Baseline result JSON')
+    parser.add_argument('candidate', type=str, help='Candidate result JSON')
+    args = parser.parse_args()
+    compare(args.baseline, args.candidate)
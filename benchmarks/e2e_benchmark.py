@@ -0,0 +1,147 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import shutil
+import tempfile
+import multiprocessing
+import contextlib
+from contextlib import closing
+from impl.common import PInterestImageResolution
+from impl.db.factory import create_dao
+from impl.pinterest import download_wordnet_id_search_result_from_pinterest
+from impl.web_driver import WebDriverSession
+from impl.http_fetcher import PooledImageFetcher
+from impl.pinterest_api import PinterestSearchApi
+from impl.image_validation import ImageValidator
+from benchmarks.fake_pinterest import FakePinterestServer, add_fake_pinterest_arguments, get_fake_pinterest_options
+from benchmarks.fake_driver import FakeWebDriverSession
+from benchmarks._common import ResourceMonitor, save_result
+
+_resolutions = {
+    'orig': PInterestImageResolution.Originals,
+    '736x': PInterestImageResolution.p_736x,
+    '564x': PInterestImageResolution.p_564x,
+    '474x': PInterestImageResolution.p_474x,
+    '236x': PInterestImageResolution.p_236x
+}
+
+
+def _serve(options, address_queue, stop_event):
+    # the server runs in its own process so its CPU time is not counted as the downloader's
+    with FakePinterestServer(options=options) as server:
+        address_queue.put((server.get_search_url_template(), server.get_api_base_url()))
+        stop_event.wait()
+
+
+def _get_folder_size(folder: str):
+    size = 0
+    for root, _, files in os.walk(folder):
+        for file in files:
+            if not file.startswith('.') and file != 'meta.csv':
+                size += os.path.getsize(os.path.join(root, file))
+    return size
+
+
+def run_e2e_benchmark(args):
+    target_resolution = _resolutions[args.resolution]
+    address_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    server_process = multiprocessing.Process(target=_serve, args=(get_fake_pinterest_options(args), address_queue,
+                                                                  stop_event))
+    server_process.start()
+    workspace_dir = tempfile.mkdtemp(prefix='pinterest_benchmark_')
+    try:
+        search_url_template, api_base_url = address_queue.get(timeout=60)
+        db_config = None
+        if args.sqlite:
+            db_config = {'backend': 'sqlite', 'database': os.path.join(workspace_dir, 'meta.sqlite')}
+            dao = create_dao(db_config)
+            with dao:
+                with closing(dao.get_cursor()) as cursor:
+                    dao.create_table(cursor)
+        if args.driver == 'fake':
+            web_driver_session = FakeWebDriverSession(profile=args.driver_profile)
+        else:
+            # Chrome skips the proxy for loopback addresses, selenium-wire would not see the images
+            web_driver_session = WebDriverSession(None, args.headless,
+                                                  chrome_arguments=['--proxy-bypass-list=<-loopback>'],
+                                                  profile=args.driver_profile)
+        image_fetcher = PooledImageFetcher(None, args.http_upgrade) if args.http_upgrade > 0 else None
+        search_api = PinterestSearchApi(api_base_url) if args.discovery == 'api' else None
+        image_validator = ImageValidator(args.validate_images) if args.validate_images > 0 else None
+        background_writer_options = {'num_threads': args.writer_threads} if args.writer_threads > 0 else None
+        pipeline_options = {'fetch_concurrency': args.fetch_concurrency}
+        states = {}
+        num_images = 0
+        quiet = open(os.devnull, 'w') if not args.verbose else None
+        with ResourceMonitor() as monitor:
+            with contextlib.redirect_stdout(quiet) if quiet is not None else contextlib.nullcontext():
+                for index in range(args.categories):
+                    state, count = download_wordnet_id_search_result_from_pinterest(
+                        f'n{index:08d}', f'benchmark query {index}', workspace_dir, db_config, args.target,
+                        target_resolution, None, args.headless, web_driver_session=web_driver_session,
+                        image_fetcher=image_fetcher, engine=args.engine, pipeline_options=pipeline_options,
+                        streaming_capture=args.streaming_capture,
+                        background_writer_options=background_writer_options, storage_backend=args.storage,
+                        search_url_template=search_url_template, discovery=args.discovery,
+                        search_api=search_api, scroll_pacing=args.scroll_pacing,
+                        image_validator=image_validator)
+                    states[state.name] = states.get(state.name, 0) + 1
+                    num_images += count
+        if quiet is not None:
+            quiet.close()
+        web_driver_session.close()
+        if image_fetcher is not None:
+            image_fetcher.close()
+        if search_api is not None:
+            search_api.close()
+        if image_validator is not None:
+            image_validator.close()
+        num_bytes = _get_folder_size(workspace_dir)
+        results = monitor.get_summary()
+        results.update({'images': num_images, 'bytes': num_bytes,
+                        'images_per_sec': num_images / results['seconds'],
+                        'bytes_per_sec': num_bytes / results['seconds'], 'states': states})
+        return results
+    finally:
+        stop_event.set()
+        server_process.join()
+        if not args.keep_workspace:
+            shutil.rmtree(workspace_dir, ignore_errors=True)
+        else:
+            print(f'Workspace kept at {workspace_dir}')
+
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end throughput against a local fake Pinterest server')
+    parser.add_argument('--categories', type=int, default=5, help='Number of categories to download')
+    parser.add_argument('--target', type=int, default=200, help='Number of images per category')
+    parser.add_argument('--resolution', type=str, default='736x', choices=list(_resolutions.keys()))
+    parser.add_argument('--driver', type=str, default='fake', choices=['fake', 'chrome'],
+                        help='fake: HTTP client imitating the browser, chrome: the real selenium-wire driver')
+    parser.add_argument('--headless', action='store_true', help='Running chrome in headless mode')
+    parser.add_argument('--driver-profile', type=str, default='default', choices=['default', 'lean', 'no-images'])
+    parser.add_argument('--engine', type=str, default='serial', choices=['serial', 'async'])
+    parser.add_argument('--discovery', type=str, default='browser', choices=['browser', 'api'],
+                        help='api: page through the search JSON resource, the driver is not used')
+    parser.add_argument('--scroll-pacing', type=str, default='fixed', choices=['fixed', 'event'])
+    parser.add_argument('--fetch-concurrency', type=int, default=8, help='Concurrency of the async fetch stage')
+    parser.add_argument('--http-upgrade', type=int, default=0, metavar='CONCURRENCY')
+    parser.add_argument('--streaming-capture', action='store_true')
+    parser.add_argument('--writer-threads', type=int, default=0)
+    parser.add_argument('--storage', type=str, default='files', choices=['files', 'shards'])
+    parser.add_argument('--sqlite', action='store_true', help='Store meta data in a SQLite database')
+    parser.add_argument('--validate-images', type=int, default=0, metavar='PROCESSES')
+    parser.add_argument('--keep-workspace', action='store_true')
+    parser.add_argument('--verbose', action='store_true', help='Show the downloader output')
+    parser.add_argument('--output', type=str, help='Result JSON path, benchmarks/results/ by default')
+    add_fake_pinterest_arguments(parser)
+    args = parser.parse_args()
+    results = run_e2e_benchmark(args)
+    print(f"{results['images']} images in {results['seconds']:.2f}s, {results['images_per_sec']:.2f} images/s, "
+          f"{results['bytes_per_sec'] / 1024 / 1024:.2f} MB/s, cpu {results['cpu_utilization']:.2f}, "
+          f"peak rss {results['peak_rss_mb']:.0f}MB, states {results['states']}")
+    save_result('e2e', vars(args), results, args.output)
@@ -0,0 +1,202 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import re
+import json
+import math
+import time
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from impl.http_fetcher import create_http_session, FetchedRequest, FetchedResponse
+from impl.web_driver import get_web_driver_profile
+
+# Stands in for the selenium-wire driver against the fake Pinterest server, so the real download loop can be
+# measured without a browser. It understands the scripts the download loop runs: scrolling, reading the page
+# height, loading images with new Image(), finding images in the DOM and the event-driven scroll pacer's wait.
+# Images load asynchronously, like they do in the browser, unless the profile disables images.
+
+_image_tag_pattern = re.compile(r'<img src="([^"]+)"')
+_next_url_pattern = re.compile(r'data-next="([^"]+)"')
+_script_url_pattern = re.compile(r"'(https?://[^']+)'")
+_pin_height = 300
+_pins_per_row = 5
+
+
+class FakeWebDriver:
+    def __init__(self, max_concurrency: int = 6, timeout: float = 30, load_images: bool = True):
+        # browsers open about six connections per host
+        self.session = create_http_session(None, max_concurrency)
+        self.executor = ThreadPoolExecutor(max_concurrency)
+        self.timeout = timeout
+        self.load_images = load_images
+        self.pin_urls = []
+        self.num_discovered_pins = 0
+        self.lock = threading.Lock()
+        self.captured_requests = []
+        self.scopes = []
+        self.response_interceptor = None
+        self.next_url = None
+        self.next_page = 1
+        self.num_pins = 0
+        self.exhausted = False
+        self.loading = False
+        self.num_loading_images = 0
+        self.script_timeout = 30
+
+    @property
+    def requests(self):
+        with self.lock:
+            return list(self.captured_requests)
+
+    @requests.deleter
+    def requests(self):
+        with self.lock:
+            self.captured_requests.clear()
+
+    def _is_in_scope(self, url: str):
+        return len(self.scopes) == 0 or any(re.match(scope, url) for scope in self.scopes)
+
+    def _fetch(self, url: str):
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            fetched_response = FetchedResponse(response.status_code,
+                                               {'Content-Type': response.headers.get('Content-Type')},
+                                               response.content)
+        except Exception:
+            fetched_response = None
+        if self._is_in_scope(url):
+            request = FetchedRequest(url, fetched_response)
+            response_interceptor = getattr(self, 'response_interceptor', None)
+            if response_interceptor is not None:
+                if fetched_response is not None:
+                    response_interceptor(request, fetched_response)
+            else:
+                with self.lock:
+                    self.captured_requests.append(request)
+        return fetched_response
+
+    def _load_image(self, url: str):
+        try:
+            self._fetch(url)
+        finally:
+            with self.lock:
+                self.num_loading_images -= 1
+
+    def _load_images(self, urls):
+        with self.lock:
+            self.num_loading_images += len(urls)
+        for url in urls:
+            self.executor.submit(self._load_image, url)
+
+    def _add_pins(self, urls):
+        with self.lock:
+            self.pin_urls.extend(urls)
+        if self.load_images:
+            self._load_images(urls)
+
+    def _load_next_page(self):
+        try:
+            response = self._fetch(self.next_url + f'&page={self.next_page}')
+            if response is None or response.status_code != 200:
+                return
+            image_urls = json.loads(response.body)['images']
+            with self.lock:
+                self.next_page += 1
+                self.num_pins += len(image_urls)
+                self.exhausted = len(image_urls) == 0
+            self._add_pins(image_urls)
+        finally:
+            with self.lock:
+                self.loading = False
+
+    def get(self, url: str):
+        response = self._fetch(url)
+        page = response.body.decode('utf-8') if response is not None else ''
+        image_urls = [urllib.parse.unquote(image_url) for image_url in _image_tag_pattern.findall(page)]
+        next_url = _next_url_pattern.search(page)
+        with self.lock:
+            self.next_url = urllib.parse.urljoin(url, next_url.group(1)) if next_url is not None else None
+            self.next_page = 1
+            self.loading = False
+            self.num_pins = len(image_urls)
+            self.exhausted = self.next_url is None
+            self.pin_urls = []
+            self.num_discovered_pins = 0
+        self._add_pins(image_urls)
+
+    def execute_script(self, script: str):
+        if 'scrollTo' in script:
+            with self.lock:
+                # like the page script, one page at a time
+                if self.exhausted or self.loading:
+                    return None
+                self.loading = True
+            self.executor.submit(self._load_next_page)
+        elif 'return document.body.scrollHeight' in script:
+            with self.lock:
+                return math.ceil(self.num_pins / _pins_per_row) * _pin_height
+        elif 'new Image' in script:
+            if self.load_images:
+                self._load_images(_script_url_pattern.findall(script))
+        elif 'data-discovered' in script:
+            with self.lock:
+                urls = self.pin_urls[self.num_discovered_pins:]
+                self.num_discovered_pins = len(self.pin_urls)
+            return urls
+        return None
+
+    def set_script_timeout(self, timeout: float):
+        self.script_timeout = timeout
+
+    def execute_async_script(self, script: str, *args):
+        if '__scrollPacer' not in script:
+            return None
+        last_pins, timeout, idle_time = args
+        self.execute_script('window.scrollTo(0, document.body.scrollHeight);')
+        begin_time = time.perf_counter()
+        idle_begin_time = None
+        while True:
+            with self.lock:
+                idle = not self.loading and self.num_loading_images == 0
+                num_pins = len(self.pin_urls)
+            now = time.perf_counter()
+            if idle:
+                idle_begin_time = idle_begin_time if idle_begin_time is not None else now
+            else:
+                idle_begin_time = None
+            if (num_pins > last_pins and idle) or (idle and (now - idle_begin_time) * 1000 >= idle_time) or \
+                    (now - begin_time) * 1000 >= timeout:
+                return {'pins': num_pins, 'pending_images': 0 if idle else 1,
+                        'idle_ms': (now - idle_begin_time) * 1000 if idle else 0}
+            time.sleep(0.01)
+
+    def quit(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+
+class FakeWebDriverSession:
+    # same interface as impl.web_driver.WebDriverSession
+    def __init__(self, max_concurrency: int = 6, profile: str = 'default'):
+        self.max_concurrency = max_concurrency
+        self.profile = get_web_driver_profile(profile)
+        self.driver = None
+
+    def acquire(self):
+        if self.driver is None:
+            self.driver = FakeWebDriver(self.max_concurrency, load_images=not self.profile.disable_images)
+            if self.profile.scopes is not None:
+                self.driver.scopes = self.profile.scopes
+        return self.driver
+
+    def release(self):
+        del self.driver.requests
+
+    def discard(self):
+        self.close()
+
+    def close(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
@@ -0,0 +1,295 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import io
+import json
+import time
+import random
+import hashlib
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+try:
+    from PIL import Image
+    import numpy as np
+    _pillow_available = True
+except ImportError:
+    _pillow_available = False
+
+# Imitates the two things the downloader talks to:
+#   /search/pins/?q=...                          search page, more pins are appended while scrolling
+#   /resource/search?q=...&page=N                next page of pins, used by the search page script
+#   /resource/BaseSearchResource/get/?data=...   search JSON resource paged by a bookmark cursor
+#   /i.pinimg.com/<resolution>/ab/cd/ef/<h>.jpg  image host with one folder per resolution
+# Image URLs keep the i.pinimg.com/<resolution>/ layout so the downloader parses them like the real ones.
+
+_resolutions = ('75x75_RS', '170x', '236x', '474x', '564x', '736x', 'originals')
+_resolution_widths = {'75x75_RS': 75, '170x': 170, '236x': 236, '474x': 474, '564x': 564, '736x': 736,
+                      'originals': 1200}
+_thumbnail_resolution = '236x'
+_pin_height = 300
+_pins_per_row = 5
+_image_pool_size = 8
+_api_resolution_keys = {'75x75_RS': '75x75_RS', '170x': '170x', '236x': '236x', '474x': '474x', '564x': '564x',
+                        '736x': '736x', 'originals': 'orig'}
+
+_search_page_template = '''<!DOCTYPE html>
+<html>
+<head><title>{query}</title></head>
+<body style="margin: 0">
+<div id="pins" data-next="{next_url}">{images}</div>
+<script>
+const pins = document.getElementById('pins');
+let page = 1;
+let loading = false;
+let exhausted = false;
+function loadMore() {{
+    if (loading || exhausted || window.innerHeight + window.scrollY < document.body.scrollHeight - {pin_height}) {{
+        return;
+    }}
+    loading = true;
+    fetch(pins.dataset.next + '&page=' + page).then(response => response.json()).then(data => {{
+        for (const url of data.images) {{
+            const img = document.createElement('img');
+            img.src = url;
+            img.width = 236;
+            img.height = {pin_height};
+            pins.appendChild(img);
+        }}
+        page += 1;
+        exhausted = data.images.length === 0;
+        loading = false;
+    }}).catch(() => {{ loading = false; }});
+}}
+window.addEventListener('scroll', loadMore);
+</script>
+</body>
+</html>
+'''
+
+
+def _get_image_hash(query: str, index: int):
+    return hashlib.md5(f'{query}-{index}'.encode('utf-8')).hexdigest()
+
+
+def _generate_image_pool(resolution: str):
+    width = _resolution_widths[resolution]
+    height = width * 4 // 3
+    images = []
+    rng = random.Random(width)
+    for _ in range(_image_pool_size):
+        if _pillow_available:
+            pixels = np.random.default_rng(rng.getrandbits(32)).integers(0, 256, (height, width, 3), dtype=np.uint8)
+            buffer = io.BytesIO()
+            Image.fromarray(pixels).save(buffer, format='JPEG', quality=85)
+            images.append(buffer.getvalue())
+        else:
+            images.append(b'\xff\xd8' + rng.randbytes(width * height // 4) + b'\xff\xd9')
+    return images
+
+
+class FakePinterestOptions:
+    def __init__(self, pins_per_page: int = 25, max_pages: int = 40, latency: float = 0., latency_jitter: float = 0.,
+                 error_rate: float = 0., missing_resolutions: tuple = ('originals',),
+                 missing_resolution_rate: float = 0., seed: int = 0):
+        self.pins_per_page = pins_per_page
+        self.max_pages = max_pages
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.missing_resolutions = tuple(missing_resolutions)
+        self.missing_resolution_rate = missing_resolution_rate
+        self.seed = seed
+
+
+class _FakePinterestRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status_code: int, content_type: str, body: bytes):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record(len(body))
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        parameters = urllib.parse.parse_qs(url.query)
+        if url.path == '/search/pins/':
+            self._search_page(parameters.get('q', [''])[0])
+        elif url.path == '/resource/search':
+            self._search_resource(parameters.get('q', [''])[0], int(parameters.get('page', ['1'])[0]))
+        elif url.path == '/resource/BaseSearchResource/get/':
+            self._base_search_resource(parameters.get('data', ['{}'])[0])
+        elif url.path.startswith('/i.pinimg.com/'):
+            self._image(url.path)
+        else:
+            self._send(404, 'text/plain', b'not found')
+
+    def _get_image_urls(self, query: str, page: int):
+        options = self.server.options
+        if page >= options.max_pages:
+            return []
+        begin = page * options.pins_per_page
+        return [self.server.get_image_url(_thumbnail_resolution, _get_image_hash(query, index))
+                for index in range(begin, begin + options.pins_per_page)]
+
+    def _search_page(self, query: str):
+        images = ''.join(f'<img src="{url}" width="236" height="{_pin_height}">'
+                         for url in self._get_image_urls(query, 0))
+        next_url = f'/resource/search?q={urllib.parse.quote(query)}'
+        body = _search_page_template.format(query=query, next_url=next_url, images=images, pin_height=_pin_height)
+        self._send(200, 'text/html; charset=utf-8', body.encode('utf-8'))
+
+    def _search_resource(self, query: str, page: int):
+        body = json.dumps({'images': self._get_image_urls(query, page)}).encode('utf-8')
+        self._send(200, 'application/json', body)
+
+    def _base_search_resource(self, data: str):
+        options = self.server.options
+        try:
+            resource_options = json.loads(data)['options']
+            query = resource_options['query']
+            bookmarks = resource_options.get('bookmarks', [])
+            page = int(bookmarks[0][len('page-'):]) if len(bookmarks) > 0 else 0
+        except (ValueError, KeyError, TypeError):
+            self._send(400, 'application/json', b'{"resource_response": {"error": "bad request"}}')
+            return
+        if random.random() < options.error_rate:
+            self._send(503, 'application/json', b'{"resource_response": {"error": "unavailable"}}')
+            return
+        results = []
+        for url in self._get_image_urls(query, page):
+            image_hash = url.split('/')[-1][:-len('.jpg')]
+            images = {}
+            for resolution in _resolutions:
+                if resolution in options.missing_resolutions:
+                    continue
+                width = _resolution_widths[resolution]
+                images[_api_resolution_keys[resolution]] = {'url': self.server.get_image_url(resolution, image_hash),
+                                                            'width': width, 'height': width * 4 // 3}
+            results.append({'type': 'pin', 'id': str(int(image_hash[:12], 16)), 'images': images})
+        bookmark = f'page-{page + 1}' if page + 1 < options.max_pages else '-end-'
+        body = json.dumps({'resource_response': {'status': 'success', 'data': {'results': results},
+                                                 'bookmark': bookmark}}).encode('utf-8')
+        self._send(200, 'application/json', body)
+
+    def _image(self, path: str):
+        options = self.server.options
+        parts = path.split('/')
+        if len(parts) != 7 or parts[2] not in _resolution_widths or not parts[6].endswith('.jpg'):
+            self._send(404, 'text/plain', b'not found')
+            return
+        resolution = parts[2]
+        image_hash = parts[6][:-len('.jpg')]
+        rng = random.Random(f'{options.seed}-{image_hash}-{resolution}')
+        if options.latency > 0 or options.latency_jitter > 0:
+            time.sleep(options.latency + rng.random() * options.latency_jitter)
+        if resolution != _thumbnail_resolution and (resolution in options.missing_resolutions or
+                                                    rng.random() < options.missing_resolution_rate):
+            self._send(404, 'text/plain', b'not found')
+            return
+        if random.random() < options.error_rate:
+            self._send(503, 'text/plain', b'unavailable')
+            return
+        image_pool = self.server.get_image_pool(resolution)
+        # bytes after the JPEG end marker are ignored by decoders but make every image unique
+        body = image_pool[int(image_hash, 16) % len(image_pool)] + image_hash.encode('ascii')
+        self._send(200, 'image/jpeg', body)
+
+
+class FakePinterestServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), options: FakePinterestOptions = None):
+        super(FakePinterestServer, self).__init__(address, _FakePinterestRequestHandler)
+        self.options = options if options is not None else FakePinterestOptions()
+        self.image_pools = {}
+        self.lock = threading.Lock()
+        self.num_responses = 0
+        self.num_bytes = 0
+        self.thread = None
+
+    def get_base_url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def get_search_url_template(self):
+        return self.get_base_url() + '/search/pins/?q={query}'
+
+    def get_api_base_url(self):
+        return self.get_base_url()
+
+    def get_image_url(self, resolution: str, image_hash: str):
+        return f'{self.get_base_url()}/i.pinimg.com/{resolution}/{image_hash[0:2]}/{image_hash[2:4]}/' \
+               f'{image_hash[4:6]}/{image_hash}.jpg'
+
+    def get_image_pool(self, resolution: str):
+        with self.lock:
+            if resolution not in self.image_pools:
+                self.image_pools[resolution] = _generate_image_pool(resolution)
+            return self.image_pools[resolution]
+
+    def record(self, num_bytes: int):
+        with self.lock:
+            self.num_responses += 1
+            self.num_bytes += num_bytes
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        if self.thread is not None:
+            self.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def add_fake_pinterest_arguments(parser):
+    parser.add_argument('--pins-per-page', type=int, default=25, help='Pins returned by one scroll')
+    parser.add_argument('--max-pages', type=int, default=40, help='Scrolls until a search is exhausted')
+    parser.add_argument('--latency', type=float, default=0., help='Image response latency (seconds)')
+    parser.add_argument('--latency-jitter', type=float, default=0., help='Random extra image latency (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0., help='Fraction of image requests answered with 503')
+    parser.add_argument('--missing-resolutions', type=str, default='originals',
+                        help='Comma separated resolutions that are never served')
+    parser.add_argument('--missing-resolution-rate', type=float, default=0.,
+                        help='Fraction of images missing each resolution above the thumbnail')
+
+
+def get_fake_pinterest_options(args):
+    missing_resolutions = tuple(resolution for resolution in args.missing_resolutions.split(',') if resolution)
+    return FakePinterestOptions(args.pins_per_page, args.max_pages, args.latency, args.latency_jitter,
+                                args.error_rate, missing_resolutions, args.missing_resolution_rate)
+
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    add_fake_pinterest_arguments(parser)
+    args = parser.parse_args()
+    with FakePinterestServer((args.host, args.port), get_fake_pinterest_options(args)) as server:
+        print(f'Search url template: {server.get_search_url_template()}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
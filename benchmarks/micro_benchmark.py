@@ -0,0 +1,197 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import shutil
+import hashlib
+import tempfile
+from impl.common import PInterestImageResolution
+from impl.io import DownloaderIOOps
+from impl.http_fetcher import FetchedRequest, FetchedResponse
+from impl.pinterest import _parse_requests
+from impl.operators.file_system import FileSystemOperators
+from impl.operators.shard_storage import ShardStorageOperators
+from impl.db.factory import create_dao
+from benchmarks._common import save_result
+
+
+def _measure(func, num_operations: int, repeat: int):
+    # func prepares its own state and returns the callable to time
+    timings = []
+    for _ in range(repeat):
+        run = func()
+        begin_time = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - begin_time)
+    best = min(timings)
+    return {'operations': num_operations, 'best_seconds': best, 'mean_seconds': sum(timings) / len(timings),
+            'operations_per_sec': num_operations / best}
+
+
+def _get_image_url(resolution: str, index: int):
+    image_hash = hashlib.md5(str(index).encode()).hexdigest()
+    return f'https://i.pinimg.com/{resolution}/{image_hash[0:2]}/{image_hash[2:4]}/{image_hash[4:6]}/{image_hash}.jpg'
+
+
+def benchmark_parse_requests(workspace_dir: str, num_requests: int, image_size: int, repeat: int):
+    body = os.urandom(image_size)
+    thumbnails = [FetchedRequest(_get_image_url('236x', index),
+                                 FetchedResponse(200, {'Content-Type': 'image/jpeg'}, body))
+                  for index in range(num_requests)]
+    upgrades = [FetchedRequest(_get_image_url('736x', index),
+                               FetchedResponse(200, {'Content-Type': 'image/jpeg'}, body))
+                for index in range(num_requests)]
+    others = [FetchedRequest(f'https://www.pinterest.com/resource/{index}', None) for index in range(num_requests)]
+    io_operator = DownloaderIOOps('n00000000', workspace_dir, None, 1800)
+    results = {}
+    with io_operator:
+        def new_thumbnails():
+            task_state = {}
+            return lambda: _parse_requests(thumbnails, io_operator, task_state, PInterestImageResolution.p_736x)
+
+        def upgraded_images():
+            task_state = {}
+            _parse_requests(thumbnails, io_operator, task_state, PInterestImageResolution.p_736x)
+            return lambda: _parse_requests(upgrades, io_operator, task_state, PInterestImageResolution.p_736x)
+
+        def unrelated_requests():
+            task_state = {}
+            return lambda: _parse_requests(others, io_operator, task_state, PInterestImageResolution.p_736x)
+
+        results['new_thumbnails'] = _measure(new_thumbnails, num_requests, repeat)
+        results['upgraded_images'] = _measure(upgraded_images, num_requests, repeat)
+        results['unrelated_requests'] = _measure(unrelated_requests, num_requests, repeat)
+    return results
+
+
+def benchmark_storage(workspace_dir: str, storage_class, num_files: int, image_size: int, repeat: int):
+    body = os.urandom(image_size)
+    names = [f'{hashlib.md5(str(index).encode()).hexdigest()}.jpg' for index in range(num_files)]
+    results = {}
+    counter = [0]
+
+    def new_operators():
+        counter[0] += 1
+        folder = os.path.join(workspace_dir, f'{storage_class.__name__}_{counter[0]}')
+        os.mkdir(folder)
+        return storage_class(folder)
+
+    def save():
+        operators = new_operators()
+        return lambda: [operators.save(name, body) for name in names]
+
+    def save_fsync():
+        operators = new_operators()
+        return lambda: [operators.save(name, body, True) for name in names[:num_files // 10]]
+
+    def filled_operators():
+        operators = new_operators()
+        for name in names:
+            operators.save(name, body)
+        return operators
+
+    def has_file():
+        operators = filled_operators()
+        return lambda: [operators.has_file(name) for name in names]
+
+    def list_files():
+        operators = filled_operators()
+        return lambda: operators.list_files()
+
+    results['save'] = _measure(save, num_files, repeat)
+    results['save_fsync'] = _measure(save_fsync, num_files // 10, repeat)
+    results['has_file'] = _measure(has_file, num_files, repeat)
+    results['list_files'] = _measure(list_files, 1, repeat)
+    return results
+
+
+def benchmark_dao(workspace_dir: str, num_records: int, batch_size: int, repeat: int):
+    file_names = [f'{hashlib.md5(str(index).encode()).hexdigest()}.jpg' for index in range(num_records)]
+    urls = [_get_image_url('736x', index) for index in range(num_records)]
+    results = {}
+    counter = [0]
+    daos = []
+
+    def new_dao():
+        counter[0] += 1
+        dao = create_dao({'backend': 'sqlite', 'database': os.path.join(workspace_dir, f'dao_{counter[0]}.sqlite')})
+        dao.__enter__()
+        daos.append(dao)
+        cursor = dao.get_cursor()
+        dao.create_table(cursor)
+        return dao, cursor
+
+    def filled_dao():
+        dao, cursor = new_dao()
+        dao.insert_multiple_and_commit(cursor, ['n00000000'] * num_records, file_names, urls)
+        return dao, cursor
+
+    def insert_and_commit():
+        dao, cursor = new_dao()
+        return lambda: [dao.insert_and_commit(cursor, 'n00000000', file_name, url)
+                        for file_name, url in zip(file_names, urls)]
+
+    def insert_multiple_and_commit():
+        dao, cursor = new_dao()
+
+        def run():
+            for index in range(0, num_records, batch_size):
+                dao.insert_multiple_and_commit(cursor, ['n00000000'] * len(file_names[index: index + batch_size]),
+                                               file_names[index: index + batch_size], urls[index: index + batch_size])
+        return run
+
+    def exists():
+        dao, cursor = filled_dao()
+        return lambda: [dao.exists(cursor, 'n00000000', file_name) for file_name in file_names]
+
+    def get_file_names_by_wordnet_id():
+        dao, cursor = filled_dao()
+        return lambda: dao.get_file_names_by_wordnet_id(cursor, 'n00000000')
+
+    try:
+        results['insert_and_commit'] = _measure(insert_and_commit, num_records, repeat)
+        results['insert_multiple_and_commit'] = _measure(insert_multiple_and_commit, num_records, repeat)
+        results['exists'] = _measure(exists, num_records, repeat)
+        results['get_file_names_by_wordnet_id'] = _measure(get_file_names_by_wordnet_id, 1, repeat)
+    finally:
+        for dao in daos:
+            dao.__exit__(None, None, None)
+    return results
+
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of request parsing, storage and meta data access')
+    parser.add_argument('--benchmarks', type=str, default='parse_requests,file_system,shard_storage,dao',
+                        help='Comma separated benchmarks to run')
+    parser.add_argument('--num', type=int, default=2000, help='Number of requests, files or records')
+    parser.add_argument('--image-size', type=int, default=64 * 1024, help='Image size in bytes')
+    parser.add_argument('--batch-size', type=int, default=64, help='Batch size of batched inserts')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions, the best one is reported')
+    parser.add_argument('--workspace', type=str, help='Scratch folder, a temporary folder by default')
+    parser.add_argument('--output', type=str, help='Result JSON path, benchmarks/results/ by default')
+    args = parser.parse_args()
+    workspace_dir = tempfile.mkdtemp(prefix='pinterest_micro_benchmark_', dir=args.workspace)
+    try:
+        results = {}
+        for name in args.benchmarks.split(','):
+            if name == 'parse_requests':
+                results[name] = benchmark_parse_requests(workspace_dir, args.num, args.image_size, args.repeat)
+            elif name == 'file_system':
+                results[name] = benchmark_storage(workspace_dir, FileSystemOperators, args.num, args.image_size,
+                                                  args.repeat)
+            elif name == 'shard_storage':
+                results[name] = benchmark_storage(workspace_dir, ShardStorageOperators, args.num, args.image_size,
+                                                  args.repeat)
+            elif name == 'dao':
+                results[name] = benchmark_dao(workspace_dir, args.num, args.batch_size, args.repeat)
+            else:
+                raise ValueError(f'Unknown benchmark {name}')
+            for operation, result in results[name].items():
+                print(f"{name}.{operation}: {result['operations_per_sec']:.1f} ops/s "
+                      f"(best {result['best_seconds']:.4f}s, mean {result['mean_seconds']:.4f}s)")
+    finally:
+        shutil.rmtree(workspace_dir, ignore_errors=True)
+    save_result('micro', vars(args), results, args.output)
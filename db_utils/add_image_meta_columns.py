@@ -0,0 +1,22 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from impl.db.factory import create_dao
+from contextlib import closing
+
+
+def db_add_image_meta_columns(db_config: dict):
+    # for databases created before image validation, the new columns are nullable so existing rows stay valid
+    dao = create_dao(db_config)
+    with dao:
+        with closing(dao.get_cursor()) as cursor:
+            if dao.has_image_meta_columns(cursor):
+                print('Image meta columns exist already')
+                return
+            dao.add_image_meta_columns(cursor)
+            print('Image meta columns added')
+
+
+if __name__ == '__main__':
+    from db_utils._get_db_config import get_db_config
+    db_add_image_meta_columns(get_db_config())
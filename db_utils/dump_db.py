@@ -1,34 +1,99 @@
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from impl.db.DAO import PInterestCrawlerDAO
+from impl.db.factory import create_dao
 import os
+import gzip
+import json
+import multiprocessing
 from contextlib import closing
 from datetime import datetime
 import csv
 from tqdm import tqdm
 
 
-def db_dump_records(db_config: dict, save_folder: str, with_id_offset: bool = True):
+def _open_csv_file(csv_file_path: str):
+    if csv_file_path.endswith('.gz'):
+        # a lower level than the default 9, dumping is bound by compression otherwise
+        return gzip.open(csv_file_path, 'wt', newline='', compresslevel=6)
+    return open(csv_file_path, 'w', newline='')
+
+
+def _dump_id_range(db_config: dict, csv_file_path: str, id_min: int, id_max: int, chunk_size: int,
+                   process_bar: tqdm = None):
+    # streams the range through an unbuffered cursor, returns the number of rows and the largest id
+    dao = create_dao(db_config)
+    num_rows = 0
+    max_id = None
+    with dao:
+        with closing(dao.get_cursor(buffered=False)) as cursor, _open_csv_file(csv_file_path) as fid:
+            csv_writer = csv.writer(fid, delimiter=',')
+            dao.get_iterator_with_id_limits(cursor, id_min, id_max)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if len(rows) == 0:
+                    break
+                csv_writer.writerows(row[1:] for row in rows)
+                num_rows += len(rows)
+                last_id = max(row[0] for row in rows)
+                max_id = last_id if max_id is None else max(max_id, last_id)
+                if process_bar is not None:
+                    process_bar.update(len(rows))
+    return num_rows, max_id
+
+
+def _dump_id_range_entry(args):
+    return _dump_id_range(*args)
+
+
+def _split_id_range(id_min: int, id_max: int, num_parts: int):
+    step = max((id_max - id_min + 1 + num_parts - 1) // num_parts, 1)
+    return [(begin, min(begin + step - 1, id_max)) for begin in range(id_min, id_max + 1, step)]
+
+
+def db_dump_records(db_config: dict, save_folder: str, with_id_offset: bool = True, num_workers: int = 1,
+                    compress: bool = False, chunk_size: int = 10000):
     id_file = os.path.join(save_folder, 'dumped_max_id.txt')
     dumped_max_id = -1
     if with_id_offset:
         if os.path.exists(id_file):
             with open(id_file) as f:
                 dumped_max_id = int(f.read().strip())
-    dao = PInterestCrawlerDAO(db_config)
-    csv_file_path = os.path.join(save_folder, f'{datetime.now().strftime("%Y.%m.%d-%H.%M.%S-%f")}.csv')
-    id_ = None
+    dao = create_dao(db_config)
     with dao:
-        with closing(dao.get_cursor(buffered=True)) as cursor, open(csv_file_path, 'w', newline='') as fid:
-            csv_writer = csv.writer(fid, delimiter=',')
-            for id_, wordnet_id_and_file_name, url in tqdm(dao.get_iterator_with_id_limits(cursor, dumped_max_id + 1)):
-                wordnet_id = wordnet_id_and_file_name[:9]
-                file_name = wordnet_id_and_file_name[10:]
-                csv_writer.writerow((wordnet_id, file_name, url))
-    if with_id_offset and id_ is not None:
+        with closing(dao.get_cursor()) as cursor:
+            id_min, id_max = dao.get_id_range(cursor, dumped_max_id + 1)
+    if id_min is None:
+        print('No new records')
+        return
+
+    name = datetime.now().strftime("%Y.%m.%d-%H.%M.%S-%f")
+    suffix = '.csv.gz' if compress else '.csv'
+    if num_workers <= 1:
+        csv_file_path = os.path.join(save_folder, name + suffix)
+        with tqdm() as process_bar:
+            num_rows, max_id = _dump_id_range(db_config, csv_file_path, id_min, id_max, chunk_size, process_bar)
+        parts = [{'file': os.path.basename(csv_file_path), 'id_min': id_min, 'id_max': id_max, 'rows': num_rows}]
+    else:
+        # ranges are split by id, each part is dumped by its own process and connection
+        id_ranges = _split_id_range(id_min, id_max, num_workers * 4)
+        tasks = [(db_config, os.path.join(save_folder, f'{name}-part{index:04d}{suffix}'), range_min, range_max,
+                  chunk_size) for index, (range_min, range_max) in enumerate(id_ranges)]
+        with multiprocessing.Pool(num_workers) as pool:
+            results = list(tqdm(pool.imap(_dump_id_range_entry, tasks), total=len(tasks)))
+        parts = [{'file': os.path.basename(task[1]), 'id_min': task[2], 'id_max': task[3], 'rows': num_rows}
+                 for task, (num_rows, _) in zip(tasks, results)]
+        part_max_ids = [part_max_id for _, part_max_id in results if part_max_id is not None]
+        max_id = max(part_max_ids) if len(part_max_ids) > 0 else None
+    num_rows = sum(part['rows'] for part in parts)
+    with open(os.path.join(save_folder, f'{name}.manifest.json'), 'w') as fid:
+        json.dump({'id_min': id_min, 'id_max': id_max, 'max_dumped_id': max_id, 'rows': num_rows,
+                   'compressed': compress, 'parts': parts}, fid, indent=2)
+    print(f'{num_rows} records dumped')
+    # written last, an interrupted dump is repeated as a whole
+    if with_id_offset and max_id is not None:
         with open(id_file, 'w') as fid:
-            fid.write(str(id_))
+            fid.write(str(max_id))
 
 
 import argparse
@@ -38,7 +103,12 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser('Dump meta data from mysql to CSV files')
     parser.add_argument('save_folder', type=str, help='Folder path to store CSV')
     parser.add_argument('--track-dumped-id', action='store_true', help='Skip dumped records')
+    parser.add_argument('--num-workers', type=int, default=1,
+                        help='Split the id range into parts dumped in parallel, each on its own connection')
+    parser.add_argument('--gzip', action='store_true', help='Compress the CSV files')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows fetched from the server at once')
     args = parser.parse_args()
 
     from db_utils._get_db_config import get_db_config
-    db_dump_records(get_db_config(), args.save_folder, args.track_dumped_id)
+    db_dump_records(get_db_config(), args.save_folder, args.track_dumped_id, args.num_workers, args.gzip,
+                    args.chunk_size)
@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from impl.db.factory import create_dao
+from contextlib import closing
+import time
+from tqdm import tqdm
+
+
+def db_migrate_schema_v2(db_config: dict, chunk_size: int = 10000, throttle: float = 0, drop_old_table: bool = False):
+    # online, downloaders keep writing to the version 1 table meanwhile; after the swap their next statement fails on
+    # the new layout, the DAO detects the version again and retries it
+    dao = create_dao(db_config)
+    with dao:
+        with closing(dao.get_cursor(buffered=True)) as cursor:
+            if dao.get_schema_version() == 2:
+                print('Schema version 2 already')
+                return
+            needs_copy = dao.begin_schema_v2_migration(cursor)
+            if needs_copy:
+                # read after the mirror triggers exist, later records reach the new table through them
+                id_min, id_max = dao.get_id_range(cursor)
+                num_copied = 0
+                if id_min is not None:
+                    with tqdm(total=id_max - id_min + 1, unit='ids') as process_bar:
+                        for range_min in range(id_min, id_max + 1, chunk_size):
+                            range_max = min(range_min + chunk_size - 1, id_max)
+                            num_copied += dao.copy_records_to_schema_v2(cursor, range_min, range_max)
+                            process_bar.update(range_max - range_min + 1)
+                            if throttle > 0:
+                                time.sleep(throttle)
+                print(f'{num_copied} records copied')
+            dao.finish_schema_v2_migration(cursor)
+            if needs_copy and drop_old_table:
+                dao.drop_schema_v1_table(cursor)
+            print(f'Migrated to schema version 2, {dao.count_all(cursor)} records')
+
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Migrate the Records table to schema version 2 online')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Ids copied per transaction')
+    parser.add_argument('--throttle', type=float, default=0, help='Seconds to sleep between chunks')
+    parser.add_argument('--drop-old-table', action='store_true',
+                        help='Drop the version 1 table (kept as Records_v1) after the swap')
+    args = parser.parse_args()
+
+    from db_utils._get_db_config import get_db_config
+    db_migrate_schema_v2(get_db_config(), args.chunk_size, args.throttle, args.drop_old_table)
@@ -1,12 +1,12 @@
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from impl.db.DAO import PInterestCrawlerDAO
+from impl.db.factory import create_dao
 from contextlib import closing
 
 
 def db_prepare(db_config: dict):
-    dao = PInterestCrawlerDAO(db_config)
+    dao = create_dao(db_config)
     with dao:
         with closing(dao.get_cursor()) as cursor:
             dao.create_table(cursor)
@@ -1,50 +1,311 @@
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from impl.db.DAO import PInterestCrawlerDAO
+from impl.db.factory import create_dao
 from contextlib import closing
+import gzip
 import csv
+import json
+import time
+import queue
+import shutil
+import tempfile
+import traceback
+import multiprocessing
 from tqdm import tqdm
 
 
-def db_restore_records_from_csv(db_config: dict, csv_file: str):
-    buffer_size = 100
-    buffered_wordnet_ids = []
-    buffered_file_names = []
-    buffered_urls = []
-    dao = PInterestCrawlerDAO(db_config)
-    with dao:
-        try:
-            with closing(dao.get_cursor()) as cursor, open(csv_file, 'r', newline='') as fid:
-                csv_reader = csv.reader(fid, delimiter=',')
-                for row in tqdm(csv_reader):
-                    if len(row) == 0:
+def _open_csv_file(csv_file: str):
+    open_function = gzip.open if csv_file.endswith('.gz') else open
+    return open_function(csv_file, 'rt', newline='')
+
+
+def _expand_csv_files(paths):
+    # a dump manifest stands for its part files
+    csv_files = []
+    for path in paths:
+        if path.endswith('.manifest.json'):
+            with open(path) as f:
+                manifest = json.load(f)
+            csv_files.extend(os.path.join(os.path.dirname(path), part['file']) for part in manifest['parts'])
+        else:
+            csv_files.append(path)
+    return [os.path.abspath(csv_file) for csv_file in csv_files]
+
+
+class _RestoreCheckpoint:
+    # per file: rows committed without gaps, and whether the file is complete. Batches of several loaders commit
+    # out of order, only the contiguous prefix is recorded; rows after it may be inserted again on resume and are
+    # ignored as duplicates.
+    def __init__(self, path: str, save_interval: float = 1):
+        self.path = path
+        self.save_interval = save_interval
+        self.last_save_time = 0
+        self.files = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.files = json.load(f)['files']
+        self.batches = {}
+
+    def get_committed_rows(self, csv_file: str):
+        state = self.files.get(csv_file)
+        return state['rows'] if state is not None else 0
+
+    def is_done(self, csv_file: str):
+        state = self.files.get(csv_file)
+        return state is not None and state['done']
+
+    def add_batch(self, csv_file: str, batch_index: int, end_row: int):
+        self.batches.setdefault(csv_file, {'next': 0, 'committed': {}, 'ends': {}, 'read_all': None})
+        self.batches[csv_file]['ends'][batch_index] = end_row
+
+    def set_read_all(self, csv_file: str, num_batches: int):
+        self.batches.setdefault(csv_file, {'next': 0, 'committed': {}, 'ends': {}, 'read_all': None})
+        self.batches[csv_file]['read_all'] = num_batches
+        self._advance(csv_file)
+
+    def commit_batch(self, csv_file: str, batch_index: int):
+        self.batches[csv_file]['committed'][batch_index] = True
+        self._advance(csv_file)
+
+    def _advance(self, csv_file: str):
+        batches = self.batches[csv_file]
+        state = self.files.setdefault(csv_file, {'rows': 0, 'done': False})
+        while batches['next'] in batches['committed']:
+            state['rows'] = batches['ends'].pop(batches['next'])
+            del batches['committed'][batches['next']]
+            batches['next'] += 1
+        if batches['read_all'] is not None and batches['next'] == batches['read_all']:
+            state['done'] = True
+
+    def mark_done(self, csv_file: str):
+        self.files[csv_file] = {'rows': self.files.get(csv_file, {'rows': 0})['rows'], 'done': True}
+
+    def save(self, force: bool = False):
+        if self.path is None or (not force and time.perf_counter() - self.last_save_time < self.save_interval):
+            return
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'files': self.files}, f, indent=2)
+        os.replace(self.path + '.tmp', self.path)
+        self.last_save_time = time.perf_counter()
+
+
+def _insert_batch(dao, cursor, rows):
+    # returns the number of inserted and failed rows, a failed statement leaves the rest of the transaction intact
+    wordnet_ids, file_names, urls = zip(*rows)
+    try:
+        return dao.insert_multiple_ignore_duplicates(cursor, wordnet_ids, file_names, urls), 0
+    except Exception:
+        inserted = 0
+        failed = 0
+        for wordnet_id, file_name, url in rows:
+            try:
+                inserted += dao.insert_multiple_ignore_duplicates(cursor, [wordnet_id], [file_name], [url])
+            except Exception as e:
+                failed += 1
+                print(f'Failed to insert {wordnet_id}-{file_name}: {e}')
+        return inserted, failed
+
+
+def _count_csv_rows(csv_file: str):
+    with _open_csv_file(csv_file) as fid:
+        return sum(1 for row in csv.reader(fid, delimiter=',') if len(row) > 0)
+
+
+def _load_file(dao, cursor, csv_file: str):
+    # returns the number of rows in the file and the number of inserted rows
+    num_rows = _count_csv_rows(csv_file)
+    if not csv_file.endswith('.gz'):
+        return num_rows, dao.load_data_local_infile(cursor, csv_file)
+    with tempfile.NamedTemporaryFile('wb', suffix='.csv') as f:
+        with gzip.open(csv_file, 'rb') as fid:
+            shutil.copyfileobj(fid, f)
+        f.flush()
+        return num_rows, dao.load_data_local_infile(cursor, f.name)
+
+
+def _loader_entry(db_config: dict, task_queue, result_queue, commit_every: int):
+    # tasks: ('batch', csv_file, batch_index, rows) or ('file', csv_file), None to stop
+    dao = create_dao(db_config)
+    try:
+        with dao:
+            with closing(dao.get_cursor()) as cursor:
+                uncommitted = []
+                inserted = 0
+                failed = 0
+                while True:
+                    task = task_queue.get()
+                    if task is None or task[0] == 'batch':
+                        if task is not None:
+                            batch_inserted, batch_failed = _insert_batch(dao, cursor, task[3])
+                            inserted += batch_inserted
+                            failed += batch_failed
+                            uncommitted.append((task[1], task[2], len(task[3])))
+                        if len(uncommitted) > 0 and (task is None or len(uncommitted) >= commit_every):
+                            dao.commit()
+                            result_queue.put(('committed', uncommitted, inserted, failed))
+                            uncommitted = []
+                            inserted = 0
+                            failed = 0
+                        if task is None:
+                            break
+                    else:
+                        num_rows, num_inserted = _load_file(dao, cursor, task[1])
+                        dao.commit()
+                        result_queue.put(('loaded', task[1], num_rows, num_inserted))
+    except Exception:
+        result_queue.put(('error', traceback.format_exc()))
+    finally:
+        result_queue.put(('exit',))
+
+
+class _RestoreProgress:
+    def __init__(self, checkpoint: _RestoreCheckpoint):
+        self.checkpoint = checkpoint
+        self.process_bar = tqdm(unit='rows')
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.bad_rows = 0
+        self.begin_time = time.perf_counter()
+
+    def handle(self, result):
+        if result[0] == 'committed':
+            _, batches, inserted, failed = result
+            for csv_file, batch_index, num_rows in batches:
+                self.checkpoint.commit_batch(csv_file, batch_index)
+                self.rows += num_rows
+                self.process_bar.update(num_rows)
+            self.inserted += inserted
+            self.failed += failed
+        elif result[0] == 'loaded':
+            _, csv_file, num_rows, inserted = result
+            self.checkpoint.mark_done(csv_file)
+            self.rows += num_rows
+            self.inserted += inserted
+            self.process_bar.update(num_rows)
+            self.process_bar.set_postfix_str(os.path.basename(csv_file))
+        elif result[0] == 'error':
+            raise RuntimeError(f'Loader failed:\n{result[1]}')
+        self.checkpoint.save()
+
+    def close(self):
+        self.process_bar.close()
+        self.checkpoint.save(True)
+        elapsed_time = time.perf_counter() - self.begin_time
+        print(f'{self.rows} rows in {elapsed_time:.1f}s ({self.rows / elapsed_time:.0f} rows/s), '
+              f'{self.inserted} inserted, {self.rows - self.inserted - self.failed} duplicates, '
+              f'{self.failed} failed, {self.bad_rows} malformed')
+
+
+def db_restore_records(db_config: dict, csv_files: list, batch_size: int = 5000, commit_every: int = 4,
+                       num_workers: int = 4, checkpoint_path: str = None, load_data: bool = False):
+    csv_files = _expand_csv_files(csv_files)
+    checkpoint = _RestoreCheckpoint(checkpoint_path)
+    if load_data:
+        if db_config.get('backend', 'mysql') != 'mysql':
+            raise RuntimeError('LOAD DATA LOCAL INFILE requires MySQL')
+        db_config = dict(db_config, allow_local_infile=True)
+    task_queue = multiprocessing.Queue(num_workers * 2)
+    result_queue = multiprocessing.Queue()
+    loaders = [multiprocessing.Process(target=_loader_entry, args=(db_config, task_queue, result_queue, commit_every))
+               for _ in range(num_workers)]
+    for loader in loaders:
+        loader.start()
+    progress = _RestoreProgress(checkpoint)
+    num_running_loaders = len(loaders)
+
+    def put(task):
+        # the loaders keep reporting while the reader waits for room in the task queue
+        nonlocal num_running_loaders
+        while True:
+            try:
+                task_queue.put(task, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+            finally:
+                while True:
+                    try:
+                        result = result_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if result[0] == 'exit':
+                        num_running_loaders -= 1
+                    else:
+                        progress.handle(result)
+            if num_running_loaders == 0:
+                raise RuntimeError('All loaders exited')
+
+    try:
+        for csv_file in csv_files:
+            if checkpoint.is_done(csv_file):
+                continue
+            if load_data:
+                put(('file', csv_file))
+                continue
+            skip_rows = checkpoint.get_committed_rows(csv_file)
+            batch_index = 0
+            rows = []
+            row_index = 0
+            with _open_csv_file(csv_file) as fid:
+                for row in csv.reader(fid, delimiter=','):
+                    row_index += 1
+                    if row_index <= skip_rows or len(row) == 0:
                         continue
-                    assert len(row) == 3
-                    wordnet_id, file_name, url = row
-                    buffered_wordnet_ids.append(wordnet_id)
-                    buffered_file_names.append(file_name)
-                    buffered_urls.append(url)
-                    if len(buffered_wordnet_ids) >= buffer_size:
-                        dao.insert_multiple(cursor, buffered_wordnet_ids, buffered_file_names, buffered_urls)
-                        buffered_wordnet_ids.clear()
-                        buffered_file_names.clear()
-                        buffered_urls.clear()
-                if len(buffered_wordnet_ids) > 0:
-                    dao.insert_multiple(cursor, buffered_wordnet_ids, buffered_file_names, buffered_urls)
-            dao.commit()
-        except Exception:
-            dao.rollback()
-            raise
+                    if len(row) != 3:
+                        progress.bad_rows += 1
+                    else:
+                        rows.append(row)
+                    if len(rows) >= batch_size:
+                        checkpoint.add_batch(csv_file, batch_index, row_index)
+                        put(('batch', csv_file, batch_index, rows))
+                        batch_index += 1
+                        rows = []
+            if len(rows) > 0 or batch_index == 0:
+                checkpoint.add_batch(csv_file, batch_index, row_index)
+                if len(rows) > 0:
+                    put(('batch', csv_file, batch_index, rows))
+                else:
+                    checkpoint.commit_batch(csv_file, batch_index)
+                batch_index += 1
+            checkpoint.set_read_all(csv_file, batch_index)
+        for _ in loaders:
+            put(None)
+        while num_running_loaders > 0:
+            result = result_queue.get()
+            if result[0] == 'exit':
+                num_running_loaders -= 1
+            else:
+                progress.handle(result)
+    finally:
+        for loader in loaders:
+            loader.join(timeout=None if num_running_loaders == 0 else 1)
+            if loader.is_alive():
+                loader.terminate()
+        progress.close()
+
+
+def db_restore_records_from_csv(db_config: dict, csv_file: str):
+    db_restore_records(db_config, [csv_file])
 
 
 import argparse
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser('Restore records from CSV file to mysql server')
-    parser.add_argument('csv_file', type=str, help='CSV file path')
+    parser = argparse.ArgumentParser('Restore records from CSV files to mysql server')
+    parser.add_argument('csv_files', type=str, nargs='+',
+                        help='CSV file paths (.csv or .csv.gz), or dump manifests standing for their part files')
+    parser.add_argument('--batch-size', type=int, default=5000, help='Rows per insert statement')
+    parser.add_argument('--commit-every', type=int, default=4, help='Batches per transaction of a loader')
+    parser.add_argument('--num-workers', type=int, default=4, help='Number of loader connections')
+    parser.add_argument('--checkpoint', type=str,
+                        help='Checkpoint file, restoring again with it skips the committed rows')
+    parser.add_argument('--load-data', action='store_true',
+                        help='Load whole files with LOAD DATA LOCAL INFILE, the server needs local_infile enabled')
     args = parser.parse_args()
 
     from db_utils._get_db_config import get_db_config
-    db_restore_records_from_csv(get_db_config(), args.csv_file)
+    db_restore_records(get_db_config(), args.csv_files, args.batch_size, args.commit_every, args.num_workers,
+                       args.checkpoint, args.load_data)
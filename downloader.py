@@ -6,61 +6,238 @@ import os
 import time
 import tqdm
 import json
-from impl.common import DownloaderState, PInterestImageResolution
+from impl.common import DownloaderState, DownloaderErrorKind, PInterestImageResolution
 from impl.pinterest import download_wordnet_id_search_result_from_pinterest
+from impl.pinterest_api import PinterestSearchApi
+from impl.web_driver import WebDriverSession
+from impl.http_fetcher import PooledImageFetcher
+from impl.manifest import CategoryManifest
+from impl.concurrency import AdaptiveConcurrencyController, get_dominant_error_kind, get_exception_error_kind
+from impl.scheduler import QueryYieldStats, YieldAwareScheduler
+from impl.db.factory import create_dao
+from impl.image_validation import ImageValidator
+from impl.lease import create_lease_manager
+from impl.perf_stat.function_call import FunctionCallPerfStat
+from impl.perf_stat.export import PerfStatExporter
+from impl.perf_stat.tracer import SpanTracer
+from contextlib import closing, nullcontext
 
-_thread_local_variables = threading.local()
-_fault_tolerance = 100
 
+class _DownloadWorkerContext:
+    def __init__(self, workspace_dir: str, db_config: dict, proxy_address: str, headless: bool,
+                 enable_io_perf_stat: bool, browser_max_categories: int, browser_max_memory_mb: int,
+                 http_upgrade_concurrency: int, engine: str, pipeline_options: dict, streaming_capture: bool,
+                 db_batch_size: int, background_writer_options: dict, storage_backend: str,
+                 enable_dedup: bool, lease_options: dict, trace_dir: str, driver_profile: str, discovery: str,
+                 api_base_url: str, scroll_pacing: str, validation_options: dict):
+        self.workspace_dir = workspace_dir
+        self.db_config = db_config
+        self.proxy_address = proxy_address
+        self.headless = headless
+        self.enable_io_perf_stat = enable_io_perf_stat
+        self.engine = engine
+        self.pipeline_options = pipeline_options
+        self.streaming_capture = streaming_capture
+        self.db_batch_size = db_batch_size
+        self.background_writer_options = background_writer_options
+        self.storage_backend = storage_backend
+        self.enable_dedup = enable_dedup
+        self.discovery = discovery
+        self.scroll_pacing = scroll_pacing
+        self.web_driver_session = WebDriverSession(proxy_address, headless, browser_max_categories,
+                                                   browser_max_memory_mb, profile=driver_profile)
+        self.image_fetcher = None
+        if http_upgrade_concurrency > 0:
+            self.image_fetcher = PooledImageFetcher(proxy_address, http_upgrade_concurrency)
+        self.image_validator = None
+        if validation_options is not None:
+            self.image_validator = ImageValidator(**validation_options)
+        self.search_api = None
+        if discovery == 'api':
+            self.search_api = PinterestSearchApi(api_base_url, proxy_address)
+        self.lease_manager = None
+        if lease_options is not None:
+            self.lease_manager = create_lease_manager(lease_options, db_config)
+        self.perf_stat = FunctionCallPerfStat(False) if enable_io_perf_stat else None
+        self.tracer = SpanTracer(trace_dir) if trace_dir is not None else None
+
+    def run(self, wordnet_id, search_name, target_number, target_resolution):
+        return download_wordnet_id_search_result_from_pinterest(
+            wordnet_id, search_name, self.workspace_dir, self.db_config, target_number, target_resolution,
+            self.proxy_address, self.headless, self.enable_io_perf_stat, web_driver_session=self.web_driver_session,
+            image_fetcher=self.image_fetcher, engine=self.engine, pipeline_options=self.pipeline_options,
+            streaming_capture=self.streaming_capture, db_batch_size=self.db_batch_size,
+            background_writer_options=self.background_writer_options, storage_backend=self.storage_backend,
+            enable_dedup=self.enable_dedup, lease_manager=self.lease_manager, perf_stat=self.perf_stat,
+            tracer=self.tracer, discovery=self.discovery, search_api=self.search_api,
+            scroll_pacing=self.scroll_pacing, image_validator=self.image_validator)
+
+    def _pop_error_counts(self):
+        counts = {}
+        for client in (self.image_fetcher, self.search_api):
+            if client is not None:
+                for error_kind, count in client.error_signals.pop().items():
+                    counts[error_kind] = counts.get(error_kind, 0) + count
+        return counts
+
+    def run_task(self, wordnet_id, search_name, target_number, target_resolution):
+        # returns the result, the perf stat collected since the last task and the error kind the task ran into
+        try:
+            result = self.run(wordnet_id, search_name, target_number, target_resolution)
+        finally:
+            error_counts = self._pop_error_counts()
+        error_kind = None
+        if result[0] in (DownloaderState.Fail, DownloaderState.Unfinished):
+            error_kind = get_dominant_error_kind(error_counts)
+        return result, self.perf_stat.pop_snapshot() if self.perf_stat is not None else None, error_kind
+
+    def close(self):
+        self.web_driver_session.close()
+        if self.image_fetcher is not None:
+            self.image_fetcher.close()
+        if self.search_api is not None:
+            self.search_api.close()
+        if self.image_validator is not None:
+            self.image_validator.close()
+        if self.lease_manager is not None:
+            self.lease_manager.close()
+
+
+def download_worker_entry(connection, worker_options: dict):
+    context = _DownloadWorkerContext(**worker_options)
+    try:
+        while True:
+            task = connection.recv()
+            if task is None:
+                break
+            connection.send(context.run_task(*task))
+    finally:
+        context.close()
+
+
+class _PersistentWorker:
+    def __init__(self, worker_options: dict):
+        self.worker_options = worker_options
+        self.process = None
+        self.connection = None
+
+    def _start(self):
+        parent_connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=download_worker_entry, args=(child_connection, self.worker_options))
+        self.process.start()
+        child_connection.close()
+        self.connection = parent_connection
+
+    def run_task(self, wordnet_id, search_name, target_number, target_resolution):
+        if self.process is None or not self.process.is_alive():
+            self._start()
+        try:
+            self.connection.send((wordnet_id, search_name, target_number, target_resolution))
+            return self.connection.recv()
+        except (EOFError, OSError):
+            self.process.join()
+            # the pipe of the dead worker, a new one comes with the respawn
+            self.connection.close()
+            self.connection = None
+            self.process = None
+            # the count was not observed
+            return (DownloaderState.Fail, None), None, DownloaderErrorKind.Crash
 
-def download_worker_entry(wordnet_id: str, search_name: str, workspace_dir: str, db_config: dict, target_number: int,
-                          target_resolution, proxy_address: str, headless: bool, enable_io_perf_stat: bool,
-                          shared_value: multiprocessing.Value):
-    state, count = download_wordnet_id_search_result_from_pinterest(
-        wordnet_id, search_name, workspace_dir, db_config, target_number, target_resolution, proxy_address, headless,
-        enable_io_perf_stat)
-    if state == DownloaderState.Skipped:
-        count = -1
-    elif state == DownloaderState.Fail:
-        count = 0
-    shared_value.value = count
+    def close(self):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+        self.process.join()
+        self.connection.close()
+        self.process = None
 
 
 class PInterestDownloader:
     def __init__(self, workspace_dir, enable_multiprocessing=True, proxy_address=None, headless=False,
-                 database_config: dict = None, enable_io_perf_stat: bool = False):
-        self.workspace_dir = workspace_dir
-        self.subprocess_state_value = multiprocessing.Value('i') if enable_multiprocessing else None
-        self.proxy_address = proxy_address
-        self.headless = headless
-        self.db_config = database_config
-        self.enable_io_perf_stat = enable_io_perf_stat
+                 database_config: dict = None, enable_io_perf_stat: bool = False, browser_max_categories: int = 50,
+                 browser_max_memory_mb: int = None, http_upgrade_concurrency: int = 0, engine: str = 'serial',
+                 pipeline_options: dict = None, streaming_capture: bool = False, db_batch_size: int = 64,
+                 background_writer_options: dict = None, storage_backend: str = 'files', enable_dedup: bool = False,
+                 lease_options: dict = None, trace_dir: str = None, driver_profile: str = 'default',
+                 discovery: str = 'browser', api_base_url: str = 'https://www.pinterest.com',
+                 scroll_pacing: str = 'fixed', validation_options: dict = None):
+        self.enable_multiprocessing = enable_multiprocessing
+        # merged stats of all workers
+        self.perf_stat = FunctionCallPerfStat(False) if enable_io_perf_stat else None
+        self.worker_options = {
+            'workspace_dir': workspace_dir,
+            'db_config': database_config,
+            'proxy_address': proxy_address,
+            'headless': headless,
+            'enable_io_perf_stat': enable_io_perf_stat,
+            'browser_max_categories': browser_max_categories,
+            'browser_max_memory_mb': browser_max_memory_mb,
+            'http_upgrade_concurrency': http_upgrade_concurrency,
+            'engine': engine,
+            'pipeline_options': pipeline_options,
+            'streaming_capture': streaming_capture,
+            'db_batch_size': db_batch_size,
+            'background_writer_options': background_writer_options,
+            'storage_backend': storage_backend,
+            'enable_dedup': enable_dedup,
+            'lease_options': lease_options,
+            'trace_dir': trace_dir,
+            'driver_profile': driver_profile,
+            'discovery': discovery,
+            'api_base_url': api_base_url,
+            'scroll_pacing': scroll_pacing,
+            'validation_options': validation_options
+        }
+        self._thread_local_workers = threading.local()
+        self._workers = []
+        self._workers_lock = threading.Lock()
 
-    def download(self, wordnet_id, search_name, target_number, target_resolution):
-        if self.subprocess_state_value:
-            p = multiprocessing.Process(target=download_worker_entry,
-                                        args=(wordnet_id, search_name, self.workspace_dir,self.db_config, target_number,
-                                              target_resolution, self.proxy_address, self.headless, self.enable_io_perf_stat,
-                                              self.subprocess_state_value))
-            p.start()
-            p.join()
-            if p.exitcode != 0:
-                return DownloaderState(DownloaderState.Fail), 0
-            downloaded_images = self.subprocess_state_value.value
-            if downloaded_images >= target_number:
-                return DownloaderState.Done
-            elif downloaded_images > 0:
-                return DownloaderState.Unfinished
-            elif downloaded_images == 0:
-                return DownloaderState.Fail
+    def _get_thread_worker(self):
+        if not hasattr(self._thread_local_workers, 'worker'):
+            if self.enable_multiprocessing:
+                worker = _PersistentWorker(self.worker_options)
             else:
-                return DownloaderState.Skipped
-        else:
-            state, _ = download_wordnet_id_search_result_from_pinterest(wordnet_id, search_name, self.workspace_dir,
-                                                                        self.db_config, target_number,
-                                                                        target_resolution, self.proxy_address,
-                                                                        self.headless, self.enable_io_perf_stat)
-            return state
+                worker = _DownloadWorkerContext(**self.worker_options)
+            with self._workers_lock:
+                self._workers.append(worker)
+            self._thread_local_workers.worker = worker
+        return self._thread_local_workers.worker
+
+    def download(self, wordnet_id, search_name, target_number, target_resolution):
+        # returns the state, the image count and the error kind of an unsuccessful download
+        result, perf_stat_snapshot, error_kind = self._get_thread_worker().run_task(wordnet_id, search_name,
+                                                                                    target_number, target_resolution)
+        if perf_stat_snapshot is not None:
+            self.perf_stat.merge_snapshot(perf_stat_snapshot)
+        return (*result, error_kind)
+
+    def close_surplus_worker(self, limit: int):
+        # called by the thread owning the worker after a task, an idle worker above the limit would keep its browser
+        if not hasattr(self._thread_local_workers, 'worker'):
+            return
+        worker = self._thread_local_workers.worker
+        with self._workers_lock:
+            if len(self._workers) <= limit:
+                return
+            self._workers.remove(worker)
+        del self._thread_local_workers.worker
+        worker.close()
+
+    def close(self):
+        with self._workers_lock:
+            for worker in self._workers:
+                worker.close()
+            self._workers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 def load_wordnet_ids(file_path: str):
@@ -93,22 +270,34 @@ def load_wordnet_lemmas(file_path: str):
     return wordnet_lemmas
 
 
-def _download_wordnet_lemma_on_pinterest(downloader, target_number, target_resolution, process_bar, wordnet_id, wordnet_lemmas):
+def _download_wordnet_lemma_on_pinterest(downloader, manifest, controller, scheduler, target_number, target_resolution, process_bar, wordnet_id, wordnet_lemmas):
+    downloader_state = DownloaderState.Fail
     for wordnet_lemma in wordnet_lemmas:
-        process_bar.set_description(f'Downloading: {wordnet_lemma}({wordnet_id})')
-        downloader_state = downloader.download(wordnet_id, wordnet_lemma, target_number, target_resolution)
-        if downloader_state != DownloaderState.Fail:
-            _thread_local_variables.fail_times = 0
-        else:
-            if hasattr(_thread_local_variables, 'fail_times'):
-                _thread_local_variables.fail_times += 1
-            else:
-                _thread_local_variables.fail_times = 1
-            if _thread_local_variables.fail_times >= _fault_tolerance:
-                time.sleep(200)
-                _thread_local_variables.fail_times = _fault_tolerance / 2
-        process_bar.update()
-        return downloader_state
+        entry = manifest.get(wordnet_id)
+        previous_count = entry['count'] if entry is not None else 0
+        controller.acquire()
+        downloader_state, count, error_kind = DownloaderState.Fail, previous_count, None
+        begin_time = time.perf_counter()
+        try:
+            process_bar.set_description(f'Downloading: {wordnet_lemma}({wordnet_id})')
+            downloader_state, count, error_kind = downloader.download(wordnet_id, wordnet_lemma, target_number,
+                                                                      target_resolution)
+        except Exception as e:
+            error_kind = get_exception_error_kind(e)
+            raise
+        finally:
+            num_new_images = max(count - previous_count, 0) if count is not None else 0
+            controller.release(downloader_state, num_new_images, error_kind)
+            downloader.close_surplus_worker(controller.limit)
+        elapsed_time = time.perf_counter() - begin_time
+        manifest.update(wordnet_id, downloader_state, count)
+        if downloader_state == DownloaderState.Skipped:
+            break
+        scheduler.yield_stats.record(wordnet_id, wordnet_lemma, num_new_images, elapsed_time)
+        if not scheduler.should_try_next_lemma(downloader_state, num_new_images, elapsed_time):
+            break
+    process_bar.update()
+    return downloader_state
 
 
 _get_pinterest_image_resolution_enum = {
@@ -124,7 +313,16 @@ _get_pinterest_image_resolution_enum = {
 
 def download(workspace_dir, desire_num_per_category: int, desire_resolution: str,
              enable_mysql: bool, enable_multiprocessing: bool = True, proxy_address: str = None, headless: bool = False,
-             num_threads: int = 0, slice_begin: int = None, slice_end: int = None, enable_io_perf_stat: bool = False):
+             num_threads: int = 0, slice_begin: int = None, slice_end: int = None, enable_io_perf_stat: bool = False,
+             browser_max_categories: int = 50, browser_max_memory_mb: int = None, http_upgrade_concurrency: int = 0,
+             engine: str = 'serial', pipeline_options: dict = None, streaming_capture: bool = False,
+             db_batch_size: int = 64, background_writer_options: dict = None, storage_backend: str = 'files',
+             enable_dedup: bool = False, ignore_manifest: bool = False, sqlite_path: str = None,
+             adaptive_concurrency: bool = False, min_threads: int = 1, min_query_yield: float = 10,
+             lease_options: dict = None, perf_stat_interval: float = 60, trace_dir: str = None,
+             driver_profile: str = 'default', discovery: str = 'browser',
+             api_base_url: str = 'https://www.pinterest.com', scroll_pacing: str = 'fixed',
+             validation_options: dict = None):
     wordnet_ids = load_wordnet_ids(os.path.join(os.path.dirname(__file__), 'imagenet21k_wordnet_ids.txt'))
     wordnet_lemmas = load_wordnet_lemmas(os.path.join(os.path.dirname(__file__), 'imagenet21k_wordnet_lemmas.txt'))
     assert len(wordnet_ids) == len(wordnet_lemmas)
@@ -139,21 +337,66 @@ def download(workspace_dir, desire_num_per_category: int, desire_resolution: str
         json_file_path = os.path.join(os.path.dirname(__file__), 'db_config.json')
         with open(json_file_path) as f:
             database_config = json.load(f)
+    elif sqlite_path is not None:
+        database_config = {'backend': 'sqlite', 'database': sqlite_path}
+        if not os.path.exists(sqlite_path):
+            dao = create_dao(database_config)
+            with dao:
+                with closing(dao.get_cursor()) as cursor:
+                    dao.create_table(cursor)
+    if database_config is not None and validation_options is not None:
+        dao = create_dao(database_config)
+        with dao:
+            with closing(dao.get_cursor()) as cursor:
+                if not dao.has_image_meta_columns(cursor):
+                    dao.add_image_meta_columns(cursor)
 
-    downloader = PInterestDownloader(workspace_dir, enable_multiprocessing, proxy_address, headless, database_config, enable_io_perf_stat)
+    downloader = PInterestDownloader(workspace_dir, enable_multiprocessing, proxy_address, headless, database_config,
+                                     enable_io_perf_stat, browser_max_categories, browser_max_memory_mb,
+                                     http_upgrade_concurrency, engine, pipeline_options, streaming_capture,
+                                     db_batch_size, background_writer_options, storage_backend, enable_dedup,
+                                     lease_options, trace_dir, driver_profile, discovery, api_base_url,
+                                     scroll_pacing, validation_options)
 
-    while True:
-        with tqdm.tqdm(total=len(wordnet_ids), ) as process_bar:
-            download_func = partial(_download_wordnet_lemma_on_pinterest, downloader, desire_num_per_category,
-                                    desire_resolution, process_bar)
-            if num_threads == 0:
-                states = [download_func(wordnet_id, wordnet_lemma)
-                          for wordnet_id, wordnet_lemma in zip(wordnet_ids, wordnet_lemmas)]
-            else:
-                with ThreadPool(num_threads) as pool:
-                    states = pool.starmap(download_func, zip(wordnet_ids, wordnet_lemmas))
-        if all([state == DownloaderState.Done or state == DownloaderState.Skipped for state in states]):
-            break
+    manifest = CategoryManifest(os.path.join(workspace_dir, '.manifest.jsonl'))
+    yield_stats = QueryYieldStats(os.path.join(workspace_dir, '.query_yield.json'))
+    scheduler = YieldAwareScheduler(manifest, yield_stats, desire_num_per_category, min_query_yield)
+    # the pool is sized to the maximum, the controller decides how many of its threads may run a category at once
+    controller = AdaptiveConcurrencyController(min(min_threads, max(num_threads, 1)), max(num_threads, 1),
+                                               adaptive_concurrency)
+    pool = ThreadPool(num_threads) if num_threads != 0 else None
+    perf_stat_exporter = None
+    if enable_io_perf_stat:
+        perf_stat_exporter = PerfStatExporter(downloader.perf_stat, workspace_dir, perf_stat_interval)
+    try:
+        with downloader, manifest, yield_stats, perf_stat_exporter if perf_stat_exporter is not None else nullcontext():
+            while True:
+                # finished categories are skipped without spawning a worker or scanning the category folder
+                tasks = [(wordnet_id, wordnet_lemma) for wordnet_id, wordnet_lemma in zip(wordnet_ids, wordnet_lemmas)
+                         if ignore_manifest or manifest.needs_download(wordnet_id, desire_num_per_category)]
+                ignore_manifest = False
+                if len(tasks) == 0:
+                    break
+                tasks = scheduler.order_tasks(tasks)
+                with tqdm.tqdm(total=len(tasks), ) as process_bar:
+                    download_func = partial(_download_wordnet_lemma_on_pinterest, downloader, manifest, controller,
+                                            scheduler, desire_num_per_category, desire_resolution, process_bar)
+                    if pool is None:
+                        states = [download_func(wordnet_id, wordnet_lemma) for wordnet_id, wordnet_lemma in tasks]
+                    else:
+                        # chunksize 1 keeps the scheduled order instead of handing out contiguous blocks
+                        states = pool.starmap(download_func, tasks, chunksize=1)
+                yield_stats.save()
+                if all([state == DownloaderState.Done or state == DownloaderState.Skipped for state in states]):
+                    break
+            # at the end of a run, not on open; safe while other runs append, it holds the journal lock
+            manifest.compact()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if downloader.perf_stat is not None:
+        print(downloader.perf_stat.get_summary_string('Perf stat'))
 
 
 import argparse
@@ -168,13 +411,104 @@ if __name__ == '__main__':
     parser.add_argument('--resolution', type=str, default='736x', choices=['orig', '736x', '564x', '474x', '236x',
                                                                            '170x', '75x75_RS'],
                         help='Select image resolution preference')
-    parser.add_argument('--num-threads', type=int, default=0, help='Number of concurrent threads')
+    parser.add_argument('--num-threads', type=int, default=0,
+                        help='Number of concurrent threads, the upper bound when --adaptive-concurrency is set')
+    parser.add_argument('--adaptive-concurrency', action='store_true',
+                        help='Adjust the number of running threads between --min-threads and --num-threads '
+                             'from success rate, throughput and host load')
+    parser.add_argument('--min-threads', type=int, default=1, help='Lower bound of adaptive concurrency')
+    parser.add_argument('--min-query-yield', type=float, default=10,
+                        help='Try the next synonym of a category when a query returns fewer new images per minute')
     parser.add_argument('--disable-multiprocessing', action='store_true', help='Disable multiprocessing')
     parser.add_argument('--proxy', type=str, help='Proxy address')
     parser.add_argument('--headless', action='store_true', help='Running chrome in headless mode')
     parser.add_argument('--use-mysql', action='store_true', help='Using MySQL to store meta data')
-    parser.add_argument('--io-perf-stat', action='store_true', help='Enable I/O related operation performance statistics')
+    parser.add_argument('--use-sqlite', type=str, metavar='PATH', help='Using a SQLite database file to store meta data')
+    parser.add_argument('--io-perf-stat', action='store_true',
+                        help='Enable I/O related operation performance statistics, exported to perf_stat.jsonl and '
+                             'perf_stat.prom in the workspace')
+    parser.add_argument('--perf-stat-interval', type=float, default=60,
+                        help='Interval (seconds) of the performance statistics export')
+    parser.add_argument('--browser-max-categories', type=int, default=50,
+                        help='Restart the browser after this number of categories')
+    parser.add_argument('--browser-max-memory', type=int, help='Restart the browser when its memory usage exceeds this value (MB)')
+    parser.add_argument('--http-upgrade', type=int, default=0, metavar='CONCURRENCY',
+                        help='Fetch higher resolution images with a pooled HTTP client of the given concurrency '
+                             'instead of the browser')
+    parser.add_argument('--engine', type=str, default='serial', choices=['serial', 'async'],
+                        help='serial: scroll, fetch and save in one loop; '
+                             'async: separate discovery, fetch and persist stages')
+    parser.add_argument('--fetch-concurrency', type=int, default=8, help='Concurrency of the async fetch stage')
+    parser.add_argument('--persist-concurrency', type=int, default=2, help='Concurrency of the async persist stage')
+    parser.add_argument('--pipeline-queue-size', type=int, default=64, help='Queue size between async stages')
+    parser.add_argument('--streaming-capture', action='store_true',
+                        help='Capture image responses with a selenium-wire response interceptor '
+                             'instead of polling driver.requests')
+    parser.add_argument('--db-batch-size', type=int, default=64,
+                        help='Number of meta data records committed to MySQL in one transaction')
+    parser.add_argument('--writer-threads', type=int, default=0,
+                        help='Write images with a background thread pool of the given size, 0 to write synchronously')
+    parser.add_argument('--writer-max-inflight', type=int, default=64,
+                        help='Maximum size of queued image writes (MB)')
+    parser.add_argument('--durability', type=str, default='none', choices=['none', 'file', 'batch'],
+                        help='fsync policy of the background writer')
+    parser.add_argument('--storage', type=str, default='files', choices=['files', 'shards'],
+                        help='files: one file per image, shards: images appended into large shard files')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Hardlink images whose content was already downloaded for another category')
+    parser.add_argument('--ignore-manifest', action='store_true',
+                        help='Visit every category in the first pass even if the manifest records it as finished')
+    parser.add_argument('--lease', type=str, default='file', choices=['file', 'db', 'coordinator'],
+                        help='Category exclusion between workers, file: lock file in the category folder, '
+                             'db: lease table in the meta data database, coordinator: lease coordinator service')
+    parser.add_argument('--coordinator', type=str, metavar='HOST:PORT', help='Address of the lease coordinator')
+    parser.add_argument('--lease-ttl', type=float, default=60,
+                        help='Lease expiry (seconds) when the holder stops sending heartbeats')
+    parser.add_argument('--trace-dir', type=str,
+                        help='Write per worker trace event files of the scrape loop phases and a per category phase '
+                             'summary to this folder')
+    parser.add_argument('--driver-profile', type=str, default='default', choices=['default', 'lean', 'no-images'],
+                        help='default: capture every request; lean: capture image host requests only, block fonts, '
+                             'videos and trackers, lean Chrome flags; no-images: lean, and the browser does not load '
+                             'images, thumbnails are found in the page and fetched over HTTP')
+    parser.add_argument('--discovery', type=str, default='browser', choices=['browser', 'api'],
+                        help='browser: scroll the search page in Chrome; api: page through the search JSON resource '
+                             'over HTTP without a browser')
+    parser.add_argument('--api-base-url', type=str, default='https://www.pinterest.com',
+                        help='Base URL of the search JSON resource used by --discovery api')
+    parser.add_argument('--scroll-pacing', type=str, default='fixed', choices=['fixed', 'event'],
+                        help='fixed: random sleeps after each scroll, give up after 100 idle iterations; '
+                             'event: wait for new pins, image loads or network idle after each scroll, and end a '
+                             'category once new pins stop arriving')
+    parser.add_argument('--validate-images', type=int, default=0, metavar='PROCESSES',
+                        help='Decode every downloaded image in a process pool of the given size before saving it, '
+                             'and store width, height, format and content hash with its meta data, 0 to disable')
+    parser.add_argument('--min-image-side', type=int, default=64,
+                        help='Reject validated images whose shorter side is below this size (pixels)')
     args = parser.parse_args()
+    pipeline_options = {'fetch_concurrency': args.fetch_concurrency, 'persist_concurrency': args.persist_concurrency,
+                        'queue_size': args.pipeline_queue_size}
+    background_writer_options = None
+    if args.writer_threads > 0:
+        background_writer_options = {'num_threads': args.writer_threads,
+                                     'max_inflight_bytes': args.writer_max_inflight * 1024 * 1024,
+                                     'durability': args.durability}
+    validation_options = None
+    if args.validate_images > 0:
+        validation_options = {'num_processes': args.validate_images, 'min_side': args.min_image_side}
+    lease_options = None
+    if args.lease != 'file':
+        if args.lease == 'coordinator' and args.coordinator is None:
+            parser.error('--lease coordinator requires --coordinator')
+        if args.lease == 'db' and not args.use_mysql and args.use_sqlite is None:
+            parser.error('--lease db requires --use-mysql or --use-sqlite')
+        lease_options = {'backend': args.lease, 'address': args.coordinator, 'ttl': args.lease_ttl}
     download(args.workspace_dir, args.number_per_category, args.resolution, args.use_mysql,
              not args.disable_multiprocessing, args.proxy, args.headless, args.num_threads,
-             args.slice_begin, args.slice_end, args.io_perf_stat)
+             args.slice_begin, args.slice_end, args.io_perf_stat, args.browser_max_categories, args.browser_max_memory,
+             args.http_upgrade, args.engine, pipeline_options, args.streaming_capture,
+             args.db_batch_size, background_writer_options, args.storage, args.dedup,
+             args.ignore_manifest, args.use_sqlite, args.adaptive_concurrency, args.min_threads,
+             args.min_query_yield, lease_options, args.perf_stat_interval,
+             args.trace_dir, args.driver_profile, args.discovery, args.api_base_url,
+             args.scroll_pacing, validation_options)
@@ -1,9 +1,14 @@
 import enum
+import hashlib
 
 
 _image_file_extensions = ('.jpg', '.jpeg', '.gif', '.webp', '.png')
 
 
+def compute_content_hash(content: bytes):
+    return hashlib.sha256(content).hexdigest()
+
+
 class PInterestImageResolution(enum.IntEnum):
     p_75x75_RS = enum.auto()
     p_170x = enum.auto()
@@ -19,3 +24,11 @@ class DownloaderState(enum.Enum):
     Unfinished = enum.auto()
     Fail = enum.auto()
     Skipped = enum.auto()
+
+
+class DownloaderErrorKind(enum.Enum):
+    Throttled = enum.auto()   # HTTP 429
+    Overloaded = enum.auto()  # HTTP 5xx
+    Timeout = enum.auto()
+    Crash = enum.auto()       # the worker process died
+    Error = enum.auto()
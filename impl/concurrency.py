@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+from .common import DownloaderState, DownloaderErrorKind
+try:
+    import psutil
+    _psutil_available = True
+except ImportError:
+    _psutil_available = False
+
+
+def _get_host_usage():
+    # returns (cpu percent, memory percent), memory percent is None when psutil is not installed
+    if _psutil_available:
+        return psutil.cpu_percent(interval=None), psutil.virtual_memory().percent
+    if hasattr(os, 'getloadavg'):
+        return os.getloadavg()[0] / os.cpu_count() * 100, None
+    return None, None
+
+
+class ErrorSignals:
+    # error responses seen by the http clients of a worker, popped after each task
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def record(self, error_kind: DownloaderErrorKind):
+        with self.lock:
+            self.counts[error_kind] = self.counts.get(error_kind, 0) + 1
+
+    def record_status(self, status_code: int):
+        if status_code == 429:
+            self.record(DownloaderErrorKind.Throttled)
+        elif 500 <= status_code < 600:
+            self.record(DownloaderErrorKind.Overloaded)
+
+    def pop(self):
+        with self.lock:
+            counts = self.counts
+            self.counts = {}
+        return counts
+
+
+def get_dominant_error_kind(counts: dict):
+    for error_kind in (DownloaderErrorKind.Throttled, DownloaderErrorKind.Overloaded, DownloaderErrorKind.Timeout):
+        if counts.get(error_kind, 0) > 0:
+            return error_kind
+    return None
+
+
+def get_exception_error_kind(exception: BaseException):
+    # selenium and requests name their timeouts *TimeoutException and *Timeout
+    if isinstance(exception, TimeoutError) or type(exception).__name__.endswith(('Timeout', 'TimeoutException')):
+        return DownloaderErrorKind.Timeout
+    return DownloaderErrorKind.Error
+
+
+class AdaptiveConcurrencyController:
+    def __init__(self, min_workers: int, max_workers: int, adaptive: bool = True, failure_tolerance: int = 20,
+                 backoff_time: float = 200, max_backoff_time: float = 1800, adjust_interval: float = 30,
+                 max_cpu_percent: float = 90, max_memory_percent: float = 90):
+        assert 1 <= min_workers <= max_workers
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.adaptive = adaptive
+        self.failure_tolerance = failure_tolerance
+        self.initial_backoff_time = backoff_time
+        self.backoff_time = backoff_time
+        self.max_backoff_time = max_backoff_time
+        self.adjust_interval = adjust_interval
+        self.max_cpu_percent = max_cpu_percent
+        self.max_memory_percent = max_memory_percent
+
+        self.limit = min_workers if adaptive else max_workers
+        self.active = 0
+        self.condition = threading.Condition()
+        self.backoff_until = 0
+        self.consecutive_failures = 0
+        self.window_completed = 0
+        self.window_failed = 0
+        self.window_images = 0
+        self.window_begin_time = time.monotonic()
+        self.last_decrease_time = None
+        self.last_throughput = None
+        if _psutil_available:
+            psutil.cpu_percent(interval=None)
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.backoff_until:
+                    self.condition.wait(self.backoff_until - now)
+                elif self.active >= self.limit:
+                    self.condition.wait()
+                else:
+                    break
+            self.active += 1
+
+    def release(self, state: DownloaderState, num_new_images: int, error_kind: DownloaderErrorKind = None):
+        # error_kind is what an unsuccessful task ran into, None if nothing was observed
+        with self.condition:
+            self.active -= 1
+            now = time.monotonic()
+            if state != DownloaderState.Skipped:
+                self.window_completed += 1
+                self.window_images += num_new_images
+                if state == DownloaderState.Fail:
+                    self.window_failed += 1
+                    self.consecutive_failures += 1
+                else:
+                    self.consecutive_failures = 0
+                    self.backoff_time = self.initial_backoff_time
+            if error_kind == DownloaderErrorKind.Throttled and self._can_decrease(now):
+                self._back_off(now, True)
+            elif error_kind == DownloaderErrorKind.Overloaded and self._can_decrease(now):
+                print('Concurrency: remote overloaded')
+                self._decrease(now)
+            elif self.consecutive_failures >= self.failure_tolerance:
+                # failures without an overload signal pause all workers, but the limit stays
+                self._back_off(now, False)
+            elif now - self.window_begin_time >= self.adjust_interval:
+                self._adjust(now)
+            self.condition.notify_all()
+
+    def _reset_window(self, now: float):
+        self.window_completed = 0
+        self.window_failed = 0
+        self.window_images = 0
+        self.window_begin_time = now
+
+    def _set_limit(self, limit: int):
+        limit = max(self.min_workers, min(self.max_workers, limit))
+        if limit != self.limit:
+            print(f'Concurrency: {self.limit} -> {limit}')
+            self.limit = limit
+
+    def _can_decrease(self, now: float):
+        # the tasks running when the signal came may all report it, the limit is halved once for them
+        return self.last_decrease_time is None or now - self.last_decrease_time >= self.adjust_interval
+
+    def _decrease(self, now: float):
+        self.last_decrease_time = now
+        if self.adaptive:
+            self._set_limit(self.limit // 2)
+        self.last_throughput = None
+        self._reset_window(now)
+
+    def _back_off(self, now: float, decrease: bool):
+        # shared by all workers: nobody starts a new category until the backoff ends
+        print(f'Concurrency: {"throttled" if decrease else f"{self.consecutive_failures} consecutive failures"}, '
+              f'backing off {self.backoff_time:.0f}s')
+        self.backoff_until = now + self.backoff_time
+        self.backoff_time = min(self.backoff_time * 2, self.max_backoff_time)
+        self.consecutive_failures = self.failure_tolerance // 2
+        if decrease:
+            self._decrease(now)
+        self.last_throughput = None
+        self._reset_window(self.backoff_until)
+
+    def _has_host_headroom(self):
+        cpu_percent, memory_percent = _get_host_usage()
+        if cpu_percent is not None and cpu_percent >= self.max_cpu_percent:
+            return False
+        if memory_percent is not None and memory_percent >= self.max_memory_percent:
+            return False
+        return True
+
+    def _adjust(self, now: float):
+        if self.window_completed == 0:
+            self._reset_window(now)
+            return
+        success_rate = 1 - self.window_failed / self.window_completed
+        throughput = self.window_images / (now - self.window_begin_time)
+        if self.adaptive:
+            if not self._has_host_headroom():
+                self._set_limit(self.limit - 1)
+            elif success_rate < 0.5:
+                # no overload signal, so more workers are not the cause, only a gentle step down
+                self._set_limit(self.limit - 1)
+            elif success_rate >= 0.9 and self.active >= self.limit - 1 and \
+                    (self.last_throughput is None or throughput >= self.last_throughput * 0.9):
+                self._set_limit(self.limit + 1)
+        self.last_throughput = throughput
+        self._reset_window(now)
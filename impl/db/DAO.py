@@ -1,6 +1,11 @@
 import mysql.connector
+from mysql.connector import errorcode
+import functools
+from contextlib import closing
+from .factory import get_dao_connection_config
 
 
+# schema version 1: wordnet id and file name concatenated into one wide unique key
 _create_table_sql_statement = '''
 CREATE TABLE `Records` (
     `id` INT NOT NULL AUTO_INCREMENT,
@@ -8,6 +13,10 @@ CREATE TABLE `Records` (
     `url` VARCHAR(768) NOT NULL,
     `create_time` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     `modify_time` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    `width` INT NULL,
+    `height` INT NULL,
+    `format` VARCHAR(16) NULL,
+    `content_hash` CHAR(64) NULL,
     PRIMARY KEY (`id`),
     UNIQUE KEY `unique_file_name` (`wordnet_id_and_file_name`)
 )
@@ -15,10 +24,100 @@ CREATE TABLE `Records` (
 _drop_table_sql_statement = 'DROP TABLE `Records`'
 _exists_file_sql_statement = 'SELECT EXISTS(SELECT * FROM `Records` WHERE `wordnet_id_and_file_name` = %s)'
 _new_record_sql_statement = 'INSERT INTO `Records` (`wordnet_id_and_file_name`, `url`) values (%s, %s)'
+_new_record_with_image_meta_sql_statement = 'INSERT INTO `Records` (`wordnet_id_and_file_name`, `url`, `width`, `height`, `format`, `content_hash`) values (%s, %s, %s, %s, %s, %s)'
+_has_image_meta_columns_sql_statement = "SELECT COUNT(*) FROM `information_schema`.`COLUMNS` WHERE `TABLE_SCHEMA` = DATABASE() AND `TABLE_NAME` = 'Records' AND `COLUMN_NAME` = 'content_hash'"
+# nullable columns appended at the end, an online (in place) change for InnoDB
+_add_image_meta_columns_sql_statement = 'ALTER TABLE `Records` ADD COLUMN `width` INT NULL, ADD COLUMN `height` INT NULL, ADD COLUMN `format` VARCHAR(16) NULL, ADD COLUMN `content_hash` CHAR(64) NULL'
 _count_all_sql_statement = 'SELECT COUNT(*) FROM `Records`'
 _count_by_wordnet_id_sql_statement = "SELECT COUNT(*) FROM `Records` WHERE `wordnet_id_and_file_name` LIKE %s"
-_select_all_sql_statement = 'SELECT * from `Records`'
-_select_id_file_url_sql_statement = 'SELECT `id`, `wordnet_id_and_file_name`, `url` from `Records`'
+_select_file_names_by_wordnet_id_sql_statement = "SELECT `wordnet_id_and_file_name` FROM `Records` WHERE `wordnet_id_and_file_name` LIKE %s"
+_select_id_file_url_sql_statement = 'SELECT `id`, LEFT(`wordnet_id_and_file_name`, 9), SUBSTRING(`wordnet_id_and_file_name`, 11), `url` from `Records`'
+_select_id_range_sql_statement = 'SELECT MIN(`id`), MAX(`id`) FROM `Records` WHERE `id` >= %s'
+_new_record_ignore_duplicate_sql_statement = 'INSERT IGNORE INTO `Records` (`wordnet_id_and_file_name`, `url`) values (%s, %s)'
+# rows of dump_db CSV files: wordnet id, file name, url; the connection needs allow_local_infile
+_load_data_local_infile_sql_statement = '''
+LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE `Records`
+CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' LINES TERMINATED BY %s
+(@wordnet_id, @file_name, `url`) SET `wordnet_id_and_file_name` = CONCAT(@wordnet_id, '-', @file_name)
+'''
+
+# schema version 2: a compact wordnet id column leading the composite unique key, per category counts maintained by
+# triggers, so counting a category is a primary key lookup. 758 characters keep every version 1 key within the
+# 3072 bytes InnoDB index limit.
+_create_table_v2_sql_statement = '''
+CREATE TABLE `{table}` (
+    `id` INT NOT NULL AUTO_INCREMENT,
+    `wordnet_id` CHAR(9) CHARACTER SET ascii NOT NULL,
+    `file_name` VARCHAR(758) NOT NULL,
+    `url` VARCHAR(768) NOT NULL,
+    `create_time` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    `modify_time` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    `width` INT NULL,
+    `height` INT NULL,
+    `format` VARCHAR(16) NULL,
+    `content_hash` CHAR(64) NULL,
+    PRIMARY KEY (`id`),
+    UNIQUE KEY `unique_file_name` (`wordnet_id`, `file_name`)
+)
+'''
+_create_category_counters_table_sql_statement = '''
+CREATE TABLE IF NOT EXISTS `CategoryCounters` (
+    `wordnet_id` CHAR(9) CHARACTER SET ascii NOT NULL,
+    `count` INT NOT NULL,
+    PRIMARY KEY (`wordnet_id`)
+)
+'''
+# records never move between categories, updates leave the counts as they are
+_create_counter_trigger_sql_statements = {
+    'count_records_insert': 'CREATE TRIGGER `count_records_insert` AFTER INSERT ON `{table}` FOR EACH ROW INSERT INTO `CategoryCounters` (`wordnet_id`, `count`) VALUES (NEW.`wordnet_id`, 1) ON DUPLICATE KEY UPDATE `count` = `count` + 1',
+    'count_records_delete': 'CREATE TRIGGER `count_records_delete` AFTER DELETE ON `{table}` FOR EACH ROW UPDATE `CategoryCounters` SET `count` = `count` - 1 WHERE `wordnet_id` = OLD.`wordnet_id`'
+}
+_drop_table_v2_sql_statements = ('DROP TABLE `Records`', 'DROP TABLE `CategoryCounters`')
+_exists_file_v2_sql_statement = 'SELECT EXISTS(SELECT * FROM `Records` WHERE `wordnet_id` = %s AND `file_name` = %s)'
+_new_record_v2_sql_statement = 'INSERT INTO `Records` (`wordnet_id`, `file_name`, `url`) values (%s, %s, %s)'
+_new_record_with_image_meta_v2_sql_statement = 'INSERT INTO `Records` (`wordnet_id`, `file_name`, `url`, `width`, `height`, `format`, `content_hash`) values (%s, %s, %s, %s, %s, %s, %s)'
+_count_by_wordnet_id_v2_sql_statement = 'SELECT `count` FROM `CategoryCounters` WHERE `wordnet_id` = %s'
+_select_file_names_by_wordnet_id_v2_sql_statement = 'SELECT `file_name` FROM `Records` WHERE `wordnet_id` = %s'
+_select_id_file_url_v2_sql_statement = 'SELECT `id`, `wordnet_id`, `file_name`, `url` from `Records`'
+_new_record_ignore_duplicate_v2_sql_statement = 'INSERT IGNORE INTO `Records` (`wordnet_id`, `file_name`, `url`) values (%s, %s, %s)'
+_load_data_local_infile_v2_sql_statement = '''
+LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE `Records`
+CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' LINES TERMINATED BY %s
+(`wordnet_id`, `file_name`, `url`)
+'''
+_get_records_key_columns_sql_statement = "SELECT `COLUMN_NAME` FROM `information_schema`.`COLUMNS` WHERE `TABLE_SCHEMA` = DATABASE() AND `TABLE_NAME` = 'Records' AND `COLUMN_NAME` IN ('wordnet_id', 'wordnet_id_and_file_name')"
+
+# online migration from version 1: writes to the version 1 table are mirrored by triggers into `Records_v2` while
+# existing rows are copied over in id ranges, then both tables are swapped in one atomic rename. Ids are kept, so
+# dump_db offsets stay valid.
+_get_trigger_names_sql_statement = 'SELECT `TRIGGER_NAME` FROM `information_schema`.`TRIGGERS` WHERE `TRIGGER_SCHEMA` = DATABASE()'
+_get_table_names_sql_statement = 'SELECT `TABLE_NAME` FROM `information_schema`.`TABLES` WHERE `TABLE_SCHEMA` = DATABASE()'
+_v2_columns = '`id`, `wordnet_id`, `file_name`, `url`, `create_time`, `modify_time`, `width`, `height`, `format`, `content_hash`'
+_v1_to_v2_values = '{row}`id`, LEFT({row}`wordnet_id_and_file_name`, 9), SUBSTRING({row}`wordnet_id_and_file_name`, 11), {row}`url`, {row}`create_time`, {row}`modify_time`, {row}`width`, {row}`height`, {row}`format`, {row}`content_hash`'
+_create_mirror_trigger_sql_statements = {
+    'mirror_records_insert': f'CREATE TRIGGER `mirror_records_insert` AFTER INSERT ON `Records` FOR EACH ROW REPLACE INTO `Records_v2` ({_v2_columns}) VALUES ({_v1_to_v2_values.format(row="NEW.")})',
+    'mirror_records_update': f'CREATE TRIGGER `mirror_records_update` AFTER UPDATE ON `Records` FOR EACH ROW REPLACE INTO `Records_v2` ({_v2_columns}) VALUES ({_v1_to_v2_values.format(row="NEW.")})',
+    'mirror_records_delete': 'CREATE TRIGGER `mirror_records_delete` AFTER DELETE ON `Records` FOR EACH ROW DELETE IGNORE FROM `Records_v2` WHERE `id` = OLD.`id`'
+}
+_copy_records_to_v2_sql_statement = f'INSERT IGNORE INTO `Records_v2` ({_v2_columns}) SELECT {_v1_to_v2_values.format(row="")} FROM `Records` WHERE `id` >= %s AND `id` <= %s'
+_swap_records_tables_sql_statement = 'RENAME TABLE `Records` TO `Records_v1`, `Records_v2` TO `Records`'
+_drop_mirror_trigger_sql_statement = 'DROP TRIGGER IF EXISTS `{trigger}`'
+_drop_records_v1_table_sql_statement = 'DROP TABLE `Records_v1`'
+
+_create_lease_table_sql_statement = '''
+CREATE TABLE IF NOT EXISTS `Leases` (
+    `name` VARCHAR(64) NOT NULL,
+    `owner` VARCHAR(128) NOT NULL,
+    `expire_time` DOUBLE NOT NULL,
+    PRIMARY KEY (`name`)
+)
+'''
+# lease expiry is judged by the database clock, so the clocks of worker machines do not matter
+_now_sql_expression = 'UNIX_TIMESTAMP(NOW(6))'
+_take_over_lease_sql_statement = f'UPDATE `Leases` SET `owner` = %s, `expire_time` = {_now_sql_expression} + %s WHERE `name` = %s AND (`owner` = %s OR `expire_time` < {_now_sql_expression})'
+_new_lease_sql_statement = f'INSERT INTO `Leases` (`name`, `owner`, `expire_time`) VALUES (%s, %s, {_now_sql_expression} + %s)'
+_renew_lease_sql_statement = f'UPDATE `Leases` SET `expire_time` = {_now_sql_expression} + %s WHERE `name` = %s AND `owner` = %s'
+_release_lease_sql_statement = 'DELETE FROM `Leases` WHERE `name` = %s AND `owner` = %s'
 
 
 def _concatenate_wordnet_id_file_name(wordnet_id, file_name):
@@ -26,12 +125,50 @@ def _concatenate_wordnet_id_file_name(wordnet_id, file_name):
     return wordnet_id + '-' + file_name
 
 
+# what statements in the other layout fail with, after the migration swapped the tables under an open connection
+_schema_change_errnos = (errorcode.ER_BAD_FIELD_ERROR, errorcode.ER_NO_SUCH_TABLE)
+
+
+def _retry_on_schema_change(function):
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return function(self, *args, **kwargs)
+        except mysql.connector.Error as e:
+            if e.errno not in _schema_change_errnos or self.connection_config.get('schema_version') is not None:
+                raise
+            schema_version = self.schema_version
+            self._detect_schema_version()
+            if self.schema_version == schema_version:
+                raise
+            return function(self, *args, **kwargs)
+    return wrapper
+
+
+def _get_image_meta_values(image_meta):
+    if image_meta is None:
+        return None, None, None, None
+    return image_meta.width, image_meta.height, image_meta.format, image_meta.content_hash
+
+
 class PInterestCrawlerDAO:
+    # works on both schema versions, connection_config['schema_version'] forces one, otherwise it is detected on
+    # connecting, version 2 for a database without the table, and again when a statement fails on the other layout
     def __init__(self, connection_config: dict):
         self.connection_config = connection_config
+        self.schema_version = None
 
     def __enter__(self):
-        self.ctx = mysql.connector.connect(**self.connection_config)
+        self.ctx = mysql.connector.connect(**get_dao_connection_config(self.connection_config))
+        self.schema_version = self.connection_config.get('schema_version')
+        if self.schema_version is None:
+            self._detect_schema_version()
+
+    def _detect_schema_version(self):
+        with closing(self.ctx.cursor(buffered=True)) as cursor:
+            cursor.execute(_get_records_key_columns_sql_statement)
+            key_columns = [column for column, in cursor.fetchall()]
+        self.schema_version = 1 if 'wordnet_id_and_file_name' in key_columns else 2
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.ctx.close()
@@ -39,27 +176,80 @@ class PInterestCrawlerDAO:
     def get_cursor(self, buffered=False):
         return self.ctx.cursor(buffered=buffered)
 
+    def get_schema_version(self):
+        return self.schema_version
+
+    @_retry_on_schema_change
     def exists(self, cursor, wordnet_id: str, file_name: str):
-        cursor.execute(_exists_file_sql_statement, (_concatenate_wordnet_id_file_name(wordnet_id, file_name), ))
+        if self.schema_version == 2:
+            cursor.execute(_exists_file_v2_sql_statement, (wordnet_id, file_name))
+        else:
+            cursor.execute(_exists_file_sql_statement, (_concatenate_wordnet_id_file_name(wordnet_id, file_name), ))
         result = cursor.fetchone()[0]
         return result == 1
 
-    def insert_and_commit(self, cursor, wordnet_id: str, file_name: str, url: str):
+    def insert_and_commit(self, cursor, wordnet_id: str, file_name: str, url: str, image_meta=None):
+        try:
+            self.insert(cursor, wordnet_id, file_name, url, image_meta)
+            self.ctx.commit()
+            return True, None, None
+        except mysql.connector.Error as e:
+            self.ctx.rollback()
+            return False, e.errno, str(e)
+
+    def insert_multiple_and_commit(self, cursor, wordnet_ids: list, file_names: list, urls: list,
+                                   image_metas: list = None):
         try:
-            self.insert(cursor, wordnet_id, file_name, url)
+            self.insert_multiple(cursor, wordnet_ids, file_names, urls, image_metas)
             self.ctx.commit()
             return True, None, None
         except mysql.connector.Error as e:
             self.ctx.rollback()
             return False, e.errno, str(e)
 
-    def insert(self, cursor, wordnet_id: str, file_name: str, url: str):
-        cursor.execute(_new_record_sql_statement, (_concatenate_wordnet_id_file_name(wordnet_id, file_name), url))
+    def _get_keys(self, wordnet_ids: list, file_names: list):
+        if self.schema_version == 2:
+            for wordnet_id in wordnet_ids:
+                assert len(wordnet_id) == 9
+            return list(zip(wordnet_ids, file_names))
+        return [(_concatenate_wordnet_id_file_name(wordnet_id, file_name), ) for wordnet_id, file_name in zip(wordnet_ids, file_names)]
+
+    @_retry_on_schema_change
+    def insert(self, cursor, wordnet_id: str, file_name: str, url: str, image_meta=None):
+        key, = self._get_keys([wordnet_id], [file_name])
+        if image_meta is None:
+            cursor.execute(_new_record_v2_sql_statement if self.schema_version == 2 else _new_record_sql_statement,
+                           (*key, url))
+        else:
+            cursor.execute(_new_record_with_image_meta_v2_sql_statement if self.schema_version == 2 else _new_record_with_image_meta_sql_statement,
+                           (*key, url, *_get_image_meta_values(image_meta)))
+
+    @_retry_on_schema_change
+    def insert_multiple(self, cursor, wordnet_ids: list, file_names: list, urls: list, image_metas: list = None):
+        assert len(wordnet_ids) == len(file_names) == len(urls)
+        keys = self._get_keys(wordnet_ids, file_names)
+        if image_metas is None:
+            cursor.executemany(_new_record_v2_sql_statement if self.schema_version == 2 else _new_record_sql_statement,
+                               [(*key, url) for key, url in zip(keys, urls)])
+        else:
+            assert len(image_metas) == len(urls)
+            cursor.executemany(_new_record_with_image_meta_v2_sql_statement if self.schema_version == 2 else _new_record_with_image_meta_sql_statement,
+                               [(*key, url, *_get_image_meta_values(image_meta)) for key, url, image_meta in zip(keys, urls, image_metas)])
 
-    def insert_multiple(self, cursor, wordnet_ids: list, file_names: list, urls: list):
+    @_retry_on_schema_change
+    def insert_multiple_ignore_duplicates(self, cursor, wordnet_ids: list, file_names: list, urls: list):
+        # returns the number of inserted rows
         assert len(wordnet_ids) == len(file_names) == len(urls)
-        wordnet_ids_and_file_names = [_concatenate_wordnet_id_file_name(wordnet_id, file_name) for wordnet_id, file_name in zip(wordnet_ids, file_names)]
-        cursor.executemany(_new_record_sql_statement, zip(wordnet_ids_and_file_names, urls))
+        keys = self._get_keys(wordnet_ids, file_names)
+        cursor.executemany(_new_record_ignore_duplicate_v2_sql_statement if self.schema_version == 2 else _new_record_ignore_duplicate_sql_statement,
+                           [(*key, url) for key, url in zip(keys, urls)])
+        return cursor.rowcount
+
+    @_retry_on_schema_change
+    def load_data_local_infile(self, cursor, csv_file_path: str, line_terminator: str = '\r\n'):
+        cursor.execute(_load_data_local_infile_v2_sql_statement if self.schema_version == 2 else _load_data_local_infile_sql_statement,
+                       (csv_file_path, line_terminator))
+        return cursor.rowcount
 
     def commit(self):
         self.ctx.commit()
@@ -68,32 +258,129 @@ class PInterestCrawlerDAO:
         self.ctx.rollback()
 
     def create_table(self, cursor):
-        cursor.execute(_create_table_sql_statement)
+        if self.schema_version == 2:
+            cursor.execute(_create_table_v2_sql_statement.format(table='Records'))
+            cursor.execute(_create_category_counters_table_sql_statement)
+            for statement in _create_counter_trigger_sql_statements.values():
+                cursor.execute(statement.format(table='Records'))
+        else:
+            cursor.execute(_create_table_sql_statement)
 
     def drop_table(self, cursor):
-        cursor.execute(_drop_table_sql_statement)
+        if self.schema_version == 2:
+            for statement in _drop_table_v2_sql_statements:
+                cursor.execute(statement)
+        else:
+            cursor.execute(_drop_table_sql_statement)
 
     def count_all(self, cursor):
         cursor.execute(_count_all_sql_statement)
         return cursor.fetchone()[0]
 
+    @_retry_on_schema_change
     def count_by_wordnet_id(self, cursor, wordnet_id):
+        if self.schema_version == 2:
+            cursor.execute(_count_by_wordnet_id_v2_sql_statement, (wordnet_id,))
+            row = cursor.fetchone()
+            return row[0] if row is not None else 0
         cursor.execute(_count_by_wordnet_id_sql_statement, (wordnet_id + '%',))
         return cursor.fetchone()[0]
 
+    @_retry_on_schema_change
+    def get_file_names_by_wordnet_id(self, cursor, wordnet_id):
+        if self.schema_version == 2:
+            cursor.execute(_select_file_names_by_wordnet_id_v2_sql_statement, (wordnet_id,))
+            return [file_name for file_name, in cursor.fetchall()]
+        cursor.execute(_select_file_names_by_wordnet_id_sql_statement, (wordnet_id + '%',))
+        return [wordnet_id_and_file_name[len(wordnet_id) + 1:] for wordnet_id_and_file_name, in cursor.fetchall()]
+
     def get_iterator(self, cursor):
-        cursor.execute(_select_id_file_url_sql_statement)
-        return cursor
+        # rows of (id, wordnet_id, file_name, url) in both schema versions
+        return self.get_iterator_with_id_limits(cursor)
 
+    @_retry_on_schema_change
     def get_iterator_with_id_limits(self, cursor, id_min: int=None, id_max: int=None):
+        select_sql_statement = _select_id_file_url_v2_sql_statement if self.schema_version == 2 else _select_id_file_url_sql_statement
         if id_min is None and id_max is None:
-            cursor.execute(_select_id_file_url_sql_statement)
+            cursor.execute(select_sql_statement)
         elif id_min is not None and id_max is not None:
-            cursor.execute(_select_id_file_url_sql_statement + ' WHERE `id` >= %s AND `id` <= %s', (id_min, id_max))
+            cursor.execute(select_sql_statement + ' WHERE `id` >= %s AND `id` <= %s', (id_min, id_max))
         elif id_min is not None:
-            cursor.execute(_select_id_file_url_sql_statement + ' WHERE `id` >= %s', (id_min,))
+            cursor.execute(select_sql_statement + ' WHERE `id` >= %s', (id_min,))
         elif id_max is not None:
-            cursor.execute(_select_id_file_url_sql_statement + ' WHERE `id` <= %s', (id_max,))
+            cursor.execute(select_sql_statement + ' WHERE `id` <= %s', (id_max,))
         else:
             raise Exception
         return cursor
+
+    def has_image_meta_columns(self, cursor):
+        cursor.execute(_has_image_meta_columns_sql_statement)
+        return cursor.fetchone()[0] == 1
+
+    def add_image_meta_columns(self, cursor):
+        cursor.execute(_add_image_meta_columns_sql_statement)
+
+    def get_id_range(self, cursor, id_min: int = 0):
+        # (None, None) if there is no record from id_min on
+        cursor.execute(_select_id_range_sql_statement, (id_min,))
+        return cursor.fetchone()
+
+    def begin_schema_v2_migration(self, cursor):
+        # idempotent, an interrupted migration is begun again; returns whether records have to be copied
+        assert self.schema_version == 1
+        if not self.has_image_meta_columns(cursor):
+            self.add_image_meta_columns(cursor)
+        cursor.execute(_get_table_names_sql_statement)
+        if 'Records_v2' not in [table_name for table_name, in cursor.fetchall()]:
+            cursor.execute(_create_table_v2_sql_statement.format(table='Records_v2'))
+        cursor.execute(_create_category_counters_table_sql_statement)
+        cursor.execute(_get_trigger_names_sql_statement)
+        trigger_names = [trigger_name for trigger_name, in cursor.fetchall()]
+        # counting first, every row reaching the new table is counted
+        for trigger_name, statement in _create_counter_trigger_sql_statements.items():
+            if trigger_name not in trigger_names:
+                cursor.execute(statement.format(table='Records_v2'))
+        for trigger_name, statement in _create_mirror_trigger_sql_statements.items():
+            if trigger_name not in trigger_names:
+                cursor.execute(statement)
+        self.ctx.commit()
+        return True
+
+    def copy_records_to_schema_v2(self, cursor, id_min: int, id_max: int):
+        # rows mirrored by the triggers already are skipped
+        cursor.execute(_copy_records_to_v2_sql_statement, (id_min, id_max))
+        self.ctx.commit()
+        return cursor.rowcount
+
+    def finish_schema_v2_migration(self, cursor):
+        # connections opened afterwards detect version 2, the version 1 table is kept as `Records_v1`
+        cursor.execute(_swap_records_tables_sql_statement)
+        for trigger_name in _create_mirror_trigger_sql_statements.keys():
+            cursor.execute(_drop_mirror_trigger_sql_statement.format(trigger=trigger_name))
+        self.schema_version = 2
+
+    def drop_schema_v1_table(self, cursor):
+        cursor.execute(_drop_records_v1_table_sql_statement)
+
+    def create_lease_table(self, cursor):
+        cursor.execute(_create_lease_table_sql_statement)
+
+    def try_acquire_lease(self, cursor, name: str, owner: str, ttl: float):
+        try:
+            cursor.execute(_take_over_lease_sql_statement, (owner, ttl, name, owner))
+            if cursor.rowcount == 0:
+                cursor.execute(_new_lease_sql_statement, (name, owner, ttl))
+            self.ctx.commit()
+            return True
+        except mysql.connector.IntegrityError:
+            self.ctx.rollback()
+            return False
+
+    def renew_lease(self, cursor, name: str, owner: str, ttl: float):
+        cursor.execute(_renew_lease_sql_statement, (ttl, name, owner))
+        self.ctx.commit()
+        return cursor.rowcount == 1
+
+    def release_lease(self, cursor, name: str, owner: str):
+        cursor.execute(_release_lease_sql_statement, (name, owner))
+        self.ctx.commit()
@@ -0,0 +1,281 @@
+import sqlite3
+
+
+_create_table_sql_statements = (
+    '''
+    CREATE TABLE `Records` (
+        `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+        `wordnet_id` TEXT NOT NULL,
+        `file_name` TEXT NOT NULL,
+        `url` TEXT NOT NULL,
+        `create_time` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        `modify_time` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        `width` INTEGER NULL,
+        `height` INTEGER NULL,
+        `format` TEXT NULL,
+        `content_hash` TEXT NULL
+    )
+    ''',
+    'CREATE UNIQUE INDEX `unique_file_name` ON `Records` (`wordnet_id`, `file_name`)',
+    '''
+    CREATE TRIGGER `update_modify_time` AFTER UPDATE ON `Records` FOR EACH ROW BEGIN
+        UPDATE `Records` SET `modify_time` = CURRENT_TIMESTAMP WHERE `id` = OLD.`id`;
+    END
+    '''
+)
+_drop_table_sql_statement = 'DROP TABLE `Records`'
+_exists_file_sql_statement = 'SELECT EXISTS(SELECT * FROM `Records` WHERE `wordnet_id` = ? AND `file_name` = ?)'
+_new_record_sql_statement = 'INSERT INTO `Records` (`wordnet_id`, `file_name`, `url`) values (?, ?, ?)'
+_new_record_with_image_meta_sql_statement = 'INSERT INTO `Records` (`wordnet_id`, `file_name`, `url`, `width`, `height`, `format`, `content_hash`) values (?, ?, ?, ?, ?, ?, ?)'
+_get_columns_sql_statement = 'PRAGMA table_info(`Records`)'
+_add_image_meta_columns_sql_statements = (
+    'ALTER TABLE `Records` ADD COLUMN `width` INTEGER NULL',
+    'ALTER TABLE `Records` ADD COLUMN `height` INTEGER NULL',
+    'ALTER TABLE `Records` ADD COLUMN `format` TEXT NULL',
+    'ALTER TABLE `Records` ADD COLUMN `content_hash` TEXT NULL'
+)
+_count_all_sql_statement = 'SELECT COUNT(*) FROM `Records`'
+_count_by_wordnet_id_sql_statement = 'SELECT COUNT(*) FROM `Records` WHERE `wordnet_id` = ?'
+_select_file_names_by_wordnet_id_sql_statement = 'SELECT `file_name` FROM `Records` WHERE `wordnet_id` = ?'
+_select_id_file_url_sql_statement = 'SELECT `id`, `wordnet_id`, `file_name`, `url` from `Records`'
+_select_id_range_sql_statement = 'SELECT MIN(`id`), MAX(`id`) FROM `Records` WHERE `id` >= ?'
+_new_record_ignore_duplicate_sql_statement = 'INSERT OR IGNORE INTO `Records` (`wordnet_id`, `file_name`, `url`) values (?, ?, ?)'
+
+# the columns are split already, schema version 2 adds the per category counters maintained by triggers
+_create_category_counters_sql_statements = (
+    '''
+    CREATE TABLE IF NOT EXISTS `CategoryCounters` (
+        `wordnet_id` TEXT PRIMARY KEY,
+        `count` INTEGER NOT NULL
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS `count_records_insert` AFTER INSERT ON `Records` FOR EACH ROW BEGIN
+        INSERT INTO `CategoryCounters` (`wordnet_id`, `count`) VALUES (NEW.`wordnet_id`, 1)
+            ON CONFLICT (`wordnet_id`) DO UPDATE SET `count` = `count` + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS `count_records_delete` AFTER DELETE ON `Records` FOR EACH ROW BEGIN
+        UPDATE `CategoryCounters` SET `count` = `count` - 1 WHERE `wordnet_id` = OLD.`wordnet_id`;
+    END
+    '''
+)
+_fill_category_counters_sql_statement = 'INSERT OR REPLACE INTO `CategoryCounters` (`wordnet_id`, `count`) SELECT `wordnet_id`, COUNT(*) FROM `Records` GROUP BY `wordnet_id`'
+_drop_category_counters_sql_statement = 'DROP TABLE `CategoryCounters`'
+_count_by_wordnet_id_v2_sql_statement = 'SELECT `count` FROM `CategoryCounters` WHERE `wordnet_id` = ?'
+_get_table_names_sql_statement = "SELECT `name` FROM `sqlite_master` WHERE `type` = 'table'"
+
+_create_lease_table_sql_statement = '''
+CREATE TABLE IF NOT EXISTS `Leases` (
+    `name` TEXT PRIMARY KEY,
+    `owner` TEXT NOT NULL,
+    `expire_time` REAL NOT NULL
+)
+'''
+_now_sql_expression = "((julianday('now') - 2440587.5) * 86400.0)"
+_take_over_lease_sql_statement = f'UPDATE `Leases` SET `owner` = ?, `expire_time` = {_now_sql_expression} + ? WHERE `name` = ? AND (`owner` = ? OR `expire_time` < {_now_sql_expression})'
+_new_lease_sql_statement = f'INSERT INTO `Leases` (`name`, `owner`, `expire_time`) VALUES (?, ?, {_now_sql_expression} + ?)'
+_renew_lease_sql_statement = f'UPDATE `Leases` SET `expire_time` = {_now_sql_expression} + ? WHERE `name` = ? AND `owner` = ?'
+_release_lease_sql_statement = 'DELETE FROM `Leases` WHERE `name` = ? AND `owner` = ?'
+
+# same error number as MySQL ER_DUP_ENTRY, so callers can handle both backends alike
+_duplicate_entry_errno = 1062
+
+
+def _get_image_meta_values(image_meta):
+    if image_meta is None:
+        return None, None, None, None
+    return image_meta.width, image_meta.height, image_meta.format, image_meta.content_hash
+
+
+def _is_duplicate_entry_error(error: sqlite3.Error):
+    # NOT NULL and CHECK violations are integrity errors too, only unique keys mean a duplicate
+    if not isinstance(error, sqlite3.IntegrityError):
+        return False
+    error_name = getattr(error, 'sqlite_errorname', None)
+    if error_name is not None:
+        return error_name in ('SQLITE_CONSTRAINT_UNIQUE', 'SQLITE_CONSTRAINT_PRIMARYKEY')
+    return str(error).startswith('UNIQUE constraint failed')
+
+
+def _get_errno(error: sqlite3.Error):
+    if _is_duplicate_entry_error(error):
+        return _duplicate_entry_errno
+    return getattr(error, 'sqlite_errorcode', None)
+
+
+class PInterestCrawlerSQLiteDAO:
+    def __init__(self, connection_config: dict):
+        self.connection_config = connection_config
+        self.schema_version = None
+
+    def __enter__(self):
+        self.ctx = sqlite3.connect(self.connection_config['database'],
+                                   timeout=self.connection_config.get('timeout', 60),
+                                   cached_statements=256, check_same_thread=False)
+        # WAL lets several writer processes on one host share the file with readers never blocked
+        self.ctx.execute('PRAGMA journal_mode=WAL')
+        self.ctx.execute('PRAGMA synchronous=NORMAL')
+        self.schema_version = self.connection_config.get('schema_version')
+        if self.schema_version is None:
+            table_names = [table_name for table_name, in self.ctx.execute(_get_table_names_sql_statement)]
+            self.schema_version = 1 if 'Records' in table_names and 'CategoryCounters' not in table_names else 2
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.ctx.close()
+
+    def get_cursor(self, buffered=False):
+        return self.ctx.cursor()
+
+    def get_schema_version(self):
+        return self.schema_version
+
+    def exists(self, cursor, wordnet_id: str, file_name: str):
+        cursor.execute(_exists_file_sql_statement, (wordnet_id, file_name))
+        result = cursor.fetchone()[0]
+        return result == 1
+
+    def insert_and_commit(self, cursor, wordnet_id: str, file_name: str, url: str, image_meta=None):
+        try:
+            self.insert(cursor, wordnet_id, file_name, url, image_meta)
+            self.ctx.commit()
+            return True, None, None
+        except sqlite3.Error as e:
+            self.ctx.rollback()
+            return False, _get_errno(e), str(e)
+
+    def insert_multiple_and_commit(self, cursor, wordnet_ids: list, file_names: list, urls: list,
+                                   image_metas: list = None):
+        try:
+            self.insert_multiple(cursor, wordnet_ids, file_names, urls, image_metas)
+            self.ctx.commit()
+            return True, None, None
+        except sqlite3.Error as e:
+            self.ctx.rollback()
+            return False, _get_errno(e), str(e)
+
+    def insert(self, cursor, wordnet_id: str, file_name: str, url: str, image_meta=None):
+        assert len(wordnet_id) == 9
+        if image_meta is None:
+            cursor.execute(_new_record_sql_statement, (wordnet_id, file_name, url))
+        else:
+            cursor.execute(_new_record_with_image_meta_sql_statement,
+                           (wordnet_id, file_name, url, *_get_image_meta_values(image_meta)))
+
+    def insert_multiple(self, cursor, wordnet_ids: list, file_names: list, urls: list, image_metas: list = None):
+        assert len(wordnet_ids) == len(file_names) == len(urls)
+        if image_metas is None:
+            cursor.executemany(_new_record_sql_statement, zip(wordnet_ids, file_names, urls))
+        else:
+            assert len(image_metas) == len(urls)
+            cursor.executemany(_new_record_with_image_meta_sql_statement,
+                               [(wordnet_id, file_name, url, *_get_image_meta_values(image_meta)) for wordnet_id, file_name, url, image_meta in zip(wordnet_ids, file_names, urls, image_metas)])
+
+    def insert_multiple_ignore_duplicates(self, cursor, wordnet_ids: list, file_names: list, urls: list):
+        assert len(wordnet_ids) == len(file_names) == len(urls)
+        cursor.executemany(_new_record_ignore_duplicate_sql_statement, zip(wordnet_ids, file_names, urls))
+        return cursor.rowcount
+
+    def commit(self):
+        self.ctx.commit()
+
+    def rollback(self):
+        self.ctx.rollback()
+
+    def create_table(self, cursor):
+        for statement in _create_table_sql_statements:
+            cursor.execute(statement)
+        if self.schema_version == 2:
+            for statement in _create_category_counters_sql_statements:
+                cursor.execute(statement)
+
+    def drop_table(self, cursor):
+        cursor.execute(_drop_table_sql_statement)
+        if self.schema_version == 2:
+            cursor.execute(_drop_category_counters_sql_statement)
+
+    def count_all(self, cursor):
+        cursor.execute(_count_all_sql_statement)
+        return cursor.fetchone()[0]
+
+    def count_by_wordnet_id(self, cursor, wordnet_id):
+        if self.schema_version == 2:
+            cursor.execute(_count_by_wordnet_id_v2_sql_statement, (wordnet_id,))
+            row = cursor.fetchone()
+            return row[0] if row is not None else 0
+        cursor.execute(_count_by_wordnet_id_sql_statement, (wordnet_id,))
+        return cursor.fetchone()[0]
+
+    def get_file_names_by_wordnet_id(self, cursor, wordnet_id):
+        cursor.execute(_select_file_names_by_wordnet_id_sql_statement, (wordnet_id,))
+        return [file_name for file_name, in cursor.fetchall()]
+
+    def get_iterator(self, cursor):
+        # rows of (id, wordnet_id, file_name, url)
+        return self.get_iterator_with_id_limits(cursor)
+
+    def get_iterator_with_id_limits(self, cursor, id_min: int=None, id_max: int=None):
+        if id_min is None and id_max is None:
+            cursor.execute(_select_id_file_url_sql_statement)
+        elif id_min is not None and id_max is not None:
+            cursor.execute(_select_id_file_url_sql_statement + ' WHERE `id` >= ? AND `id` <= ?', (id_min, id_max))
+        elif id_min is not None:
+            cursor.execute(_select_id_file_url_sql_statement + ' WHERE `id` >= ?', (id_min,))
+        elif id_max is not None:
+            cursor.execute(_select_id_file_url_sql_statement + ' WHERE `id` <= ?', (id_max,))
+        else:
+            raise Exception
+        return cursor
+
+    def get_id_range(self, cursor, id_min: int = 0):
+        cursor.execute(_select_id_range_sql_statement, (id_min,))
+        return cursor.fetchone()
+
+    def has_image_meta_columns(self, cursor):
+        cursor.execute(_get_columns_sql_statement)
+        return any(column[1] == 'content_hash' for column in cursor.fetchall())
+
+    def add_image_meta_columns(self, cursor):
+        for statement in _add_image_meta_columns_sql_statements:
+            cursor.execute(statement)
+        self.ctx.commit()
+
+    def begin_schema_v2_migration(self, cursor):
+        # the write lock is held from the triggers to the filled counters, nothing is left to copy
+        assert self.schema_version == 1
+        cursor.execute('BEGIN IMMEDIATE')
+        for statement in _create_category_counters_sql_statements:
+            cursor.execute(statement)
+        cursor.execute(_fill_category_counters_sql_statement)
+        self.ctx.commit()
+        return False
+
+    def finish_schema_v2_migration(self, cursor):
+        self.schema_version = 2
+
+    def create_lease_table(self, cursor):
+        cursor.execute(_create_lease_table_sql_statement)
+        self.ctx.commit()
+
+    def try_acquire_lease(self, cursor, name: str, owner: str, ttl: float):
+        try:
+            cursor.execute(_take_over_lease_sql_statement, (owner, ttl, name, owner))
+            if cursor.rowcount == 0:
+                cursor.execute(_new_lease_sql_statement, (name, owner, ttl))
+            self.ctx.commit()
+            return True
+        except sqlite3.IntegrityError as e:
+            self.ctx.rollback()
+            if not _is_duplicate_entry_error(e):
+                raise
+            return False
+
+    def renew_lease(self, cursor, name: str, owner: str, ttl: float):
+        cursor.execute(_renew_lease_sql_statement, (ttl, name, owner))
+        self.ctx.commit()
+        return cursor.rowcount == 1
+
+    def release_lease(self, cursor, name: str, owner: str):
+        cursor.execute(_release_lease_sql_statement, (name, owner))
+        self.ctx.commit()
@@ -0,0 +1,16 @@
+def create_dao(db_config: dict):
+    backend = db_config.get('backend', 'mysql')
+    if backend == 'sqlite':
+        from .SQLiteDAO import PInterestCrawlerSQLiteDAO
+        return PInterestCrawlerSQLiteDAO(db_config)
+    assert backend == 'mysql'
+    try:
+        from .DAO import PInterestCrawlerDAO
+    except ImportError:
+        raise RuntimeError('Install mysql-connector-python')
+    return PInterestCrawlerDAO(db_config)
+
+
+def get_dao_connection_config(db_config: dict):
+    # strips the keys consumed by create_dao and the DAOs
+    return {key: value for key, value in db_config.items() if key not in ('backend', 'schema_version')}
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import threading
+from .perf_stat.function_call import record_running_time
+
+_create_content_hashes_table_sql_statement = '''
+CREATE TABLE IF NOT EXISTS `ContentHashes` (
+    `content_hash` TEXT NOT NULL PRIMARY KEY,
+    `wordnet_id` TEXT NOT NULL,
+    `file_name` TEXT NOT NULL
+)
+'''
+_create_duplicates_table_sql_statement = '''
+CREATE TABLE IF NOT EXISTS `Duplicates` (
+    `wordnet_id` TEXT NOT NULL,
+    `file_name` TEXT NOT NULL,
+    `content_hash` TEXT NOT NULL,
+    `source_wordnet_id` TEXT NOT NULL,
+    `source_file_name` TEXT NOT NULL,
+    `size` INTEGER NOT NULL,
+    PRIMARY KEY (`wordnet_id`, `file_name`)
+)
+'''
+_lookup_sql_statement = 'SELECT `wordnet_id`, `file_name` FROM `ContentHashes` WHERE `content_hash` = ?'
+_register_sql_statement = 'INSERT OR IGNORE INTO `ContentHashes` (`content_hash`, `wordnet_id`, `file_name`) VALUES (?, ?, ?)'
+_replace_sql_statement = 'INSERT OR REPLACE INTO `ContentHashes` (`content_hash`, `wordnet_id`, `file_name`) VALUES (?, ?, ?)'
+_record_duplicate_sql_statement = 'INSERT OR REPLACE INTO `Duplicates` (`wordnet_id`, `file_name`, `content_hash`, ' \
+                                  '`source_wordnet_id`, `source_file_name`, `size`) VALUES (?, ?, ?, ?, ?, ?)'
+_duplicates_summary_sql_statement = 'SELECT COUNT(*), COALESCE(SUM(`size`), 0) FROM `Duplicates` ' \
+                                    'WHERE `wordnet_id` != `source_wordnet_id`'
+_duplicated_category_pairs_sql_statement = 'SELECT `source_wordnet_id`, `wordnet_id`, COUNT(*) AS `n` FROM `Duplicates` ' \
+                                           'WHERE `wordnet_id` != `source_wordnet_id` ' \
+                                           'GROUP BY `source_wordnet_id`, `wordnet_id` ORDER BY `n` DESC LIMIT ?'
+
+
+def get_content_hash_index_path(workspace_dir: str):
+    return os.path.join(workspace_dir, '.content_hashes.sqlite')
+
+
+class ContentHashIndex:
+    def __init__(self, db_path: str, timeout: float = 60):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def __enter__(self):
+        # autocommit, shared by the worker processes of one host through WAL
+        self.connection = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(_create_content_hashes_table_sql_statement)
+        self.connection.execute(_create_duplicates_table_sql_statement)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.connection.close()
+        self.connection = None
+
+    @record_running_time
+    def lookup(self, content_hash: str):
+        with self.lock:
+            return self.connection.execute(_lookup_sql_statement, (content_hash,)).fetchone()
+
+    @record_running_time
+    def register(self, content_hash: str, wordnet_id: str, file_name: str, replace: bool = False):
+        with self.lock:
+            self.connection.execute(_replace_sql_statement if replace else _register_sql_statement,
+                                    (content_hash, wordnet_id, file_name))
+
+    @record_running_time
+    def record_duplicate(self, wordnet_id: str, file_name: str, content_hash: str, source_wordnet_id: str,
+                         source_file_name: str, size: int):
+        with self.lock:
+            self.connection.execute(_record_duplicate_sql_statement, (wordnet_id, file_name, content_hash,
+                                                                      source_wordnet_id, source_file_name, size))
+
+    def get_report(self, max_category_pairs: int = 20):
+        with self.lock:
+            num_duplicates, duplicated_bytes = self.connection.execute(_duplicates_summary_sql_statement).fetchone()
+            category_pairs = self.connection.execute(_duplicated_category_pairs_sql_statement,
+                                                     (max_category_pairs,)).fetchall()
+        return num_duplicates, duplicated_bytes, category_pairs
@@ -0,0 +1,117 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .common import DownloaderErrorKind
+from .concurrency import ErrorSignals
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    _requests_available = True
+except ImportError:
+    _requests_available = False
+
+
+_default_user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) ' \
+                      'Chrome/92.0.4515.107 Safari/537.36'
+
+
+class FetchedResponse:
+    def __init__(self, status_code: int, headers: dict, body: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+
+class FetchedRequest:
+    # mimics the parts of seleniumwire.request.Request used by pinterest._parse_request
+    def __init__(self, url: str, response: FetchedResponse):
+        self.url = url
+        self.response = response
+
+
+def create_http_session(proxy_address: str = None, pool_size: int = 8):
+    if not _requests_available:
+        raise RuntimeError('Install requests')
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = _default_user_agent
+    if proxy_address is not None:
+        session.proxies = {'http': proxy_address, 'https': proxy_address}
+    return session
+
+
+class PooledImageFetcher:
+    def __init__(self, proxy_address: str = None, max_concurrency: int = 8, timeout: float = 30):
+        self.max_concurrency = max_concurrency
+        self.session = create_http_session(proxy_address, max_concurrency)
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_concurrency)
+        self.completed = queue.SimpleQueue()
+        self.num_pending = 0
+        self.condition = threading.Condition()
+        self.error_signals = ErrorSignals()
+
+    def fetch(self, url: str):
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            fetched_response = FetchedResponse(response.status_code,
+                                               {'Content-Type': response.headers.get('Content-Type')},
+                                               response.content)
+            self.error_signals.record_status(response.status_code)
+        except requests.Timeout:
+            self.error_signals.record(DownloaderErrorKind.Timeout)
+            fetched_response = None
+        except requests.RequestException:
+            fetched_response = None
+        except Exception as e:
+            # anything else fails this url only, like a network error
+            print(f'Failed to fetch {url}: {e}')
+            fetched_response = None
+        return FetchedRequest(url, fetched_response)
+
+    def _fetch(self, url: str):
+        fetched_request = FetchedRequest(url, None)
+        try:
+            fetched_request = self.fetch(url)
+        finally:
+            # waiters must always see the url completed, even if it failed
+            self.completed.put(fetched_request)
+            with self.condition:
+                self.num_pending -= 1
+                self.condition.notify_all()
+
+    def submit(self, urls):
+        for url in urls:
+            with self.condition:
+                self.num_pending += 1
+            self.executor.submit(self._fetch, url)
+
+    def has_pending(self):
+        with self.condition:
+            return self.num_pending > 0
+
+    def get_num_pending(self):
+        with self.condition:
+            return self.num_pending
+
+    def wait(self, timeout: float = None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.num_pending == 0, timeout)
+
+    def get_completed(self):
+        completed = []
+        while True:
+            try:
+                completed.append(self.completed.get_nowait())
+            except queue.Empty:
+                return completed
+
+    def reset(self):
+        self.wait()
+        self.get_completed()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,97 @@
+import io
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from .common import compute_content_hash
+try:
+    from PIL import Image
+    _pillow_available = True
+except ImportError:
+    _pillow_available = False
+
+
+class ImageMeta:
+    __slots__ = ('width', 'height', 'format', 'content_hash')
+
+    def __init__(self, width: int, height: int, format_: str, content_hash: str):
+        self.width = width
+        self.height = height
+        self.format = format_
+        self.content_hash = content_hash
+
+
+def inspect_image(content: bytes, min_side: int):
+    # runs in the pool processes, returns (meta, None) or (None, reason)
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            # decodes every pixel, truncated or corrupt data raises
+            image.load()
+            width, height, format_ = image.width, image.height, image.format
+    except Exception as e:
+        return None, f'undecodable ({e})'
+    if min(width, height) < min_side:
+        return None, f'too small ({width}x{height})'
+    return ImageMeta(width, height, format_, compute_content_hash(content)), None
+
+
+class ImageValidator:
+    # decodes downloaded images in a process pool, off the GIL and off the scrape loop; only images that decode
+    # and are at least min_side pixels on their shorter side are saved
+    def __init__(self, num_processes: int = 2, min_side: int = 64):
+        if not _pillow_available:
+            raise RuntimeError('Install Pillow')
+        self.executor = ProcessPoolExecutor(num_processes)
+        self.min_side = min_side
+        self.pending = {}
+        self.rejected_file_names = set()
+        self.num_rejected = 0
+
+    def inspect(self, content: bytes):
+        # returns the pool future of (meta, None) or (None, reason), for callers doing their own bookkeeping
+        return self.executor.submit(inspect_image, content, self.min_side)
+
+    def submit(self, downloaded_images):
+        for image_file_name, image_content, image_url in downloaded_images:
+            # the same image may be captured again before its check completes
+            if image_file_name in self.pending or image_file_name in self.rejected_file_names:
+                continue
+            self.pending[image_file_name] = (image_content, image_url,
+                                             self.executor.submit(inspect_image, image_content, self.min_side))
+
+    def has_pending(self):
+        return len(self.pending) > 0
+
+    def get_num_pending(self):
+        return len(self.pending)
+
+    def wait(self, timeout: float = None):
+        wait([future for _, _, future in self.pending.values()], timeout, FIRST_COMPLETED)
+
+    def reject(self, image_file_name: str, reason: str):
+        self.rejected_file_names.add(image_file_name)
+        self.num_rejected += 1
+        print(f'Rejected {image_file_name}: {reason}')
+
+    def get_completed(self, wait_all: bool = False):
+        # returns the accepted images as (image_file_name, image_content, image_url, image_meta)
+        if wait_all:
+            wait([future for _, _, future in self.pending.values()])
+        accepted = []
+        for image_file_name, (image_content, image_url, future) in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[image_file_name]
+            image_meta, reason = future.result()
+            if image_meta is None:
+                self.reject(image_file_name, reason)
+            else:
+                accepted.append((image_file_name, image_content, image_url, image_meta))
+        return accepted
+
+    def reset(self):
+        for _, _, future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.rejected_file_names.clear()
+
+    def close(self):
+        self.reset()
+        self.executor.shutdown(wait=True)
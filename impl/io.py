@@ -1,69 +1,225 @@
 import os
-try:
-    from .operators.database import DatabaseOperators
-    from .db.DAO import PInterestCrawlerDAO
-    _db_available = True
-except ImportError:
-    _db_available = False
+import queue
+from functools import partial
+from .operators.database import DatabaseOperators
+from .db.factory import create_dao
 from .operators.file_system import FileSystemOperators
+from .operators.shard_storage import ShardStorageOperators
+from .operators.background_writer import BackgroundFileWriter
+from .dedup import ContentHashIndex, get_content_hash_index_path
+from .common import compute_content_hash
+from .lease import LeaseManager
+from .image_validation import ImageMeta, ImageValidator
 
 
 class DownloaderIOOps:
-    def __init__(self, wordnet_id: str, workspace_dir: str, db_config: dict, file_lock_expired_time: int):
+    def __init__(self, wordnet_id: str, workspace_dir: str, db_config: dict, file_lock_expired_time: int,
+                 db_batch_size: int = 64, background_writer_options: dict = None, storage_backend: str = 'files',
+                 enable_dedup: bool = False, lease_manager: LeaseManager = None,
+                 image_validator: ImageValidator = None):
         folder = os.path.join(workspace_dir, wordnet_id)
-        if not os.path.exists(folder):
-            os.mkdir(folder)
+        os.makedirs(folder, exist_ok=True)
         self.folder = folder
+        self.workspace_dir = workspace_dir
         self.wordnet_id = wordnet_id
-        if not _db_available and db_config is not None:
-            raise RuntimeError('Install mysql-connector-python')
         self.db_dao = None
         if db_config is not None:
-            self.db_dao = PInterestCrawlerDAO(db_config)
-            self.db_ops = DatabaseOperators(self.db_dao, self.wordnet_id)
-        self.fs_ops = FileSystemOperators(folder)
+            self.db_dao = create_dao(db_config)
+            self.db_ops = DatabaseOperators(self.db_dao, self.wordnet_id, db_batch_size)
+        if storage_backend == 'shards':
+            self.fs_ops = ShardStorageOperators(folder)
+        else:
+            assert storage_backend == 'files'
+            self.fs_ops = FileSystemOperators(folder)
         self.file_lock_expired_time = file_lock_expired_time
+        # with a lease manager, exclusion goes through leases instead of the .lock file in the category folder
+        self.lease_manager = lease_manager
+        self.lease = None
         self.locked = False
+        self.known_file_names = None
+        self.background_writer_options = background_writer_options
+        self.background_writer = None
+        # with the background writer, meta rows wait here until their file is written
+        self.pending_metas = {}
+        self.write_results = queue.SimpleQueue()
+        self.finished_writes = {}
+        # shared by the categories of a worker, not owned
+        self.image_validator = image_validator
+        self.content_hash_index = None
+        if enable_dedup:
+            if storage_backend != 'files':
+                raise RuntimeError('Content hash deduplication requires the files storage backend')
+            self.content_hash_index = ContentHashIndex(get_content_hash_index_path(workspace_dir))
 
     def try_lock(self):
-        self.locked = self.fs_ops.try_lock(self.file_lock_expired_time)
+        if self.lease_manager is not None:
+            self.lease = self.lease_manager.create_lease(self.wordnet_id)
+            self.locked = self.lease.acquire()
+        else:
+            self.locked = self.fs_ops.try_lock(self.file_lock_expired_time)
         return self.locked
 
     def release_lock(self):
         if self.locked:
-            self.fs_ops.release_lock()
+            if self.lease is not None:
+                self.fs_ops.close()
+                self.lease.release()
+                self.lease = None
+            else:
+                self.fs_ops.release_lock()
             self.locked = False
 
+    def is_lock_valid(self):
+        return self.lease is None or self.lease.is_valid()
+
     def __enter__(self):
         if not self.locked:
-            assert self.fs_ops.try_lock(self.file_lock_expired_time)
+            assert self.try_lock()
         if self.db_dao is not None:
             self.db_dao.__enter__()
             self.db_ops.__enter__()
+        self.known_file_names = set(self._list_files())
+        if self.content_hash_index is not None:
+            self.content_hash_index.__enter__()
+        if self.background_writer_options is not None:
+            self.background_writer = BackgroundFileWriter(self.fs_ops, **self.background_writer_options)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.db_dao is not None:
-            self.db_ops.__exit__(exc_type, exc_val, exc_tb)
-            self.db_dao.__exit__(exc_type, exc_val, exc_tb)
-        self.fs_ops.release_lock()
+        try:
+            if self.background_writer is not None:
+                # all queued writes must land before the lock is released
+                try:
+                    self.background_writer.close()
+                finally:
+                    self._store_written_metas()
+        finally:
+            self.background_writer = None
+            self.pending_metas.clear()
+            self.finished_writes.clear()
+            self.known_file_names = None
+            if self.image_validator is not None:
+                self.image_validator.reset()
+            if self.content_hash_index is not None:
+                self.content_hash_index.__exit__(exc_type, exc_val, exc_tb)
+            try:
+                if self.db_dao is not None:
+                    self.db_ops.__exit__(exc_type, exc_val, exc_tb)
+                    self.db_dao.__exit__(exc_type, exc_val, exc_tb)
+            finally:
+                self.release_lock()
 
-    def has_file(self, image_file_name: str):
+    def _list_files(self):
         if self.db_dao is not None:
-            return self.db_ops.has_file(image_file_name)
+            return self.db_ops.list_files()
         else:
-            return self.fs_ops.has_file(image_file_name)
+            return self.fs_ops.list_files()
+
+    def has_file(self, image_file_name: str):
+        return image_file_name in self.known_file_names
 
     def count(self):
-        if self.db_dao is not None:
-            return self.db_ops.count()
+        return len(self.known_file_names)
+
+    def reconcile(self):
+        # re-sync the in-memory index with the backend, returns the number of files known by the backend
+        if self.background_writer is not None:
+            try:
+                self.background_writer.flush()
+            finally:
+                self._store_written_metas()
+        self.known_file_names = set(self._list_files())
+        return len(self.known_file_names)
+
+    def _try_link_duplicate(self, image_file_name: str, content: bytes, content_hash: str):
+        source = self.content_hash_index.lookup(content_hash)
+        if source is None:
+            return False, False
+        source_wordnet_id, source_file_name = source
+        if source_wordnet_id == self.wordnet_id and source_file_name == image_file_name:
+            return False, False
+        source_path = os.path.join(self.workspace_dir, source_wordnet_id, source_file_name)
+        if not self.fs_ops.link_file(source_path, image_file_name):
+            # the registered copy is gone or not linkable, the new copy replaces it
+            return False, True
+        self.content_hash_index.record_duplicate(self.wordnet_id, image_file_name, content_hash, source_wordnet_id,
+                                                 source_file_name, len(content))
+        return True, False
+
+    def _register_content_hash(self, content_hash: str, replace: bool, image_file_name: str, _content: bytes = None):
+        self.content_hash_index.register(content_hash, self.wordnet_id, image_file_name, replace)
+
+    def save(self, image_file_name: str, content: bytes, image_meta: ImageMeta = None):
+        on_done = None
+        if self.content_hash_index is not None:
+            content_hash = image_meta.content_hash if image_meta is not None else compute_content_hash(content)
+            linked, replace = self._try_link_duplicate(image_file_name, content, content_hash)
+            if linked:
+                if self.db_dao is None:
+                    self.known_file_names.add(image_file_name)
+                if self.background_writer is not None:
+                    self.finished_writes[image_file_name] = True
+                return
+            # registered only once the bytes are on disk, so other categories never link to a pending write
+            on_done = partial(self._register_content_hash, content_hash, replace)
+
+        if self.background_writer is not None:
+            self.background_writer.save(image_file_name, content, partial(self._on_written, on_done),
+                                        self._on_write_failed)
         else:
-            return self.fs_ops.count()
+            self.fs_ops.save(image_file_name, content)
+            if on_done is not None:
+                on_done(image_file_name)
+        if self.db_dao is None:
+            self.known_file_names.add(image_file_name)
+
+    def _on_written(self, on_done, image_file_name: str, content: bytes):
+        # runs in the writer threads, the file is written even if on_done fails
+        try:
+            if on_done is not None:
+                on_done(image_file_name, content)
+        finally:
+            self.write_results.put((image_file_name, True))
+
+    def _on_write_failed(self, image_file_name: str):
+        self.write_results.put((image_file_name, False))
 
-    def save(self, image_file_name: str, content: bytes):
-        self.fs_ops.save(image_file_name, content)
+    def _store_written_metas(self):
+        # a meta row is stored only once its file is written, and synced under the file and batch durability policies;
+        # the row of a failed write is dropped. A failed write or a process crash never leaves a row pointing to a
+        # missing file, a power loss does not either unless the durability policy is none
+        while True:
+            try:
+                image_file_name, written = self.write_results.get_nowait()
+            except queue.Empty:
+                break
+            self.finished_writes[image_file_name] = written
+        for image_file_name in [image_file_name for image_file_name in self.pending_metas
+                                if image_file_name in self.finished_writes]:
+            image_url, image_meta = self.pending_metas.pop(image_file_name)
+            if self.finished_writes.pop(image_file_name):
+                self._store_meta(image_file_name, image_url, image_meta)
+            else:
+                self.known_file_names.discard(image_file_name)
+
+    def save_meta(self, image_file_name: str, image_url: str, image_meta: ImageMeta = None):
+        if self.background_writer is not None:
+            self.pending_metas[image_file_name] = (image_url, image_meta)
+            if self.db_dao is not None:
+                self.known_file_names.add(image_file_name)
+            self._store_written_metas()
+        else:
+            self._store_meta(image_file_name, image_url, image_meta)
+
+    def flush_aged_metas(self):
+        # stores the rows of files written since the last save and the database batch once it is old enough
+        if self.background_writer is not None:
+            self._store_written_metas()
+        if self.db_dao is not None:
+            self.db_ops.flush_aged()
 
-    def save_meta(self, image_file_name: str, image_url: str):
+    def _store_meta(self, image_file_name: str, image_url: str, image_meta: ImageMeta = None):
         if self.db_dao is not None:
-            self.db_ops.save_meta(image_file_name, image_url)
+            self.db_ops.save_meta(image_file_name, image_url, image_meta)
+            self.known_file_names.add(image_file_name)
         else:
-            self.fs_ops.save_meta(image_file_name, image_url)
+            self.fs_ops.save_meta(image_file_name, image_url, image_meta)
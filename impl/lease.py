@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import uuid
+import socket
+import socketserver
+import threading
+from contextlib import closing
+from .db.factory import create_dao
+
+# A lease grants one worker exclusive access to a category for ttl seconds. The holder renews it from a heartbeat
+# thread every ttl / 3 seconds, a dead worker stops renewing and its categories are reclaimed after at most ttl
+# seconds, or immediately with the coordinator, which drops the leases of a connection once it is closed.
+
+
+def get_lease_owner_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class DatabaseLeaseBackend:
+    def __init__(self, db_config: dict):
+        self.dao = create_dao(db_config)
+        self.lock = threading.Lock()
+        self.opened = False
+
+    def _open(self):
+        if self.opened:
+            return
+        self.dao.__enter__()
+        self.opened = True
+        with closing(self.dao.get_cursor()) as cursor:
+            self.dao.create_lease_table(cursor)
+
+    def acquire(self, name: str, owner: str, ttl: float):
+        with self.lock:
+            self._open()
+            with closing(self.dao.get_cursor()) as cursor:
+                return self.dao.try_acquire_lease(cursor, name, owner, ttl)
+
+    def renew(self, name: str, owner: str, ttl: float):
+        with self.lock:
+            self._open()
+            with closing(self.dao.get_cursor()) as cursor:
+                return self.dao.renew_lease(cursor, name, owner, ttl)
+
+    def release(self, name: str, owner: str):
+        with self.lock:
+            self._open()
+            with closing(self.dao.get_cursor()) as cursor:
+                self.dao.release_lease(cursor, name, owner)
+
+    def close(self):
+        with self.lock:
+            if self.opened:
+                self.dao.__exit__(None, None, None)
+                self.opened = False
+
+
+class CoordinatorLeaseBackend:
+    def __init__(self, address: str, timeout: float = 30):
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.socket = None
+        self.file = None
+
+    def _connect(self):
+        self.socket = socket.create_connection(self.address, self.timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.socket.makefile('rwb')
+
+    def _disconnect(self):
+        if self.socket is not None:
+            try:
+                self.file.close()
+                self.socket.close()
+            except OSError:
+                pass
+        self.socket = None
+        self.file = None
+
+    def _call(self, request: dict):
+        with self.lock:
+            for retry in range(2):
+                try:
+                    if self.socket is None:
+                        self._connect()
+                    self.file.write(json.dumps(request).encode('utf-8') + b'\n')
+                    self.file.flush()
+                    response = self.file.readline()
+                    if len(response) == 0:
+                        raise ConnectionError('Lease coordinator closed the connection')
+                    return json.loads(response)['ok']
+                except OSError:
+                    # leases held through the broken connection are gone, renewals will report them lost
+                    self._disconnect()
+                    if retry == 1:
+                        raise
+
+    def acquire(self, name: str, owner: str, ttl: float):
+        return self._call({'op': 'acquire', 'name': name, 'owner': owner, 'ttl': ttl})
+
+    def renew(self, name: str, owner: str, ttl: float):
+        return self._call({'op': 'renew', 'name': name, 'owner': owner, 'ttl': ttl})
+
+    def release(self, name: str, owner: str):
+        self._call({'op': 'release', 'name': name, 'owner': owner})
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+
+class CategoryLease:
+    def __init__(self, backend, name: str, owner: str, ttl: float):
+        self.backend = backend
+        self.name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.lost = False
+        self.stop_event = None
+        self.heartbeat_thread = None
+
+    def acquire(self):
+        if not self.backend.acquire(self.name, self.owner, self.ttl):
+            return False
+        self.lost = False
+        self.stop_event = threading.Event()
+        self.heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self.heartbeat_thread.start()
+        return True
+
+    def _heartbeat(self):
+        last_renew_time = time.monotonic()
+        while not self.stop_event.wait(self.ttl / 3):
+            try:
+                renewed = self.backend.renew(self.name, self.owner, self.ttl)
+            except Exception as e:
+                # transient backend error, the lease is still ours until it expires
+                print(f'Lease {self.name}: renewal failed: {e}')
+                renewed = None
+            if renewed:
+                last_renew_time = time.monotonic()
+            elif renewed is not None or time.monotonic() - last_renew_time >= self.ttl:
+                print(f'Lease {self.name}: lost')
+                self.lost = True
+                return
+
+    def is_valid(self):
+        return not self.lost
+
+    def release(self):
+        if self.heartbeat_thread is None:
+            return
+        self.stop_event.set()
+        self.heartbeat_thread.join()
+        self.heartbeat_thread = None
+        if not self.lost:
+            try:
+                self.backend.release(self.name, self.owner)
+            except Exception as e:
+                # expires by itself
+                print(f'Lease {self.name}: release failed: {e}')
+
+
+class LeaseManager:
+    def __init__(self, backend, ttl: float = 60):
+        self.backend = backend
+        self.ttl = ttl
+        self.owner = get_lease_owner_id()
+
+    def create_lease(self, name: str):
+        return CategoryLease(self.backend, name, self.owner, self.ttl)
+
+    def close(self):
+        self.backend.close()
+
+
+def create_lease_manager(lease_options: dict, db_config: dict = None):
+    backend = lease_options.get('backend', 'db')
+    if backend == 'db':
+        if db_config is None:
+            raise RuntimeError('Database leases require --use-mysql or --use-sqlite')
+        lease_backend = DatabaseLeaseBackend(db_config)
+    else:
+        assert backend == 'coordinator'
+        lease_backend = CoordinatorLeaseBackend(lease_options['address'])
+    return LeaseManager(lease_backend, lease_options.get('ttl', 60))
+
+
+class LeaseTable:
+    def __init__(self):
+        self.leases = {}
+        self.lock = threading.Lock()
+
+    def _is_held_by_other(self, name: str, owner: str, now: float):
+        lease = self.leases.get(name)
+        return lease is not None and lease[0] != owner and lease[1] >= now
+
+    def acquire(self, name: str, owner: str, ttl: float, session):
+        with self.lock:
+            now = time.monotonic()
+            if self._is_held_by_other(name, owner, now):
+                return False
+            self.leases[name] = (owner, now + ttl, session)
+            return True
+
+    def renew(self, name: str, owner: str, ttl: float, session):
+        with self.lock:
+            lease = self.leases.get(name)
+            if lease is None or lease[0] != owner:
+                return False
+            self.leases[name] = (owner, time.monotonic() + ttl, session)
+            return True
+
+    def release(self, name: str, owner: str):
+        with self.lock:
+            lease = self.leases.get(name)
+            if lease is not None and lease[0] == owner:
+                del self.leases[name]
+            return True
+
+    def release_session(self, session):
+        with self.lock:
+            for name in [name for name, lease in self.leases.items() if lease[2] is session]:
+                del self.leases[name]
+
+    def count(self):
+        with self.lock:
+            now = time.monotonic()
+            return sum(1 for lease in self.leases.values() if lease[1] >= now)
+
+
+class _LeaseRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        lease_table = self.server.lease_table
+        session = object()
+        try:
+            for line in self.rfile:
+                request = json.loads(line)
+                op = request['op']
+                if op == 'acquire':
+                    ok = lease_table.acquire(request['name'], request['owner'], request['ttl'], session)
+                elif op == 'renew':
+                    ok = lease_table.renew(request['name'], request['owner'], request['ttl'], session)
+                elif op == 'release':
+                    ok = lease_table.release(request['name'], request['owner'])
+                else:
+                    ok = False
+                self.wfile.write(json.dumps({'ok': ok}).encode('utf-8') + b'\n')
+                self.wfile.flush()
+        except (OSError, ValueError):
+            pass
+        finally:
+            # the worker is gone, its categories are free right away
+            lease_table.release_session(session)
+
+
+class LeaseCoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super(LeaseCoordinatorServer, self).__init__(address, _LeaseRequestHandler)
+        self.lease_table = LeaseTable()
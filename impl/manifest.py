@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from .common import DownloaderState
+try:
+    import fcntl
+    _fcntl_available = True
+except ImportError:
+    _fcntl_available = False
+
+# Append-only journal of category states, one JSON object per line, the last line of a category wins.
+# A torn last line left by a crash is ignored on load. Several runs may share a workspace: appends and loads hold an
+# advisory lock on the journal, and compaction rewrites it in place under the exclusive lock, so the append handles of
+# other runs keep pointing to the live file. A crash during compaction can only drop entries, those categories are
+# visited again.
+
+
+class CategoryManifest:
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a+', encoding='utf-8')
+        with self._file_lock(True):
+            self.entries = self._load()
+            # ends a torn last line, the next append would be lost with it otherwise
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        self.file.write('\n')
+                        self.file.flush()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if not _fcntl_available:
+            yield
+            return
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def _load(self):
+        entries = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(entry, dict) and 'wordnet_id' in entry:
+                    entries[entry['wordnet_id']] = entry
+        return entries
+
+    def compact(self):
+        # other runs may have appended since this one loaded, their entries are read back before the rewrite
+        with self.lock, self._file_lock(True):
+            entries = self._load()
+            with open(self.path, 'r+', encoding='utf-8') as f:
+                for entry in entries.values():
+                    f.write(json.dumps(entry) + '\n')
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+
+    def get(self, wordnet_id: str):
+        with self.lock:
+            return self.entries.get(wordnet_id)
+
+    def needs_download(self, wordnet_id: str, target_number: int):
+        entry = self.get(wordnet_id)
+        if entry is None:
+            return True
+        return entry['count'] < target_number
+
+    def update(self, wordnet_id: str, state: DownloaderState, count: int = None):
+        # count is None when it was not observed, e.g. the worker crashed
+        with self.lock:
+            if (state == DownloaderState.Skipped or count is None) and wordnet_id in self.entries:
+                # locked by another worker or not observed, the recorded count stays
+                count = self.entries[wordnet_id]['count']
+            elif count is None:
+                count = 0
+            entry = {'wordnet_id': wordnet_id, 'state': state.name, 'count': count, 'last_attempt': time.time()}
+            self.entries[wordnet_id] = entry
+            with self._file_lock(True):
+                self.file.write(json.dumps(entry) + '\n')
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
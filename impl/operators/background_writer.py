@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from impl.perf_stat.function_call import record_running_time, get_current_perf_stat, run_with_perf_stat
+
+
+_durability_policies = ('none', 'file', 'batch')
+
+
+class BackgroundFileWriter:
+    def __init__(self, fs_ops, num_threads: int = 2, max_inflight_bytes: int = 64 * 1024 * 1024,
+                 durability: str = 'none', fsync_batch_size: int = 64):
+        assert durability in _durability_policies
+        self.fs_ops = fs_ops
+        self.max_inflight_bytes = max_inflight_bytes
+        self.durability = durability
+        self.fsync_batch_size = fsync_batch_size
+        self.executor = ThreadPoolExecutor(num_threads)
+        self.condition = threading.Condition()
+        self.inflight_bytes = 0
+        self.num_pending = 0
+        # (image_file_name, content, on_done, on_error) written but not synced yet, batch policy only
+        self.unsynced_writes = []
+        self.error = None
+        self.perf_stat = get_current_perf_stat()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def _complete(self, writes, write_error):
+        # only a failed save or fsync fails the writes
+        for image_file_name, content, on_done, on_error in writes:
+            if write_error is not None:
+                self.error = write_error
+                if on_error is not None:
+                    on_error(image_file_name)
+            elif on_done is not None:
+                try:
+                    on_done(image_file_name, content)
+                except Exception as e:
+                    # the file is written, the callback error is raised to the caller without failing the write
+                    self.error = e
+
+    def _sync_batch(self, writes):
+        # the callbacks run once the batch is synced, so a meta row never gets ahead of durable bytes
+        if len(writes) == 0:
+            return
+        try:
+            run_with_perf_stat(self.perf_stat, self.fs_ops.sync_files, [write[0] for write in writes])
+        except Exception as e:
+            self._complete(writes, e)
+            return
+        self._complete(writes, None)
+
+    def _run(self, image_file_name: str, content: bytes, on_done, on_error):
+        write = image_file_name, content, on_done, on_error
+        try:
+            try:
+                run_with_perf_stat(self.perf_stat, self.fs_ops.save, image_file_name, content,
+                                   fsync=self.durability == 'file')
+            except Exception as e:
+                self._complete([write], e)
+                return
+            if self.durability != 'batch':
+                self._complete([write], None)
+                return
+            batch = None
+            with self.condition:
+                self.unsynced_writes.append(write)
+                if len(self.unsynced_writes) >= self.fsync_batch_size:
+                    batch = self.unsynced_writes
+                    self.unsynced_writes = []
+            if batch is not None:
+                self._sync_batch(batch)
+        finally:
+            with self.condition:
+                self.inflight_bytes -= len(content)
+                self.num_pending -= 1
+                self.condition.notify_all()
+
+    @record_running_time
+    def save(self, image_file_name: str, content: bytes, on_done=None, on_error=None):
+        self._raise_error()
+        with self.condition:
+            # a single image larger than the limit is still accepted once nothing else is in flight
+            self.condition.wait_for(lambda: self.inflight_bytes == 0 or
+                                    self.inflight_bytes + len(content) <= self.max_inflight_bytes)
+            self.inflight_bytes += len(content)
+            self.num_pending += 1
+        self.executor.submit(self._run, image_file_name, content, on_done, on_error)
+
+    @record_running_time
+    def flush(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.num_pending == 0)
+            batch = self.unsynced_writes
+            self.unsynced_writes = []
+        self._sync_batch(batch)
+        self._raise_error()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
@@ -1,10 +1,17 @@
+import time
 from impl.perf_stat.function_call import record_running_time
 
 
 class DatabaseOperators:
-    def __init__(self, dao, wordnet_id):
+    def __init__(self, dao, wordnet_id, batch_size: int = 64, max_batch_age: float = 5):
         self.dao = dao
         self.wordnet_id = wordnet_id
+        self.batch_size = batch_size
+        self.max_batch_age = max_batch_age
+        self.buffered_file_names = []
+        self.buffered_urls = []
+        self.buffered_image_metas = []
+        self.buffer_begin_time = None
 
     @record_running_time
     def __enter__(self):
@@ -12,7 +19,10 @@ class DatabaseOperators:
 
     @record_running_time
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.cursor.close()
+        try:
+            self.flush()
+        finally:
+            self.cursor.close()
 
     @record_running_time
     def has_file(self, image_file_name: str):
@@ -20,11 +30,17 @@ class DatabaseOperators:
 
     @record_running_time
     def count(self):
+        self.flush()
         return self.dao.count_by_wordnet_id(self.cursor, self.wordnet_id)
 
     @record_running_time
-    def save_meta(self, image_file_name: str, url: str):
-        ok, errno, err_msg = self.dao.insert_and_commit(self.cursor, self.wordnet_id, image_file_name, url)
+    def list_files(self):
+        self.flush()
+        return self.dao.get_file_names_by_wordnet_id(self.cursor, self.wordnet_id)
+
+    def _insert_one(self, image_file_name: str, url: str, image_meta=None):
+        ok, errno, err_msg = self.dao.insert_and_commit(self.cursor, self.wordnet_id, image_file_name, url,
+                                                        image_meta)
         if ok:
             return True
         else:
@@ -32,3 +48,47 @@ class DatabaseOperators:
                 return False
             else:
                 raise RuntimeError(err_msg)
+
+    @record_running_time
+    def flush(self):
+        if len(self.buffered_file_names) == 0:
+            return
+        file_names = self.buffered_file_names
+        urls = self.buffered_urls
+        image_metas = self.buffered_image_metas
+        self.buffered_file_names = []
+        self.buffered_urls = []
+        self.buffered_image_metas = []
+        self.buffer_begin_time = None
+        if all(image_meta is None for image_meta in image_metas):
+            image_metas = None
+        ok, errno, err_msg = self.dao.insert_multiple_and_commit(self.cursor, [self.wordnet_id] * len(file_names),
+                                                                 file_names, urls, image_metas)
+        if ok:
+            return
+        if errno != 1062:
+            raise RuntimeError(err_msg)
+        # the batch was rolled back because of duplicated rows, retry row by row to keep the rest
+        for index, (file_name, url) in enumerate(zip(file_names, urls)):
+            self._insert_one(file_name, url, image_metas[index] if image_metas is not None else None)
+
+    @record_running_time
+    def save_meta(self, image_file_name: str, url: str, image_meta=None):
+        if self.batch_size <= 1:
+            return self._insert_one(image_file_name, url, image_meta)
+        self.buffered_file_names.append(image_file_name)
+        self.buffered_urls.append(url)
+        self.buffered_image_metas.append(image_meta)
+        if self.buffer_begin_time is None:
+            self.buffer_begin_time = time.perf_counter()
+        if len(self.buffered_file_names) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_aged()
+        return True
+
+    def flush_aged(self):
+        # also called by the download loops between saves, so a category that stops finding images still publishes
+        # its buffered rows to the other workers
+        if self.buffer_begin_time is not None and time.perf_counter() - self.buffer_begin_time >= self.max_batch_age:
+            self.flush()
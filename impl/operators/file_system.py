@@ -43,28 +43,73 @@ class FileSystemOperators:
         except OSError:
             pass
 
+    def close(self):
+        pass
+
     @record_running_time
     def has_file(self, image_file_name: str):
         return os.path.exists(os.path.join(self.folder, image_file_name))
 
     @record_running_time
     def count(self):
+        return len(self.list_files())
+
+    @record_running_time
+    def list_files(self):
         files = os.listdir(self.folder)
-        files = [file for file in files if file.endswith(_image_file_extensions)]
-        return len(files)
+        return [file for file in files if file.endswith(_image_file_extensions)]
 
     @record_running_time
-    def save(self, image_file_name: str, content: bytes):
+    def save(self, image_file_name: str, content: bytes, fsync: bool = False):
         path = os.path.join(self.folder, image_file_name)
         with open(path + '.tmp', 'wb') as f:
             f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
         try:
             os.rename(path + '.tmp', path)
         except OSError:
             os.remove(path)
             os.rename(path + '.tmp', path)
+        if fsync:
+            self._fsync_folder()
+
+    def _fsync_folder(self):
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(self.folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @record_running_time
+    def sync_files(self, image_file_names):
+        for image_file_name in image_file_names:
+            fd = os.open(os.path.join(self.folder, image_file_name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._fsync_folder()
 
     @record_running_time
-    def save_meta(self, image_file_name: str, image_url: str):
+    def link_file(self, source_path: str, image_file_name: str):
+        path = os.path.join(self.folder, image_file_name)
+        try:
+            os.link(source_path, path + '.tmp')
+        except OSError:
+            return False
+        os.replace(path + '.tmp', path)
+        return True
+
+    @record_running_time
+    def save_meta(self, image_file_name: str, image_url: str, image_meta=None):
         with open(os.path.join(self.folder, 'meta.csv'), 'a', newline='', encoding='utf-8') as f:
-            f.write(f"{image_file_name},{image_url}\n")
+            if image_meta is None:
+                f.write(f"{image_file_name},{image_url}\n")
+            else:
+                # file name, url, width, height, format, content hash
+                f.write(f"{image_file_name},{image_url},{image_meta.width},{image_meta.height},{image_meta.format},"
+                        f"{image_meta.content_hash}\n")
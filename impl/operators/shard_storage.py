@@ -0,0 +1,244 @@
+import os
+import struct
+import threading
+from impl.perf_stat.function_call import record_running_time
+from .file_system import FileSystemOperators
+
+# Shard layout inside a category folder:
+#   NNNNN.shard / NNNNN.index                  sealed shard
+#   NNNNN.shard.active / NNNNN.index.active    shard being appended to
+# The index is a sequence of records (offset, length, name length, name). A record is only appended after its
+# data is written, so after a crash every index record whose data range lies inside the data file is valid.
+# Rotation renames the data file first and the index last, the sealed index is the commit marker.
+
+_shard_suffix = '.shard'
+_index_suffix = '.index'
+_active_suffix = '.active'
+_index_record_header = struct.Struct('<QIH')
+_default_max_shard_size = 256 * 1024 * 1024
+
+
+def _get_shard_file_names(shard_id: int):
+    return f'{shard_id:05d}{_shard_suffix}', f'{shard_id:05d}{_index_suffix}'
+
+
+def _read_index(index_file_path: str, data_size: int):
+    records = []
+    valid_size = 0
+    with open(index_file_path, 'rb') as f:
+        content = f.read()
+    position = 0
+    while position + _index_record_header.size <= len(content):
+        offset, length, name_length = _index_record_header.unpack_from(content, position)
+        name_end = position + _index_record_header.size + name_length
+        if name_end > len(content) or offset + length > data_size:
+            break
+        name = content[position + _index_record_header.size: name_end].decode('utf-8')
+        records.append((name, offset, length))
+        position = name_end
+        valid_size = position
+    return records, valid_size
+
+
+def _list_shard_ids(folder: str):
+    shard_ids = set()
+    for file_name in os.listdir(folder):
+        if file_name.endswith(_shard_suffix) or file_name.endswith(_shard_suffix + _active_suffix):
+            shard_ids.add(int(file_name.split('.')[0]))
+    return sorted(shard_ids)
+
+
+def _recover_shard(folder: str, shard_id: int):
+    # returns (sealed, records, data size) and repairs interrupted writes or rotations
+    shard_file_name, index_file_name = _get_shard_file_names(shard_id)
+    shard_path = os.path.join(folder, shard_file_name)
+    index_path = os.path.join(folder, index_file_name)
+    if os.path.exists(shard_path) and not os.path.exists(index_path) \
+            and os.path.exists(index_path + _active_suffix):
+        # crashed between the two renames of a rotation
+        os.rename(index_path + _active_suffix, index_path)
+    if os.path.exists(index_path):
+        data_size = os.path.getsize(shard_path)
+        records, _ = _read_index(index_path, data_size)
+        return True, records, data_size
+    shard_path += _active_suffix
+    index_path += _active_suffix
+    if not os.path.exists(shard_path):
+        # sealed data file without any index, nothing in it is addressable
+        return True, [], 0
+    if not os.path.exists(index_path):
+        open(index_path, 'wb').close()
+    data_size = os.path.getsize(shard_path)
+    records, valid_index_size = _read_index(index_path, data_size)
+    valid_data_size = max((offset + length for _, offset, length in records), default=0)
+    if valid_index_size != os.path.getsize(index_path):
+        os.truncate(index_path, valid_index_size)
+    if valid_data_size != data_size:
+        os.truncate(shard_path, valid_data_size)
+    return False, records, valid_data_size
+
+
+class ShardStorageOperators(FileSystemOperators):
+    def __init__(self, folder: str, max_shard_size: int = _default_max_shard_size):
+        super(ShardStorageOperators, self).__init__(folder)
+        self.max_shard_size = max_shard_size
+        self.lock = threading.Lock()
+        self.locations = None
+        self.active_shard_id = None
+        self.active_size = 0
+        self.active_data_file = None
+        self.active_index_file = None
+
+    def _load(self):
+        if self.locations is not None:
+            return
+        self.locations = {}
+        last_shard_id = -1
+        for shard_id in _list_shard_ids(self.folder):
+            sealed, records, data_size = _recover_shard(self.folder, shard_id)
+            for name, offset, length in records:
+                self.locations[name] = (shard_id, offset, length)
+            if not sealed:
+                self.active_shard_id = shard_id
+                self.active_size = data_size
+            last_shard_id = shard_id
+        if self.active_shard_id is None:
+            self.active_shard_id = last_shard_id + 1
+            self.active_size = 0
+
+    def _open_active_shard(self):
+        shard_file_name, index_file_name = _get_shard_file_names(self.active_shard_id)
+        self.active_data_file = open(os.path.join(self.folder, shard_file_name + _active_suffix), 'ab')
+        self.active_index_file = open(os.path.join(self.folder, index_file_name + _active_suffix), 'ab')
+
+    def _close_active_shard(self):
+        if self.active_data_file is not None:
+            self.active_data_file.close()
+            self.active_index_file.close()
+            self.active_data_file = None
+            self.active_index_file = None
+
+    def _sync_active_shard(self):
+        if self.active_data_file is None:
+            return
+        self.active_data_file.flush()
+        os.fsync(self.active_data_file.fileno())
+        self.active_index_file.flush()
+        os.fsync(self.active_index_file.fileno())
+
+    @record_running_time
+    def _rotate(self):
+        self._sync_active_shard()
+        self._close_active_shard()
+        shard_file_name, index_file_name = _get_shard_file_names(self.active_shard_id)
+        shard_path = os.path.join(self.folder, shard_file_name)
+        index_path = os.path.join(self.folder, index_file_name)
+        os.rename(shard_path + _active_suffix, shard_path)
+        os.rename(index_path + _active_suffix, index_path)
+        self._fsync_folder()
+        self.active_shard_id += 1
+        self.active_size = 0
+
+    @record_running_time
+    def has_file(self, image_file_name: str):
+        with self.lock:
+            self._load()
+            return image_file_name in self.locations
+
+    @record_running_time
+    def list_files(self):
+        with self.lock:
+            self._load()
+            return list(self.locations.keys())
+
+    @record_running_time
+    def save(self, image_file_name: str, content: bytes, fsync: bool = False):
+        encoded_name = image_file_name.encode('utf-8')
+        with self.lock:
+            self._load()
+            if self.active_size > 0 and self.active_size + len(content) > self.max_shard_size:
+                self._rotate()
+            if self.active_data_file is None:
+                self._open_active_shard()
+            offset = self.active_size
+            self.active_data_file.write(content)
+            self.active_data_file.flush()
+            if fsync:
+                os.fsync(self.active_data_file.fileno())
+            self.active_index_file.write(_index_record_header.pack(offset, len(content), len(encoded_name)))
+            self.active_index_file.write(encoded_name)
+            self.active_index_file.flush()
+            if fsync:
+                os.fsync(self.active_index_file.fileno())
+            self.active_size += len(content)
+            self.locations[image_file_name] = (self.active_shard_id, offset, len(content))
+
+    @record_running_time
+    def sync_files(self, image_file_names):
+        with self.lock:
+            self._sync_active_shard()
+
+    def close(self):
+        with self.lock:
+            self._close_active_shard()
+            self.locations = None
+            self.active_shard_id = None
+
+    @record_running_time
+    def release_lock(self):
+        self.close()
+        super(ShardStorageOperators, self).release_lock()
+
+
+class ShardReader:
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.locations = {}
+        self.files = {}
+        for shard_id in _list_shard_ids(folder):
+            shard_file_name, index_file_name = _get_shard_file_names(shard_id)
+            index_path = os.path.join(folder, index_file_name)
+            shard_path = os.path.join(folder, shard_file_name)
+            if not os.path.exists(index_path):
+                index_path += _active_suffix
+                shard_path += _active_suffix
+                if not os.path.exists(index_path):
+                    continue
+            records, _ = _read_index(index_path, os.path.getsize(shard_path))
+            for name, offset, length in records:
+                self.locations[name] = (shard_path, offset, length)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, image_file_name: str):
+        return image_file_name in self.locations
+
+    def keys(self):
+        return self.locations.keys()
+
+    def read(self, image_file_name: str):
+        shard_path, offset, length = self.locations[image_file_name]
+        if shard_path not in self.files:
+            self.files[shard_path] = open(shard_path, 'rb')
+        f = self.files[shard_path]
+        f.seek(offset)
+        return f.read(length)
+
+    def __getitem__(self, image_file_name: str):
+        return self.read(image_file_name)
+
+    def items(self):
+        for image_file_name in self.locations.keys():
+            yield image_file_name, self.read(image_file_name)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,92 @@
+import os
+import json
+import numpy as np
+
+# Training export layout:
+#   packed_NNNNN.bin   encoded images back to back
+#   urls.bin           source urls back to back, utf-8
+#   index.npy          one _index_dtype record per image, in label order of the export that added it
+#   export.json        export options, label space and the number of images
+# Data is appended before the index is replaced, so bytes after the last indexed image of a file are leftovers of
+# an interrupted export.
+
+index_dtype = np.dtype([
+    ('shard', '<u4'),
+    ('offset', '<u8'),
+    ('length', '<u4'),
+    ('label', '<u4'),
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('url_offset', '<u8'),
+    ('url_length', '<u4'),
+    ('file_name', 'S48')
+])
+# longer names would be truncated silently by numpy, the export skips them
+max_file_name_length = index_dtype['file_name'].itemsize
+
+index_file_name = 'index.npy'
+urls_file_name = 'urls.bin'
+export_info_file_name = 'export.json'
+
+
+def get_packed_file_name(shard_id: int):
+    return f'packed_{shard_id:05d}.bin'
+
+
+class PackedArrayDataset:
+    # zero-copy reads, get_bytes returns a view into the memory mapped shard
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.index = np.load(os.path.join(folder, index_file_name), mmap_mode='r')
+        with open(os.path.join(folder, export_info_file_name), 'r', encoding='utf-8') as f:
+            self.export_info = json.load(f)
+        self.wordnet_ids = self.export_info['wordnet_ids']
+        self.shards = {}
+        self.urls = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def _get_shard(self, shard_id: int):
+        shard = self.shards.get(shard_id)
+        if shard is None:
+            shard = np.memmap(os.path.join(self.folder, get_packed_file_name(shard_id)), dtype=np.uint8, mode='r')
+            self.shards[shard_id] = shard
+        return shard
+
+    def get_bytes(self, index: int):
+        record = self.index[index]
+        offset = int(record['offset'])
+        return self._get_shard(int(record['shard']))[offset: offset + int(record['length'])]
+
+    def get_label(self, index: int):
+        return int(self.index[index]['label'])
+
+    def get_wordnet_id(self, index: int):
+        return self.wordnet_ids[self.get_label(index)]
+
+    def get_size(self, index: int):
+        record = self.index[index]
+        return int(record['width']), int(record['height'])
+
+    def get_url(self, index: int):
+        if self.urls is None:
+            self.urls = np.memmap(os.path.join(self.folder, urls_file_name), dtype=np.uint8, mode='r') \
+                if os.path.getsize(os.path.join(self.folder, urls_file_name)) > 0 else np.empty(0, np.uint8)
+        record = self.index[index]
+        offset = int(record['url_offset'])
+        return self.urls[offset: offset + int(record['url_length'])].tobytes().decode('utf-8')
+
+    def __getitem__(self, index: int):
+        return self.get_bytes(index), self.get_label(index)
+
+    def close(self):
+        self.shards.clear()
+        self.urls = None
+        self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,70 @@
+import os
+import json
+import time
+import threading
+from .function_call import FunctionCallPerfStat
+
+_metric_name = 'pinterest_downloader_function_latency_seconds'
+_max_metric_name = 'pinterest_downloader_function_latency_max_seconds'
+
+
+def _escape_label_value(value: str):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_prometheus_text(summary: dict):
+    lines = [f'# HELP {_metric_name} Running time of instrumented functions',
+             f'# TYPE {_metric_name} summary']
+    for func_name, stat in sorted(summary.items()):
+        label = f'function="{_escape_label_value(func_name)}"'
+        for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+            lines.append(f'{_metric_name}{{{label},quantile="{quantile}"}} {stat[key]}')
+        lines.append(f'{_metric_name}_sum{{{label}}} {stat["total"]}')
+        lines.append(f'{_metric_name}_count{{{label}}} {stat["count"]}')
+    lines.append(f'# HELP {_max_metric_name} Maximum running time of instrumented functions')
+    lines.append(f'# TYPE {_max_metric_name} gauge')
+    for func_name, stat in sorted(summary.items()):
+        lines.append(f'{_max_metric_name}{{function="{_escape_label_value(func_name)}"}} {stat["max"]}')
+    return '\n'.join(lines) + '\n'
+
+
+class PerfStatExporter:
+    def __init__(self, perf_stat: FunctionCallPerfStat, output_dir: str, interval: float = 60):
+        self.perf_stat = perf_stat
+        self.json_lines_path = os.path.join(output_dir, 'perf_stat.jsonl')
+        self.prometheus_path = os.path.join(output_dir, 'perf_stat.prom')
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def export(self):
+        summary = self.perf_stat.get_summary()
+        with open(self.json_lines_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'time': time.time(), 'pid': os.getpid(), 'functions': summary}) + '\n')
+        # replaced atomically, node_exporter's textfile collector may read it at any time
+        temp_path = self.prometheus_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(format_prometheus_text(summary))
+        os.replace(temp_path, self.prometheus_path)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.export()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        self.export()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
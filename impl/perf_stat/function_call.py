@@ -1,8 +1,72 @@
+import math
 import threading
 import time
 
 _stat = threading.local()
 
+# log-scaled buckets from 1us, 4 per octave (~19% relative error), sparse so idle ranges cost nothing
+_min_latency = 1e-6
+_buckets_per_octave = 4
+
+
+def _get_bucket_index(seconds: float):
+    if seconds <= _min_latency:
+        return 0
+    return int(math.log2(seconds / _min_latency) * _buckets_per_octave) + 1
+
+
+def _get_bucket_upper_bound(index: int):
+    return _min_latency * 2 ** (index / _buckets_per_octave)
+
+
+class LatencyHistogram:
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.buckets = {}
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        index = _get_bucket_index(seconds)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other: 'LatencyHistogram'):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def quantile(self, q: float):
+        if self.count == 0:
+            return 0.
+        rank = q * self.count
+        cumulative = 0
+        for index in sorted(self.buckets.keys()):
+            cumulative += self.buckets[index]
+            if cumulative >= rank:
+                return min(_get_bucket_upper_bound(index), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'max': self.max,
+                'buckets': {str(index): count for index, count in self.buckets.items()}}
+
+    @staticmethod
+    def from_dict(state: dict):
+        histogram = LatencyHistogram()
+        histogram.count = state['count']
+        histogram.total = state['total']
+        histogram.max = state['max']
+        histogram.buckets = {int(index): count for index, count in state['buckets'].items()}
+        return histogram
+
 
 def record_running_time(func):
     def _inner(*args, **kwargs):
@@ -12,37 +76,88 @@ def record_running_time(func):
             begin = time.perf_counter()
             ret = func(*args, **kwargs)
             end = time.perf_counter()
-            stat_object = _stat.stat_object
-            func_name = func.__qualname__
-            if func_name not in stat_object.running_time:
-                stat_object.running_time[func_name] = [0, 0]
-            stat_object.running_time[func_name][0] += 1
-            stat_object.running_time[func_name][1] += (end - begin)
+            _stat.stat_object.record(func.__qualname__, end - begin)
             return ret
     return _inner
 
 
+def get_current_perf_stat():
+    return getattr(_stat, 'stat_object', None)
+
+
+def run_with_perf_stat(stat_object, func, *args, **kwargs):
+    # records into the given stat object on the calling thread, used by worker threads
+    if stat_object is None:
+        return func(*args, **kwargs)
+    last_stat_object = getattr(_stat, 'stat_object', None)
+    _stat.stat_object = stat_object
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if last_stat_object is not None:
+            _stat.stat_object = last_stat_object
+        else:
+            del _stat.stat_object
+
+
 class FunctionCallPerfStat:
     def __init__(self, print_on_exit):
-        self.running_time = {}
+        self.histograms = {}
         self.print_on_exit = print_on_exit
+        self.lock = threading.Lock()
 
     def __enter__(self):
         if hasattr(_stat, 'stat_object'):
             self.last_stat_object = _stat.stat_object
         _stat.stat_object = self
 
+    def record(self, func_name: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get(func_name)
+            if histogram is None:
+                histogram = self.histograms[func_name] = LatencyHistogram()
+            histogram.record(seconds)
+
     def clear(self):
-        self.running_time.clear()
+        with self.lock:
+            self.histograms.clear()
+
+    def pop_snapshot(self):
+        # picklable and JSON serializable, shipped from worker processes to the parent
+        with self.lock:
+            snapshot = {func_name: histogram.to_dict() for func_name, histogram in self.histograms.items()}
+            self.histograms.clear()
+        return snapshot
+
+    def merge_snapshot(self, snapshot: dict):
+        with self.lock:
+            for func_name, state in snapshot.items():
+                histogram = self.histograms.get(func_name)
+                if histogram is None:
+                    histogram = self.histograms[func_name] = LatencyHistogram()
+                histogram.merge(LatencyHistogram.from_dict(state))
+
+    def get_summary(self):
+        with self.lock:
+            return {func_name: {'count': histogram.count, 'total': histogram.total,
+                                'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95),
+                                'p99': histogram.quantile(0.99), 'max': histogram.max}
+                    for func_name, histogram in self.histograms.items()}
+
+    def get_summary_string(self, title: str):
+        stat_string = f'{title}:\n'
+        for func_name, summary in sorted(self.get_summary().items()):
+            stat_string += f"{func_name} time {summary['total']:.2f} called {summary['count']} " \
+                           f"avg {summary['total'] / summary['count']:.4f} p50 {summary['p50']:.4f} " \
+                           f"p95 {summary['p95']:.4f} p99 {summary['p99']:.4f} max {summary['max']:.4f}\n"
+        return stat_string
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.print_on_exit:
             import os
-            stat_string = f'Perf stat(pid {os.getpid()}):\n'
-            for func_name, (run_times, running_time) in self.running_time.items():
-                stat_string += f'{func_name} time {running_time:.2f} called {run_times} avg {running_time / run_times:.2f}\n'
-            print(stat_string)
+            print(self.get_summary_string(f'Perf stat(pid {os.getpid()})'))
         if hasattr(self, 'last_stat_object'):
             _stat.stat_object = self.last_stat_object
+            del self.last_stat_object
         else:
             del _stat.stat_object
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import threading
+
+# Trace event format (JSON array form, the closing bracket is optional), loadable by chrome://tracing and Perfetto.
+# Each worker appends to its own file after every category, so a crashed worker loses at most one category.
+# Spans nest, the summary phases are their exclusive (self) times and add up to the category time. Stages of the async
+# pipeline run concurrently, they are async events outside the nesting and their summed busy times overlap.
+
+_current = threading.local()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'begin', 'child_time')
+
+    def __init__(self, tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.begin = time.time()
+        self.child_time = 0
+        self.tracer.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.time() - self.begin
+        self.tracer.stack.pop()
+        if len(self.tracer.stack) > 0:
+            self.tracer.stack[-1].child_time += duration
+        self.tracer._add_span(self.name, self.begin, duration, duration - self.child_time, self.args)
+
+
+class _StageSpan:
+    __slots__ = ('tracer', 'name', 'args', 'begin')
+
+    def __init__(self, tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.begin = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.tracer._add_stage_span(self.name, self.begin, time.time() - self.begin, self.args)
+
+
+def trace_span(name: str, **args):
+    # no-op unless a tracer is active on the calling thread
+    tracer = getattr(_current, 'tracer', None)
+    if tracer is None:
+        return _null_span
+    return _Span(tracer, name, args)
+
+
+def trace_stage(name: str, **args):
+    # for coroutines of the async pipeline, they interleave on the event loop thread and cannot nest
+    tracer = getattr(_current, 'tracer', None)
+    if tracer is None:
+        return _null_span
+    return _StageSpan(tracer, name, args)
+
+
+def trace_count(name: str, value: int = 1):
+    tracer = getattr(_current, 'tracer', None)
+    if tracer is not None:
+        tracer.counters[name] = tracer.counters.get(name, 0) + value
+
+
+class SpanTracer:
+    def __init__(self, trace_dir: str):
+        os.makedirs(trace_dir, exist_ok=True)
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.trace_path = os.path.join(trace_dir, f'trace_{self.pid}_{self.tid}.json')
+        self.summary_path = os.path.join(trace_dir, 'trace_summary.jsonl')
+        self.events = []
+        self.stack = []
+        self.num_stage_spans = 0
+        self.phase_times = {}
+        self.stage_times = {}
+        self.counters = {}
+        self.wordnet_id = None
+        with open(self.trace_path, 'w', encoding='utf-8') as f:
+            f.write('[\n')
+            f.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': self.tid,
+                                'args': {'name': f'worker {self.pid}'}}))
+
+    def _add_span(self, name: str, begin: float, duration: float, self_time: float, args: dict):
+        event = {'name': name, 'cat': self.wordnet_id, 'ph': 'X', 'ts': begin * 1e6, 'dur': duration * 1e6,
+                 'pid': self.pid, 'tid': self.tid}
+        if len(args) > 0:
+            event['args'] = args
+        self.events.append(event)
+        self.phase_times[name] = self.phase_times.get(name, 0) + self_time
+
+    def _add_stage_span(self, name: str, begin: float, duration: float, args: dict):
+        self.num_stage_spans += 1
+        event = {'name': name, 'cat': self.wordnet_id, 'ph': 'b', 'id': self.num_stage_spans, 'ts': begin * 1e6,
+                 'pid': self.pid, 'tid': self.tid}
+        if len(args) > 0:
+            event['args'] = args
+        self.events.append(event)
+        self.events.append({'name': name, 'cat': self.wordnet_id, 'ph': 'e', 'id': self.num_stage_spans,
+                            'ts': (begin + duration) * 1e6, 'pid': self.pid, 'tid': self.tid})
+        self.stage_times[name] = self.stage_times.get(name, 0) + duration
+
+    def category(self, wordnet_id: str):
+        self.wordnet_id = wordnet_id
+        return self
+
+    def __enter__(self):
+        self.last_tracer = getattr(_current, 'tracer', None)
+        _current.tracer = self
+        self.span = _Span(self, 'category', {'wordnet_id': self.wordnet_id}).__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.span.__exit__(exc_type, exc_val, exc_tb)
+        _current.tracer = self.last_tracer
+        self.flush()
+
+    def flush(self):
+        with open(self.trace_path, 'a', encoding='utf-8') as f:
+            for event in self.events:
+                f.write(',\n')
+                f.write(json.dumps(event))
+        summary = {'wordnet_id': self.wordnet_id, 'pid': self.pid,
+                   'phases': {name: round(seconds, 6) for name, seconds in self.phase_times.items()},
+                   'counters': self.counters}
+        if len(self.stage_times) > 0:
+            summary['stages'] = {name: round(seconds, 6) for name, seconds in self.stage_times.items()}
+        with open(self.summary_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary) + '\n')
+        print(f'{self.wordnet_id} phases: ' + ', '.join(
+            f'{name} {seconds:.2f}s' for name, seconds in sorted(self.phase_times.items(), key=lambda x: -x[1])))
+        if len(self.stage_times) > 0:
+            print(f'{self.wordnet_id} pipeline stages (busy, overlapping): ' + ', '.join(
+                f'{name} {seconds:.2f}s' for name, seconds in sorted(self.stage_times.items(), key=lambda x: -x[1])))
+        self.events.clear()
+        self.phase_times = {}
+        self.stage_times = {}
+        self.counters = {}
@@ -1,19 +1,25 @@
 import enum
-from .web_driver import get_default_web_driver
+from .web_driver import WebDriverSession, _pinterest_image_server_scope
 from seleniumwire.request import Request, Response
 from mimetypes import guess_extension
 from typing import Dict
-import time
 import numpy as np
 from .io import DownloaderIOOps
+from .lease import LeaseManager
+from .http_fetcher import PooledImageFetcher
 from .common import DownloaderState, PInterestImageResolution
 from .perf_stat.function_call import FunctionCallPerfStat
+from .perf_stat.tracer import SpanTracer, trace_span, trace_count
+from .scroll_pacing import FixedScrollPacer, create_scroll_pacer
+from .image_validation import ImageValidator
 import traceback
 import urllib.parse
+import queue
 from contextlib import nullcontext
 
 
 _image_file_extensions = ('.jpg', '.jpeg', '.gif', '.webp', '.png')
+_default_search_url_template = 'https://id.pinterest.com/search/pins/?q={query}&rs=typed'
 
 
 class _ImageState(enum.Enum):
@@ -43,6 +49,8 @@ class _ImageContext:
     url: str
     resolution: PInterestImageResolution
     content: bytes
+    # the resolution is not held yet but still to be tried, failed higher resolutions fall back down to it
+    fallback_to_resolution: bool = False
 
 
 def _get_image_file_name_from_url(url: str):
@@ -81,17 +89,16 @@ def _is_pinterest_image_server_url(url: str):
     return True
 
 
-def _parse_request(request: Request):
-    if not _is_pinterest_image_server_url(request.url):
+def _parse_response(url: str, response: Response):
+    if not _is_pinterest_image_server_url(url):
         return None
 
-    image_file_name = _get_image_file_name_from_url(request.url)
+    image_file_name = _get_image_file_name_from_url(url)
     image_context = _ImageContext()
-    image_context.url = request.url
+    image_context.url = url
     image_context.state = _ImageState.rejected
-    image_context.resolution = _get_image_resolution_from_url(request.url)
+    image_context.resolution = _get_image_resolution_from_url(url)
     image_context.content = None
-    response: Response = request.response
 
     ret = (image_file_name, image_context)
 
@@ -117,11 +124,92 @@ def _parse_request(request: Request):
     return ret
 
 
+def _parse_request(request: Request):
+    return _parse_response(request.url, request.response)
+
+
+class StreamingResponseCapture:
+    def __init__(self, driver):
+        self.driver = driver
+        self.captured = queue.SimpleQueue()
+
+    def _response_interceptor(self, request: Request, response: Response):
+        # runs on the selenium-wire proxy threads
+        ret = _parse_response(request.url, response)
+        if ret is not None:
+            self.captured.put(ret)
+
+    def __enter__(self):
+        self.last_scopes = self.driver.scopes
+        self.driver.scopes = [_pinterest_image_server_scope]
+        self.driver.response_interceptor = self._response_interceptor
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        del self.driver.response_interceptor
+        self.driver.scopes = self.last_scopes
+
+    def get_captured(self):
+        captured = []
+        while True:
+            try:
+                captured.append(self.captured.get_nowait())
+            except queue.Empty:
+                return captured
+
+
+_discover_dom_images_script = '''
+const urls = [];
+for (const img of document.querySelectorAll('img:not([data-discovered])')) {
+    img.dataset.discovered = '1';
+    if (img.src) {
+        urls.push(img.src);
+    }
+}
+return urls;
+'''
+
+
+class DomImageDiscovery:
+    # used when the browser does not load images, the thumbnails found in the page are fetched over HTTP instead
+    def __init__(self, driver):
+        self.driver = driver
+        self.discovered_urls = set()
+
+    def get_new_urls(self):
+        new_urls = []
+        for url in self.driver.execute_script(_discover_dom_images_script):
+            # the page may re-create the elements of pins already seen
+            if url in self.discovered_urls or not _is_pinterest_image_server_url(url):
+                continue
+            self.discovered_urls.add(url)
+            new_urls.append(url)
+        return new_urls
+
+
+def _collect_parsed_requests(driver, response_capture: StreamingResponseCapture = None,
+                             image_fetcher: PooledImageFetcher = None, dom_discovery: DomImageDiscovery = None):
+    if dom_discovery is not None:
+        image_fetcher.submit(dom_discovery.get_new_urls())
+    if response_capture is not None:
+        parsed_requests = response_capture.get_captured()
+    else:
+        parsed_requests = [_parse_request(request) for request in driver.requests]
+    del driver.requests
+    if image_fetcher is not None:
+        parsed_requests.extend(_parse_request(request) for request in image_fetcher.get_completed())
+    return parsed_requests
+
+
 def _parse_requests(requests, io_operator: DownloaderIOOps, task_state: Dict[str, _ImageContext], target_resolution: PInterestImageResolution):
+    return _update_task_state([_parse_request(request) for request in requests], io_operator, task_state,
+                              target_resolution)
+
+
+def _update_task_state(parsed_requests, io_operator: DownloaderIOOps, task_state: Dict[str, _ImageContext], target_resolution: PInterestImageResolution):
     downloaded_images = []
     new_requests = []
-    for request in requests:
-        ret = _parse_request(request)
+    for ret in parsed_requests:
         if ret is None:
             continue
         image_file_name, image_context = ret
@@ -147,7 +235,10 @@ def _parse_requests(requests, io_operator: DownloaderIOOps, task_state: Dict[str
                 downloaded_images.append(downloaded_image)
                 task_state[image_file_name] = image_context
             else:
-                if image_context.resolution != min(PInterestImageResolution) and image_context.resolution - 1 > task_state[image_file_name].resolution:
+                lowest_resolution = task_state[image_file_name].resolution
+                if task_state[image_file_name].fallback_to_resolution:
+                    lowest_resolution -= 1
+                if image_context.resolution != min(PInterestImageResolution) and image_context.resolution - 1 > lowest_resolution:
                     new_requests.append((image_context.url, PInterestImageResolution(image_context.resolution - 1)))
                 else:
                     if task_state[image_file_name].state == _ImageState.pending:
@@ -160,9 +251,13 @@ def _parse_requests(requests, io_operator: DownloaderIOOps, task_state: Dict[str
     return downloaded_images, new_requests
 
 
-def _launch_new_requests(driver, new_requests):
+def _launch_new_requests(driver, new_requests, image_fetcher: PooledImageFetcher = None):
     if len(new_requests) == 0:
         return
+    if image_fetcher is not None:
+        image_fetcher.submit([_get_new_url_with_desire_resolution(url, target_resolution)
+                              for url, target_resolution in new_requests])
+        return
     js_script = "let imgs = ["
     for url, target_resolution in new_requests:
         url = _get_new_url_with_desire_resolution(url, target_resolution)
@@ -175,106 +270,271 @@ def _launch_new_requests(driver, new_requests):
     driver.execute_script(js_script)
 
 
-def _save_downloaded_images(downloaded_images, io_operator: DownloaderIOOps, num_downloaded_images, target_number, disp_prefix: str):
-    for image_file_name, image_content, image_url in downloaded_images:
-        io_operator.save(image_file_name, image_content)
-        io_operator.save_meta(image_file_name, image_url)
+def _save_downloaded_images(downloaded_images, io_operator: DownloaderIOOps, num_downloaded_images, target_number, disp_prefix: str,
+                            wait_all: bool = False):
+    if io_operator.image_validator is not None:
+        # images are saved once validated, earlier submitted ones may complete now
+        io_operator.image_validator.submit(downloaded_images)
+        downloaded_images = io_operator.image_validator.get_completed(wait_all)
+    else:
+        downloaded_images = [(image_file_name, image_content, image_url, None)
+                             for image_file_name, image_content, image_url in downloaded_images]
+    for image_file_name, image_content, image_url, image_meta in downloaded_images:
+        io_operator.save(image_file_name, image_content, image_meta)
+        io_operator.save_meta(image_file_name, image_url, image_meta)
         num_downloaded_images += 1
         if disp_prefix is not None:
             print(f'{disp_prefix}: ', end='')
         print(f'{num_downloaded_images}/{target_number} {image_file_name}')
 
 
+def _drain_image_fetcher(image_fetcher: PooledImageFetcher, io_operator: DownloaderIOOps, num_downloaded_images,
+                         target_number: int, target_resolution: PInterestImageResolution, task_state: dict,
+                         disp_prefix: str):
+    while image_fetcher.has_pending():
+        image_fetcher.wait()
+        downloaded_images, new_requests = _parse_requests(image_fetcher.get_completed(), io_operator, task_state,
+                                                          target_resolution)
+        _save_downloaded_images(downloaded_images, io_operator, num_downloaded_images, target_number, disp_prefix)
+        _launch_new_requests(None, new_requests, image_fetcher)
+
+
+def _count_scheduled_images(task_state: dict, num_downloaded_images, image_fetcher: PooledImageFetcher,
+                            image_validator: ImageValidator):
+    # an upper bound, upgrades of images in task_state are counted twice
+    count = num_downloaded_images.item() + \
+        sum(1 for image_context in task_state.values() if image_context.state != _ImageState.downloaded)
+    if image_fetcher is not None:
+        count += image_fetcher.get_num_pending()
+    if image_validator is not None:
+        count += image_validator.get_num_pending()
+    return count
+
+
+def _wait_inflight_images(image_fetcher: PooledImageFetcher, image_validator: ImageValidator):
+    # returns False if nothing is in flight
+    if image_fetcher is not None and image_fetcher.has_pending():
+        image_fetcher.wait(0.1)
+    elif image_validator is not None and image_validator.has_pending():
+        image_validator.wait(0.1)
+    else:
+        return False
+    return True
+
+
 def _download_loop(driver, io_operator: DownloaderIOOps, num_downloaded_images, target_number: int,
                    target_resolution: PInterestImageResolution, task_state: dict,
-                   rng: np.random.Generator, disp_prefix: str):
-    try_times = 100
-    tried_times = 0
-    sleep_time = 1 / 6
+                   rng: np.random.Generator, disp_prefix: str, image_fetcher: PooledImageFetcher = None,
+                   response_capture: StreamingResponseCapture = None, dom_discovery: DomImageDiscovery = None,
+                   scroll_pacer=None):
+    if scroll_pacer is None:
+        scroll_pacer = FixedScrollPacer(driver, rng)
     last_run_downloaded = num_downloaded_images.item()
 
-    page_height = 0
-
     while True:
-        if tried_times > try_times:
+        if not io_operator.is_lock_valid():
+            return False
+        if scroll_pacer.is_exhausted():
+            if image_fetcher is not None:
+                with trace_span('drain_image_fetcher'):
+                    _drain_image_fetcher(image_fetcher, io_operator, num_downloaded_images, target_number,
+                                         target_resolution, task_state, disp_prefix)
             return num_downloaded_images - last_run_downloaded > 0
 
-        downloaded_images, new_requests = _parse_requests(driver.requests, io_operator, task_state, target_resolution)
-        del driver.requests
-
-        if len(downloaded_images) == 0 and len(new_requests) == 0:
-            tried_times += 1
-        else:
-            tried_times = 0
-
-        _save_downloaded_images(downloaded_images, io_operator, num_downloaded_images, target_number, disp_prefix)
-        _launch_new_requests(driver, new_requests)
-
-        if num_downloaded_images < target_number:
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(rng.random() * sleep_time * 2)
-            new_page_height = driver.execute_script("return document.body.scrollHeight;")
-            if new_page_height > page_height:
-                page_height = new_page_height
-                tried_times = 0
+        # an iteration that finds nothing is renamed to idle_iteration, the pacer decides when to give up
+        with trace_span('iteration') as iteration_span:
+            with trace_span('parse_requests'):
+                parsed_requests = _collect_parsed_requests(driver, response_capture, image_fetcher, dom_discovery)
+                downloaded_images, new_requests = _update_task_state(parsed_requests, io_operator, task_state,
+                                                                     target_resolution)
+
+            if len(downloaded_images) == 0 and len(new_requests) == 0 and \
+                    (image_fetcher is None or not image_fetcher.has_pending()) and \
+                    (io_operator.image_validator is None or not io_operator.image_validator.has_pending()):
+                scroll_pacer.record(False)
+                iteration_span.name = 'idle_iteration'
+                trace_count('idle_iterations')
+            else:
+                scroll_pacer.record(True)
+
+            with trace_span('save_downloaded_images', images=len(downloaded_images)):
+                _save_downloaded_images(downloaded_images, io_operator, num_downloaded_images, target_number,
+                                        disp_prefix)
+                io_operator.flush_aged_metas()
+            with trace_span('launch_new_requests', requests=len(new_requests)):
+                _launch_new_requests(driver, new_requests, image_fetcher)
+
+            if num_downloaded_images < target_number:
+                if _count_scheduled_images(task_state, num_downloaded_images, image_fetcher,
+                                           io_operator.image_validator) < target_number:
+                    scroll_pacer.scroll()
+                else:
+                    # enough images are in flight, scrolling on would only fetch beyond the target
+                    with trace_span('wait_inflight_images'):
+                        if not _wait_inflight_images(image_fetcher, io_operator.image_validator):
+                            scroll_pacer.scroll()
+            else:
+                if image_fetcher is not None:
+                    with trace_span('drain_image_fetcher'):
+                        _drain_image_fetcher(image_fetcher, io_operator, num_downloaded_images, target_number,
+                                             target_resolution, task_state, disp_prefix)
+                return True
+
+
+def _finish_download(io_operator: DownloaderIOOps, success_flag: bool, task_state: dict, num_downloaded_images,
+                     target_number: int, disp_prefix: str):
+    if not io_operator.is_lock_valid():
+        # another worker may own the category by now, nothing more is written to it
+        return DownloaderState.Skipped, num_downloaded_images.item()
+    rest_downloaded_images = []
+    for image_file_name, image_context in task_state.items():
+        if image_context.state == _ImageState.pending:
+            downloaded_image = image_file_name, image_context.content, image_context.url
+            rest_downloaded_images.append(downloaded_image)
+    with trace_span('save_pending_images', images=len(rest_downloaded_images)):
+        _save_downloaded_images(rest_downloaded_images, io_operator, num_downloaded_images, target_number, disp_prefix,
+                                True)
+    with trace_span('reconcile'):
+        final_count = io_operator.reconcile()
+    if success_flag:
+        if final_count < target_number:
+            return DownloaderState.Unfinished, final_count
         else:
-            return True
+            return DownloaderState.Done, final_count
+    else:
+        return DownloaderState.Fail, final_count
 
 
 def download_wordnet_id_search_result_from_pinterest(wordnet_id: str, search_name: str, workspace_dir: str,
                                                      db_config: dict, target_number: int, target_resolution,
                                                      proxy_address: str, headless: bool,
                                                      enable_io_perf_stat: bool = False,
-                                                     file_lock_expired_time: int = 1800  # half hour
+                                                     file_lock_expired_time: int = 1800,  # half hour
+                                                     web_driver_session: WebDriverSession = None,
+                                                     image_fetcher: PooledImageFetcher = None,
+                                                     engine: str = 'serial',
+                                                     pipeline_options: dict = None,
+                                                     streaming_capture: bool = False,
+                                                     db_batch_size: int = 64,
+                                                     background_writer_options: dict = None,
+                                                     storage_backend: str = 'files',
+                                                     enable_dedup: bool = False,
+                                                     lease_manager: LeaseManager = None,
+                                                     perf_stat: FunctionCallPerfStat = None,
+                                                     tracer: SpanTracer = None,
+                                                     search_url_template: str = _default_search_url_template,
+                                                     discovery: str = 'browser',
+                                                     search_api=None,
+                                                     scroll_pacing: str = 'fixed',
+                                                     image_validator: ImageValidator = None
                                                      ):
-    perf_stat = FunctionCallPerfStat(True) if enable_io_perf_stat else nullcontext()
-    with perf_stat:
-        io_operator = DownloaderIOOps(wordnet_id, workspace_dir, db_config, file_lock_expired_time)
-        if not io_operator.try_lock():
+    # a perf stat passed in by the caller is collected and reported by the caller
+    if perf_stat is None:
+        perf_stat = FunctionCallPerfStat(True) if enable_io_perf_stat else nullcontext()
+    owned_web_driver_session = web_driver_session is None
+    owned_image_fetcher = False
+    owned_search_api = False
+    # the async fetch stage calls the fetcher from fetch_concurrency threads, an owned fetcher's pool matches it
+    image_fetcher_options = {}
+    if engine == 'async' and pipeline_options is not None and 'fetch_concurrency' in pipeline_options:
+        image_fetcher_options['max_concurrency'] = pipeline_options['fetch_concurrency']
+    if owned_web_driver_session:
+        web_driver_session = WebDriverSession(proxy_address, headless)
+    with perf_stat, tracer.category(wordnet_id) if tracer is not None else nullcontext():
+        io_operator = DownloaderIOOps(wordnet_id, workspace_dir, db_config, file_lock_expired_time, db_batch_size,
+                                      background_writer_options, storage_backend, enable_dedup, lease_manager,
+                                      image_validator)
+        with trace_span('try_lock'):
+            locked = io_operator.try_lock()
+        if not locked:
             return DownloaderState.Skipped, 0
 
-        with io_operator:
-            rng = np.random.Generator(np.random.PCG64())
-            disp_prefix = f'{search_name}({wordnet_id})'
-
-            num_downloaded_images = io_operator.count()
-
-            if num_downloaded_images >= target_number:
-                return DownloaderState.Done, num_downloaded_images
-
-            num_downloaded_images = np.asarray(num_downloaded_images)
-            fault_tolerance = 2
-            tried_times = 0
-
-            task_state = {}
-
-            while True:
-                if tried_times == fault_tolerance:
-                    break
-                try:
-                    driver = get_default_web_driver(proxy_address, headless)
-                    with driver:
-                        driver.get(f'https://id.pinterest.com/search/pins/?q={urllib.parse.quote(search_name)}&rs=typed')
-                        success_flag = _download_loop(driver, io_operator, num_downloaded_images, target_number,
-                                                      target_resolution, task_state, rng, disp_prefix)
-
-                        rest_downloaded_images = []
-                        for image_file_name, image_context in task_state.items():
-                            if image_context.state == _ImageState.pending:
-                                downloaded_image = image_file_name, image_context.content, image_context.url
-                                rest_downloaded_images.append(downloaded_image)
-                        _save_downloaded_images(rest_downloaded_images, io_operator, num_downloaded_images, target_number, disp_prefix)
-                        if success_flag:
-                            if num_downloaded_images < target_number:
-                                return DownloaderState.Unfinished, num_downloaded_images.item()
+        try:
+            with io_operator:
+                rng = np.random.Generator(np.random.PCG64())
+                disp_prefix = f'{search_name}({wordnet_id})'
+
+                num_downloaded_images = io_operator.count()
+
+                if num_downloaded_images >= target_number:
+                    return DownloaderState.Done, num_downloaded_images
+
+                num_downloaded_images = np.asarray(num_downloaded_images)
+                fault_tolerance = 2
+                tried_times = 0
+
+                task_state = {}
+
+                if discovery == 'api':
+                    from .pinterest_api import PinterestSearchApi, run_api_download_loop
+                    if image_fetcher is None:
+                        image_fetcher = PooledImageFetcher(proxy_address)
+                        owned_image_fetcher = True
+                    if search_api is None:
+                        search_api = PinterestSearchApi(proxy_address=proxy_address)
+                        owned_search_api = True
+                    with trace_span('api_download_loop'):
+                        success_flag = run_api_download_loop(search_api, search_name, io_operator,
+                                                             num_downloaded_images, target_number, target_resolution,
+                                                             task_state, rng, disp_prefix, image_fetcher)
+                    return _finish_download(io_operator, success_flag, task_state, num_downloaded_images,
+                                            target_number, disp_prefix)
+
+                while True:
+                    if tried_times == fault_tolerance:
+                        break
+                    try:
+                        with trace_span('driver_acquire'):
+                            driver = web_driver_session.acquire()
+                        response_capture = StreamingResponseCapture(driver) if streaming_capture else None
+                        dom_discovery = None
+                        if web_driver_session.profile.disable_images:
+                            dom_discovery = DomImageDiscovery(driver)
+                            if image_fetcher is None:
+                                image_fetcher = PooledImageFetcher(proxy_address, **image_fetcher_options)
+                                owned_image_fetcher = True
+                        with response_capture if response_capture is not None else nullcontext():
+                            with trace_span('driver_get'):
+                                driver.get(search_url_template.format(query=urllib.parse.quote(search_name)))
+                            scroll_pacer = create_scroll_pacer(scroll_pacing, driver, rng)
+                            if engine == 'async':
+                                from .pipeline import run_async_download_loop
+                                if image_fetcher is None:
+                                    image_fetcher = PooledImageFetcher(proxy_address, **image_fetcher_options)
+                                    owned_image_fetcher = True
+                                with trace_span('async_download_loop'):
+                                    success_flag = run_async_download_loop(driver, io_operator,
+                                                                           num_downloaded_images, target_number,
+                                                                           target_resolution, task_state, rng,
+                                                                           disp_prefix, image_fetcher,
+                                                                           pipeline_options, response_capture,
+                                                                           dom_discovery, scroll_pacer)
                             else:
-                                return DownloaderState.Done, num_downloaded_images.item()
-                        else:
-                            return DownloaderState.Fail, num_downloaded_images.item()
-                except Exception as e:
-                    print(traceback.format_exc())
-                    tried_times += 1
-
-                    debug = True
-                    if debug:
-                        raise e
+                                with trace_span('download_loop'):
+                                    success_flag = _download_loop(driver, io_operator, num_downloaded_images,
+                                                                  target_number, target_resolution, task_state, rng,
+                                                                  disp_prefix, image_fetcher, response_capture,
+                                                                  dom_discovery, scroll_pacer)
+
+                        with trace_span('driver_release'):
+                            web_driver_session.release()
+                        return _finish_download(io_operator, success_flag, task_state, num_downloaded_images,
+                                                target_number, disp_prefix)
+                    except Exception as e:
+                        print(traceback.format_exc())
+                        web_driver_session.discard()
+                        tried_times += 1
+
+                        debug = True
+                        if debug:
+                            raise e
+                return DownloaderState.Fail, num_downloaded_images.item()
+        finally:
+            if owned_image_fetcher:
+                image_fetcher.close()
+            elif image_fetcher is not None:
+                image_fetcher.reset()
+            if owned_search_api:
+                search_api.close()
+            if owned_web_driver_session:
+                web_driver_session.close()
@@ -0,0 +1,179 @@
+import json
+import time
+import urllib.parse
+import numpy as np
+from .common import PInterestImageResolution
+from .io import DownloaderIOOps
+from .http_fetcher import PooledImageFetcher, create_http_session
+from .concurrency import ErrorSignals, get_exception_error_kind
+from .pinterest import _ImageContext, _ImageState, _parse_requests, _save_downloaded_images, \
+    _get_image_file_name_from_url, _launch_new_requests
+from .perf_stat.tracer import trace_span, trace_count
+
+# Discovery without a browser: pages through the JSON resource behind the search page, following its bookmark
+# cursor. Every pin lists its image in all available resolutions, so the wanted one is fetched directly.
+
+_default_api_base_url = 'https://www.pinterest.com'
+_search_resource_path = '/resource/BaseSearchResource/get/'
+_end_bookmark = '-end-'
+
+_get_resolution_from_api_key = {
+    'orig': PInterestImageResolution.Originals,
+    '736x': PInterestImageResolution.p_736x,
+    '564x': PInterestImageResolution.p_564x,
+    '474x': PInterestImageResolution.p_474x,
+    '236x': PInterestImageResolution.p_236x,
+    '170x': PInterestImageResolution.p_170x,
+    '75x75_RS': PInterestImageResolution.p_75x75_RS
+}
+
+
+class PinterestSearchApi:
+    def __init__(self, base_url: str = _default_api_base_url, proxy_address: str = None, page_size: int = 25,
+                 timeout: float = 30, max_retries: int = 3):
+        self.base_url = base_url.rstrip('/')
+        self.session = create_http_session(proxy_address, 2)
+        self.session.headers['Accept'] = 'application/json, text/javascript, */*, q=0.01'
+        self.session.headers['X-Requested-With'] = 'XMLHttpRequest'
+        self.session.headers['X-Pinterest-AppState'] = 'active'
+        self.page_size = page_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.error_signals = ErrorSignals()
+
+    def _get(self, query: str, bookmark: str):
+        source_url = f'/search/pins/?q={urllib.parse.quote(query)}&rs=typed'
+        options = {'query': query, 'scope': 'pins', 'rs': 'typed', 'page_size': self.page_size,
+                   'bookmarks': [bookmark] if bookmark is not None else [], 'redux_normalize_feed': True}
+        params = {'source_url': source_url, 'data': json.dumps({'options': options, 'context': {}}),
+                  '_': int(time.time() * 1000)}
+        for retry in range(self.max_retries):
+            try:
+                response = self.session.get(self.base_url + _search_resource_path, params=params,
+                                            headers={'Referer': self.base_url + source_url}, timeout=self.timeout)
+            except Exception as e:
+                print(f'Search resource request failed: {e}')
+                self.error_signals.record(get_exception_error_kind(e))
+                response = None
+            if response is not None:
+                self.error_signals.record_status(response.status_code)
+            if response is not None and response.status_code == 200:
+                try:
+                    return response.json()
+                except ValueError:
+                    # an interstitial or truncated body, retried like a server error
+                    print('Search resource returned a non JSON body')
+            elif response is not None and response.status_code not in (429, 500, 502, 503, 504):
+                print(f'Search resource returned {response.status_code}')
+                return None
+            time.sleep(2 ** retry)
+        return None
+
+    @staticmethod
+    def _parse_page(body: dict):
+        resource_response = body.get('resource_response', {})
+        data = resource_response.get('data')
+        results = data.get('results', []) if isinstance(data, dict) else data if isinstance(data, list) else []
+        bookmark = resource_response.get('bookmark')
+        if bookmark is None:
+            bookmarks = body.get('resource', {}).get('options', {}).get('bookmarks', [])
+            bookmark = bookmarks[0] if len(bookmarks) > 0 else None
+        pins = []
+        for result in results:
+            images = result.get('images') if isinstance(result, dict) else None
+            if not isinstance(images, dict):
+                continue
+            pin_images = {}
+            for key, image in images.items():
+                if key in _get_resolution_from_api_key and isinstance(image, dict) and 'url' in image:
+                    pin_images[_get_resolution_from_api_key[key]] = image['url']
+            if len(pin_images) > 0:
+                pins.append(pin_images)
+        return pins, bookmark
+
+    def search(self, query: str, max_pages: int = None):
+        # yields the pins of each page, a pin maps PInterestImageResolution to image url
+        bookmark = None
+        num_pages = 0
+        while max_pages is None or num_pages < max_pages:
+            with trace_span('api_get_page'):
+                body = self._get(query, bookmark)
+            if body is None:
+                return
+            pins, bookmark = self._parse_page(body)
+            num_pages += 1
+            yield pins
+            if bookmark is None or bookmark == _end_bookmark:
+                return
+
+    def close(self):
+        self.session.close()
+
+
+def _select_image(pin_images: dict, target_resolution: PInterestImageResolution):
+    # the largest resolution up to the target, or the smallest one above it
+    resolutions = sorted(pin_images.keys())
+    candidates = [resolution for resolution in resolutions if resolution <= target_resolution]
+    resolution = candidates[-1] if len(candidates) > 0 else resolutions[0]
+    return pin_images[resolution], resolutions[0]
+
+
+def run_api_download_loop(search_api: PinterestSearchApi, query: str, io_operator: DownloaderIOOps,
+                          num_downloaded_images, target_number: int, target_resolution: PInterestImageResolution,
+                          task_state: dict, rng: np.random.Generator, disp_prefix: str,
+                          image_fetcher: PooledImageFetcher, max_idle_pages: int = 3, page_interval: float = 0.5):
+    last_run_downloaded = num_downloaded_images.item()
+    idle_pages = 0
+    pages = search_api.search(query)
+    while True:
+        last_round = False
+        if not io_operator.is_lock_valid():
+            return False
+        num_scheduled = num_downloaded_images.item() + sum(1 for image_context in task_state.values()
+                                                          if image_context.state != _ImageState.downloaded)
+        if num_scheduled < target_number and idle_pages < max_idle_pages:
+            pins = next(pages, None)
+            if pins is None:
+                idle_pages = max_idle_pages
+            else:
+                urls = []
+                for pin_images in pins:
+                    url, lowest_resolution = _select_image(pin_images, target_resolution)
+                    image_file_name = _get_image_file_name_from_url(url)
+                    if image_file_name in task_state or io_operator.has_file(image_file_name):
+                        continue
+                    # nothing is held yet, a missing image falls back through the resolutions below the selected one
+                    # down to the lowest listed, inclusive
+                    image_context = _ImageContext()
+                    image_context.url = pin_images[lowest_resolution]
+                    image_context.state = _ImageState.rejected
+                    image_context.resolution = lowest_resolution
+                    image_context.fallback_to_resolution = True
+                    image_context.content = None
+                    task_state[image_file_name] = image_context
+                    urls.append(url)
+                if len(urls) == 0:
+                    idle_pages += 1
+                    trace_count('idle_pages')
+                else:
+                    idle_pages = 0
+                image_fetcher.submit(urls)
+                time.sleep(rng.random() * page_interval * 2)
+        elif image_fetcher.has_pending():
+            image_fetcher.wait(1)
+        else:
+            # the fetches completed since the last round are still to be parsed
+            last_round = True
+
+        with trace_span('parse_requests'):
+            downloaded_images, new_requests = _parse_requests(image_fetcher.get_completed(), io_operator, task_state,
+                                                              target_resolution)
+        with trace_span('save_downloaded_images', images=len(downloaded_images)):
+            _save_downloaded_images(downloaded_images, io_operator, num_downloaded_images, target_number,
+                                    disp_prefix)
+            io_operator.flush_aged_metas()
+        _launch_new_requests(None, new_requests, image_fetcher)
+        if last_round and len(new_requests) == 0:
+            break
+
+    return num_downloaded_images >= target_number or num_downloaded_images - last_run_downloaded > 0
@@ -0,0 +1,234 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .common import PInterestImageResolution
+from .io import DownloaderIOOps
+from .http_fetcher import PooledImageFetcher
+from .perf_stat.function_call import get_current_perf_stat, run_with_perf_stat
+from .perf_stat.tracer import trace_stage
+from .pinterest import _collect_parsed_requests, _parse_request, _update_task_state, \
+    _get_new_url_with_desire_resolution, StreamingResponseCapture, DomImageDiscovery
+from .scroll_pacing import FixedScrollPacer
+
+
+class StageCounter:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.bytes = 0
+        self.busy_time = 0
+        self.begin_time = time.perf_counter()
+
+    def record(self, items: int, num_bytes: int, busy_time: float):
+        self.items += items
+        self.bytes += num_bytes
+        self.busy_time += busy_time
+
+    def get_summary(self):
+        elapsed_time = time.perf_counter() - self.begin_time
+        return f'{self.name} {self.items} items {self.items / elapsed_time:.2f}/s ' \
+               f'{self.bytes / elapsed_time / 1024:.1f}KB/s busy {self.busy_time / elapsed_time:.2f}'
+
+
+class AsyncDownloadPipeline:
+    def __init__(self, driver, io_operator: DownloaderIOOps, num_downloaded_images, target_number: int,
+                 target_resolution: PInterestImageResolution, task_state: dict, rng: np.random.Generator,
+                 disp_prefix: str, image_fetcher: PooledImageFetcher, fetch_concurrency: int = 8,
+                 persist_concurrency: int = 2, queue_size: int = 64,
+                 response_capture: StreamingResponseCapture = None, dom_discovery: DomImageDiscovery = None,
+                 scroll_pacer=None):
+        self.driver = driver
+        self.io_operator = io_operator
+        self.num_downloaded_images = num_downloaded_images
+        self.target_number = target_number
+        self.target_resolution = target_resolution
+        self.task_state = task_state
+        self.rng = rng
+        self.disp_prefix = disp_prefix
+        self.image_fetcher = image_fetcher
+        # more fetching threads than pooled connections would open and discard a connection per extra request
+        self.fetch_concurrency = min(fetch_concurrency, image_fetcher.max_concurrency)
+        self.persist_concurrency = persist_concurrency
+        self.queue_size = queue_size
+        self.response_capture = response_capture
+        self.dom_discovery = dom_discovery
+        self.scroll_pacer = scroll_pacer if scroll_pacer is not None else FixedScrollPacer(driver, rng)
+
+        self.discovery_counter = StageCounter('discovery')
+        self.fetch_counter = StageCounter('fetch')
+        self.persist_counter = StageCounter('persist')
+        self.fetched_requests = []
+        self.num_pending_fetches = 0
+        self.stage_error = None
+        self.num_scheduled_images = num_downloaded_images.item()
+        self.scheduled_image_file_names = set()
+        self.perf_stat = get_current_perf_stat()
+
+    async def _run_in_executor(self, executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    async def _discover_once(self):
+        with trace_stage('discover'):
+            return await self._discover_once_traced()
+
+    async def _discover_once_traced(self):
+        begin_time = time.perf_counter()
+        parsed_requests = await self._run_in_executor(self.driver_executor, _collect_parsed_requests, self.driver,
+                                                      self.response_capture)
+        parsed_requests.extend(_parse_request(request) for request in self.fetched_requests)
+        self.fetched_requests.clear()
+        downloaded_images, new_requests = await self._run_in_executor(self.io_executor, _update_task_state,
+                                                                      parsed_requests, self.io_operator,
+                                                                      self.task_state, self.target_resolution)
+        thumbnail_urls = []
+        if self.dom_discovery is not None:
+            thumbnail_urls = await self._run_in_executor(self.driver_executor, self.dom_discovery.get_new_urls)
+        self.discovery_counter.record(len(downloaded_images) + len(new_requests) + len(thumbnail_urls), 0,
+                                      time.perf_counter() - begin_time)
+        for downloaded_image in downloaded_images:
+            # images still waiting in the persist queue are not visible to io_operator.has_file yet
+            if downloaded_image[0] in self.scheduled_image_file_names:
+                continue
+            self.scheduled_image_file_names.add(downloaded_image[0])
+            self.num_scheduled_images += 1
+            # back-pressure: a full persist queue holds discovery, and so scrolling, until the persist stage catches up
+            await self.persist_queue.put(downloaded_image)
+        for url, target_resolution in new_requests:
+            self.num_pending_fetches += 1
+            await self.fetch_queue.put(_get_new_url_with_desire_resolution(url, target_resolution))
+        for url in thumbnail_urls:
+            self.num_pending_fetches += 1
+            await self.fetch_queue.put(url)
+        return len(downloaded_images) > 0 or len(new_requests) > 0 or len(thumbnail_urls) > 0
+
+    def _has_pending_fetches(self):
+        return self.num_pending_fetches > 0 or len(self.fetched_requests) > 0
+
+    async def _discovery_stage(self):
+        last_run_downloaded = self.num_downloaded_images.item()
+
+        while True:
+            if self.stage_error is not None:
+                raise self.stage_error
+            if not self.io_operator.is_lock_valid():
+                return False
+            if self.scroll_pacer.is_exhausted():
+                await self._drain_fetches()
+                return self.num_downloaded_images - last_run_downloaded > 0
+
+            self.scroll_pacer.record(await self._discover_once() or self._has_pending_fetches())
+
+            if self.num_scheduled_images >= self.target_number:
+                await self._drain_fetches()
+                return True
+
+            await self._run_in_executor(self.io_executor, self.io_operator.flush_aged_metas)
+            # the pacer waits in the driver thread, the fetch and persist stages keep running
+            with trace_stage('scroll'):
+                await self._run_in_executor(self.driver_executor, self.scroll_pacer.scroll)
+
+    async def _drain_fetches(self):
+        while self._has_pending_fetches():
+            with trace_stage('wait_fetches'):
+                await self.fetch_queue.join()
+            await self._discover_once()
+
+    async def _fetch_stage(self):
+        while True:
+            url = await self.fetch_queue.get()
+            try:
+                begin_time = time.perf_counter()
+                with trace_stage('fetch'):
+                    fetched_request = await self._run_in_executor(self.fetch_executor, self.image_fetcher.fetch, url)
+                num_bytes = 0
+                if fetched_request.response is not None and fetched_request.response.body is not None:
+                    num_bytes = len(fetched_request.response.body)
+                self.fetch_counter.record(1, num_bytes, time.perf_counter() - begin_time)
+                self.fetched_requests.append(fetched_request)
+            except Exception as e:
+                self.stage_error = e
+            finally:
+                self.num_pending_fetches -= 1
+                self.fetch_queue.task_done()
+
+    def _store(self, image_file_name: str, image_content: bytes, image_url: str, image_meta):
+        run_with_perf_stat(self.perf_stat, self.io_operator.save, image_file_name, image_content, image_meta)
+        run_with_perf_stat(self.perf_stat, self.io_operator.save_meta, image_file_name, image_url, image_meta)
+
+    async def _persist(self, image_file_name: str, image_content: bytes, image_url: str):
+        image_meta = None
+        if self.io_operator.image_validator is not None:
+            with trace_stage('validate'):
+                image_meta, reason = await asyncio.wrap_future(self.io_operator.image_validator.inspect(image_content))
+            if image_meta is None:
+                self.io_operator.image_validator.reject(image_file_name, reason)
+                return False
+        with trace_stage('store'):
+            await self._run_in_executor(self.io_executor, self._store, image_file_name, image_content, image_url,
+                                        image_meta)
+        return True
+
+    async def _persist_stage(self):
+        while True:
+            image_file_name, image_content, image_url = await self.persist_queue.get()
+            try:
+                begin_time = time.perf_counter()
+                saved = await self._persist(image_file_name, image_content, image_url)
+                if not saved:
+                    # frees the slot for another image
+                    self.num_scheduled_images -= 1
+                    continue
+                self.persist_counter.record(1, len(image_content), time.perf_counter() - begin_time)
+                self.num_downloaded_images += 1
+                if self.disp_prefix is not None:
+                    print(f'{self.disp_prefix}: ', end='')
+                print(f'{self.num_downloaded_images}/{self.target_number} {image_file_name}')
+            except Exception as e:
+                self.stage_error = e
+            finally:
+                self.persist_queue.task_done()
+
+    async def run(self):
+        self.fetch_queue = asyncio.Queue(self.queue_size)
+        self.persist_queue = asyncio.Queue(self.queue_size)
+        self.driver_executor = ThreadPoolExecutor(1)
+        self.fetch_executor = ThreadPoolExecutor(self.fetch_concurrency)
+        # io_operator and its database connection are not thread safe, every call goes through this one thread, off
+        # the event loop
+        self.io_executor = ThreadPoolExecutor(1)
+        try:
+            workers = [asyncio.create_task(self._fetch_stage()) for _ in range(self.fetch_concurrency)]
+            workers += [asyncio.create_task(self._persist_stage()) for _ in range(self.persist_concurrency)]
+            try:
+                success_flag = await self._discovery_stage()
+                await self.persist_queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        finally:
+            for executor in (self.driver_executor, self.fetch_executor, self.io_executor):
+                executor.shutdown(wait=True)
+        if self.stage_error is not None:
+            raise self.stage_error
+        return success_flag
+
+    def get_summary(self):
+        return ', '.join(counter.get_summary()
+                         for counter in (self.discovery_counter, self.fetch_counter, self.persist_counter))
+
+
+def run_async_download_loop(driver, io_operator: DownloaderIOOps, num_downloaded_images, target_number: int,
+                            target_resolution: PInterestImageResolution, task_state: dict, rng: np.random.Generator,
+                            disp_prefix: str, image_fetcher: PooledImageFetcher, pipeline_options: dict = None,
+                            response_capture: StreamingResponseCapture = None,
+                            dom_discovery: DomImageDiscovery = None, scroll_pacer=None):
+    if pipeline_options is None:
+        pipeline_options = {}
+    pipeline = AsyncDownloadPipeline(driver, io_operator, num_downloaded_images, target_number, target_resolution,
+                                     task_state, rng, disp_prefix, image_fetcher, response_capture=response_capture,
+                                     dom_discovery=dom_discovery, scroll_pacer=scroll_pacer, **pipeline_options)
+    success_flag = asyncio.run(pipeline.run())
+    print(f'{disp_prefix}: pipeline {pipeline.get_summary()}')
+    return success_flag
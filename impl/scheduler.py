@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import threading
+from .common import DownloaderState
+from .manifest import CategoryManifest
+
+# Yield of a search query is measured in new images per minute of browser time.
+
+
+class QueryYieldStats:
+    def __init__(self, path: str, save_interval: float = 60):
+        self.path = path
+        self.save_interval = save_interval
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.last_save_time = time.monotonic()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.stats = json.load(f)
+            except json.JSONDecodeError:
+                pass
+
+    @staticmethod
+    def _get_key(wordnet_id: str, lemma: str):
+        return f'{wordnet_id}\t{lemma}'
+
+    def get_yield(self, wordnet_id: str, lemma: str):
+        with self.lock:
+            stat = self.stats.get(self._get_key(wordnet_id, lemma))
+        if stat is None or stat['seconds'] <= 0:
+            return None
+        return stat['images'] / stat['seconds'] * 60
+
+    def get_mean_yield(self):
+        with self.lock:
+            images = sum(stat['images'] for stat in self.stats.values())
+            seconds = sum(stat['seconds'] for stat in self.stats.values())
+        if seconds <= 0:
+            return None
+        return images / seconds * 60
+
+    def record(self, wordnet_id: str, lemma: str, num_new_images: int, seconds: float):
+        with self.lock:
+            stat = self.stats.setdefault(self._get_key(wordnet_id, lemma), {'attempts': 0, 'images': 0, 'seconds': 0})
+            # only the latest attempt matters much, older ones decay so an exhausted query falls behind quickly
+            stat['attempts'] += 1
+            stat['images'] = stat['images'] / 2 + num_new_images
+            stat['seconds'] = stat['seconds'] / 2 + seconds
+            need_save = time.monotonic() - self.last_save_time >= self.save_interval
+        if need_save:
+            self.save()
+
+    def save(self):
+        with self.lock:
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.stats, f)
+            os.replace(temp_path, self.path)
+            self.last_save_time = time.monotonic()
+
+    def close(self):
+        self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class YieldAwareScheduler:
+    def __init__(self, manifest: CategoryManifest, yield_stats: QueryYieldStats, target_number: int,
+                 min_query_yield: float = 10, expected_query_minutes: float = 2):
+        self.manifest = manifest
+        self.yield_stats = yield_stats
+        self.target_number = target_number
+        self.min_query_yield = min_query_yield
+        self.expected_query_minutes = expected_query_minutes
+
+    def get_deficit(self, wordnet_id: str):
+        entry = self.manifest.get(wordnet_id)
+        if entry is None:
+            return self.target_number
+        return max(self.target_number - entry['count'], 0)
+
+    def order_lemmas(self, wordnet_id: str, lemmas: list):
+        # productive queries first, untried ones in file order next, exhausted ones last
+        productive = []
+        untried = []
+        exhausted = []
+        for lemma in lemmas:
+            query_yield = self.yield_stats.get_yield(wordnet_id, lemma)
+            if query_yield is None:
+                untried.append(lemma)
+            elif query_yield >= self.min_query_yield:
+                productive.append((query_yield, lemma))
+            else:
+                exhausted.append((query_yield, lemma))
+        productive.sort(key=lambda x: x[0], reverse=True)
+        exhausted.sort(key=lambda x: x[0], reverse=True)
+        return [lemma for _, lemma in productive] + untried + [lemma for _, lemma in exhausted]
+
+    def order_tasks(self, tasks: list):
+        # expected new images of the next attempt: the deficit capped by what the best query returns in a visit,
+        # categories never visited assume the mean yield so they are neither starved nor favoured
+        mean_yield = self.yield_stats.get_mean_yield()
+        prior_yield = mean_yield if mean_yield is not None else float('inf')
+        priorities = []
+        for index, (wordnet_id, lemmas) in enumerate(tasks):
+            deficit = self.get_deficit(wordnet_id)
+            query_yields = [self.yield_stats.get_yield(wordnet_id, lemma) for lemma in lemmas]
+            query_yields = [prior_yield if query_yield is None else query_yield for query_yield in query_yields]
+            best_yield = max(query_yields, default=0)
+            expected_images = min(deficit, best_yield * self.expected_query_minutes)
+            priorities.append((-expected_images, -deficit, index))
+        priorities.sort()
+        return [(tasks[index][0], self.order_lemmas(*tasks[index])) for _, _, index in priorities]
+
+    def should_try_next_lemma(self, state: DownloaderState, num_new_images: int, seconds: float):
+        if state in (DownloaderState.Done, DownloaderState.Skipped):
+            return False
+        if seconds <= 0:
+            return True
+        return num_new_images / seconds * 60 < self.min_query_yield
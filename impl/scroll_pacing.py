@@ -0,0 +1,166 @@
+import time
+import collections
+import numpy as np
+from .perf_stat.tracer import trace_span, trace_count
+
+# A pacer scrolls the search page and decides when it is exhausted. The download loops report after every
+# iteration whether it found anything new.
+
+
+class FixedScrollPacer:
+    # random sleeps after each scroll, gives up after try_times iterations without new images or page growth
+    def __init__(self, driver, rng: np.random.Generator, sleep_time: float = 1 / 6, try_times: int = 100):
+        self.driver = driver
+        self.rng = rng
+        self.sleep_time = sleep_time
+        self.try_times = try_times
+        self.tried_times = 0
+        self.page_height = 0
+
+    def scroll(self):
+        with trace_span('scroll'):
+            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        with trace_span('sleep'):
+            time.sleep(self.rng.random() * self.sleep_time * 2)
+        with trace_span('get_page_height'):
+            new_page_height = self.driver.execute_script("return document.body.scrollHeight;")
+        if new_page_height > self.page_height:
+            self.page_height = new_page_height
+            self.tried_times = 0
+
+    def record(self, found_new: bool):
+        if found_new:
+            self.tried_times = 0
+        else:
+            self.tried_times += 1
+
+    def is_exhausted(self):
+        return self.tried_times > self.try_times
+
+
+# Installs (once per page) a MutationObserver counting unique image sources added to the page and a
+# PerformanceObserver noting network activity, scrolls, then returns as soon as new pins arrived and their images
+# finished loading, or the page went quiet, or the timeout passed.
+_scroll_and_wait_script = '''
+const [lastPins, timeout, idleTime] = arguments;
+const done = arguments[arguments.length - 1];
+if (!window.__scrollPacer) {
+    const pacer = {seen: new Set(), lastMutation: performance.now(), lastNetwork: performance.now()};
+    const countImage = img => {
+        if (img.src && !pacer.seen.has(img.src)) {
+            pacer.seen.add(img.src);
+        }
+    };
+    document.querySelectorAll('img').forEach(countImage);
+    new MutationObserver(mutations => {
+        for (const mutation of mutations) {
+            if (mutation.type === 'attributes') {
+                countImage(mutation.target);
+                continue;
+            }
+            for (const node of mutation.addedNodes) {
+                if (node.nodeType !== Node.ELEMENT_NODE) {
+                    continue;
+                }
+                if (node.tagName === 'IMG') {
+                    countImage(node);
+                }
+                node.querySelectorAll('img').forEach(countImage);
+            }
+        }
+        pacer.lastMutation = performance.now();
+    }).observe(document.body, {childList: true, subtree: true, attributes: true, attributeFilter: ['src']});
+    new PerformanceObserver(list => {
+        pacer.lastNetwork = performance.now();
+        performance.clearResourceTimings();
+    }).observe({type: 'resource'});
+    window.__scrollPacer = pacer;
+}
+const pacer = window.__scrollPacer;
+const begin = performance.now();
+window.scrollTo(0, document.body.scrollHeight);
+function check() {
+    const now = performance.now();
+    let pendingImages = 0;
+    for (const img of document.images) {
+        if (!img.complete) {
+            pendingImages += 1;
+        }
+    }
+    const idle = now - Math.max(pacer.lastMutation, pacer.lastNetwork);
+    const grown = pacer.seen.size > lastPins;
+    if ((grown && (pendingImages === 0 || idle >= idleTime)) || (pendingImages === 0 && idle >= idleTime) ||
+            now - begin >= timeout) {
+        done({pins: pacer.seen.size, pending_images: pendingImages, idle_ms: idle});
+    } else {
+        setTimeout(check, 50);
+    }
+}
+check();
+'''
+
+
+class EventScrollPacer:
+    # waits on page signals instead of fixed sleeps. The page is exhausted after max_idle_scrolls scrolls that
+    # added no pin, or saturated once fewer than min_pin_rate new pins per second arrived over saturation_window
+    # seconds; either ends the category only when the download loop is idle as well.
+    def __init__(self, driver, timeout: float = 5, network_idle_time: float = 0.5, max_idle_scrolls: int = 5,
+                 saturation_window: float = 20, min_pin_rate: float = 0.5):
+        self.driver = driver
+        self.timeout = timeout
+        self.network_idle_time = network_idle_time
+        self.max_idle_scrolls = max_idle_scrolls
+        self.saturation_window = saturation_window
+        self.min_pin_rate = min_pin_rate
+        self.num_pins = 0
+        self.idle_scrolls = 0
+        self.idle = False
+        self.samples = collections.deque()
+        self.driver.set_script_timeout(timeout + 10)
+
+    def scroll(self):
+        with trace_span('scroll_and_wait'):
+            result = self.driver.execute_async_script(_scroll_and_wait_script, self.num_pins, self.timeout * 1000,
+                                                      self.network_idle_time * 1000)
+        if result['pins'] > self.num_pins:
+            self.idle_scrolls = 0
+        else:
+            self.idle_scrolls += 1
+            trace_count('idle_scrolls')
+        self.num_pins = max(self.num_pins, result['pins'])
+        now = time.perf_counter()
+        self.samples.append((now, self.num_pins))
+        # keep one sample at or before the window begin
+        while len(self.samples) > 1 and self.samples[1][0] <= now - self.saturation_window:
+            self.samples.popleft()
+
+    def record(self, found_new: bool):
+        self.idle = not found_new
+
+    def is_saturated(self):
+        if len(self.samples) < 2:
+            return False
+        begin_time, begin_pins = self.samples[0]
+        end_time, end_pins = self.samples[-1]
+        if end_time - begin_time < self.saturation_window:
+            return False
+        return (end_pins - begin_pins) / (end_time - begin_time) < self.min_pin_rate
+
+    def is_exhausted(self):
+        if not self.idle:
+            return False
+        if self.idle_scrolls >= self.max_idle_scrolls:
+            return True
+        if self.is_saturated():
+            trace_count('saturated')
+            return True
+        return False
+
+
+def create_scroll_pacer(scroll_pacing: str, driver, rng: np.random.Generator):
+    if scroll_pacing == 'fixed':
+        return FixedScrollPacer(driver, rng)
+    elif scroll_pacing == 'event':
+        return EventScrollPacer(driver)
+    else:
+        raise ValueError(f'Unknown scroll pacing {scroll_pacing}')
@@ -9,16 +9,99 @@ if using_undetected_chrome_driver:
 else:
     from seleniumwire import webdriver
 
+try:
+    import psutil
+    _psutil_available = True
+except ImportError:
+    _psutil_available = False
 
-def get_default_web_driver(proxy_address: str = None, headless: bool = False):
+
+_pinterest_image_server_scope = r'.*i\.pinimg\.com/.*'
+
+# blocked inside Chrome through the DevTools protocol, the requests never reach the selenium-wire proxy
+_blocked_url_patterns = (
+    '*.woff', '*.woff2', '*.ttf', '*.otf',
+    '*.mp4', '*.m3u8', '*.webm', '*.m4s',
+    '*://v.pinimg.com/*',
+    '*://ct.pinterest.com/*', '*://log.pinterest.com/*', '*://trk.pinterest.com/*',
+    '*://*.google-analytics.com/*', '*://*.googletagmanager.com/*', '*://*.doubleclick.net/*',
+    '*://*.googlesyndication.com/*', '*://accounts.google.com/*', '*://*.facebook.net/*', '*://*.facebook.com/*',
+)
+
+_lean_chrome_arguments = (
+    '--disable-gpu',
+    '--mute-audio',
+    '--autoplay-policy=user-gesture-required',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--disable-extensions',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--disable-breakpad',
+    '--disable-component-update',
+    '--disable-domain-reliability',
+    '--disable-background-networking',
+    '--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication',
+    '--metrics-recording-only',
+)
+
+
+class WebDriverProfile:
+    def __init__(self, scopes: list = None, blocked_url_patterns: tuple = (), chrome_arguments: tuple = (),
+                 disable_images: bool = False, request_storage_max_size: int = None):
+        self.scopes = scopes
+        self.blocked_url_patterns = blocked_url_patterns
+        self.chrome_arguments = chrome_arguments
+        # images are neither fetched nor decoded by the browser, they are discovered from the DOM and fetched over HTTP
+        self.disable_images = disable_images
+        self.request_storage_max_size = request_storage_max_size
+
+
+_web_driver_profiles = {
+    'default': WebDriverProfile(),
+    'lean': WebDriverProfile([_pinterest_image_server_scope], _blocked_url_patterns, _lean_chrome_arguments,
+                             request_storage_max_size=1000),
+    'no-images': WebDriverProfile([_pinterest_image_server_scope], _blocked_url_patterns,
+                                  _lean_chrome_arguments + ('--blink-settings=imagesEnabled=false',),
+                                  disable_images=True, request_storage_max_size=1000),
+}
+
+
+def get_web_driver_profile(name: str):
+    return _web_driver_profiles[name]
+
+
+def _apply_web_driver_profile(driver, profile: WebDriverProfile):
+    if profile.scopes is not None:
+        driver.scopes = profile.scopes
+    if len(profile.blocked_url_patterns) > 0:
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(profile.blocked_url_patterns)})
+        except Exception as e:
+            print(f'Blocking urls is not supported by the driver: {e}')
+
+
+def get_default_web_driver(proxy_address: str = None, headless: bool = False, chrome_arguments: list = None,
+                           profile: WebDriverProfile = None):
     seleniumwire_options = {'verify_ssl': True}
     webdriver_options = {'seleniumwire_options': seleniumwire_options}
+    if profile is None:
+        profile = _web_driver_profiles['default']
+    if profile.request_storage_max_size is not None:
+        # captured images are drained every loop iteration, they never need to touch the disk
+        seleniumwire_options['request_storage'] = 'memory'
+        seleniumwire_options['request_storage_max_size'] = profile.request_storage_max_size
+    chrome_arguments = list(profile.chrome_arguments) + (list(chrome_arguments) if chrome_arguments is not None else [])
 
-    if headless:
+    if headless or len(chrome_arguments) > 0:
         chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument('--headless')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--no-sandbox')
+        if headless:
+            chrome_options.add_argument('--headless')
+            chrome_options.add_argument('--disable-dev-shm-usage')
+            chrome_options.add_argument('--no-sandbox')
+        for argument in chrome_arguments:
+            chrome_options.add_argument(argument)
         webdriver_options['options'] = chrome_options
 
     if proxy_address is not None:
@@ -27,4 +110,65 @@ def get_default_web_driver(proxy_address: str = None, headless: bool = False):
             'https': proxy_address,
             'no_proxy': 'localhost,127.0.0.1,[::1]'  # excludes
         }
-    return webdriver.Chrome(os.path.join(os.path.dirname(__file__), '..', 'drivers/chromedriver'), **webdriver_options)
+    driver = webdriver.Chrome(os.path.join(os.path.dirname(__file__), '..', 'drivers/chromedriver'), **webdriver_options)
+    _apply_web_driver_profile(driver, profile)
+    return driver
+
+
+class WebDriverSession:
+    def __init__(self, proxy_address: str = None, headless: bool = False, max_categories: int = None,
+                 max_memory_mb: int = None, chrome_arguments: list = None, profile: str = 'default'):
+        self.proxy_address = proxy_address
+        self.headless = headless
+        self.chrome_arguments = chrome_arguments
+        self.profile = get_web_driver_profile(profile)
+        self.max_categories = max_categories
+        self.max_memory_mb = max_memory_mb
+        self.driver = None
+        self.served_categories = 0
+
+    def _get_memory_usage_mb(self):
+        if not _psutil_available:
+            return None
+        try:
+            process = psutil.Process(self.driver.service.process.pid)
+            memory_usage = process.memory_info().rss
+            for child in process.children(recursive=True):
+                memory_usage += child.memory_info().rss
+        except (psutil.Error, AttributeError):
+            return None
+        return memory_usage / (1024 * 1024)
+
+    def _should_recycle(self):
+        if self.max_categories is not None and self.served_categories >= self.max_categories:
+            return True
+        if self.max_memory_mb is not None:
+            memory_usage = self._get_memory_usage_mb()
+            if memory_usage is not None and memory_usage >= self.max_memory_mb:
+                return True
+        return False
+
+    def acquire(self):
+        if self.driver is not None and self._should_recycle():
+            self.close()
+        if self.driver is None:
+            self.driver = get_default_web_driver(self.proxy_address, self.headless, self.chrome_arguments,
+                                                 self.profile)
+            self.served_categories = 0
+        return self.driver
+
+    def release(self):
+        self.served_categories += 1
+        del self.driver.requests
+
+    def discard(self):
+        self.close()
+
+    def close(self):
+        if self.driver is None:
+            return
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        self.driver = None
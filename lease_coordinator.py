@@ -0,0 +1,21 @@
+from impl.lease import LeaseCoordinatorServer
+
+
+def serve(host: str, port: int):
+    with LeaseCoordinatorServer((host, port)) as server:
+        print(f'Lease coordinator listening on {host}:{port}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='0.0.0.0', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    args = parser.parse_args()
+    serve(args.host, args.port)
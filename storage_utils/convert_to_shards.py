@@ -0,0 +1,49 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from impl.common import _image_file_extensions
+from impl.operators.shard_storage import ShardStorageOperators
+import shutil
+from tqdm import tqdm
+
+
+def convert_category_to_shards(source_folder: str, target_folder: str, max_shard_size: int):
+    if not os.path.exists(target_folder):
+        os.mkdir(target_folder)
+    shard_ops = ShardStorageOperators(target_folder, max_shard_size)
+    existing_files = set(shard_ops.list_files())
+    try:
+        for file_name in sorted(os.listdir(source_folder)):
+            if not file_name.endswith(_image_file_extensions) or file_name in existing_files:
+                continue
+            with open(os.path.join(source_folder, file_name), 'rb') as f:
+                shard_ops.save(file_name, f.read())
+        shard_ops.sync_files(None)
+    finally:
+        shard_ops.release_lock()
+    meta_file_path = os.path.join(source_folder, 'meta.csv')
+    if os.path.exists(meta_file_path):
+        shutil.copyfile(meta_file_path, os.path.join(target_folder, 'meta.csv'))
+
+
+def convert_workspace_to_shards(workspace_dir: str, output_dir: str, max_shard_size: int):
+    if not os.path.exists(output_dir):
+        os.mkdir(output_dir)
+    categories = sorted(category for category in os.listdir(workspace_dir)
+                        if os.path.isdir(os.path.join(workspace_dir, category)))
+    for category in tqdm(categories):
+        convert_category_to_shards(os.path.join(workspace_dir, category), os.path.join(output_dir, category),
+                                   max_shard_size)
+
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Convert the one-file-per-image workspace layout to shard files')
+    parser.add_argument('workspace_dir', type=str, help='Path of the existing workspace')
+    parser.add_argument('output_dir', type=str, help='Path to store the converted workspace')
+    parser.add_argument('--max-shard-size', type=int, default=256, help='Maximum shard size (MB)')
+    args = parser.parse_args()
+
+    convert_workspace_to_shards(args.workspace_dir, args.output_dir, args.max_shard_size * 1024 * 1024)
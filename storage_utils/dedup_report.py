@@ -0,0 +1,28 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from impl.dedup import ContentHashIndex, get_content_hash_index_path
+
+
+def print_dedup_report(workspace_dir: str, max_category_pairs: int):
+    db_path = get_content_hash_index_path(workspace_dir)
+    if not os.path.exists(db_path):
+        print('No content hash index found, run the downloader with --dedup first')
+        return
+    with ContentHashIndex(db_path) as index:
+        num_duplicates, duplicated_bytes, category_pairs = index.get_report(max_category_pairs)
+    print(f'Cross-category duplicates: {num_duplicates}, saved {duplicated_bytes / 1024 / 1024:.2f} MB')
+    for source_wordnet_id, wordnet_id, count in category_pairs:
+        print(f'{source_wordnet_id} -> {wordnet_id}: {count}')
+
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Report images shared across categories')
+    parser.add_argument('workspace_dir', type=str, help='Path of the workspace')
+    parser.add_argument('--top', type=int, default=20, help='Number of category pairs to list')
+    args = parser.parse_args()
+
+    print_dedup_report(args.workspace_dir, args.top)
@@ -0,0 +1,220 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import io
+import json
+import multiprocessing
+import numpy as np
+from tqdm import tqdm
+from impl.common import _image_file_extensions
+from impl.operators.shard_storage import ShardReader, _list_shard_ids
+from impl.packed_arrays import index_dtype, index_file_name, urls_file_name, export_info_file_name, \
+    get_packed_file_name, max_file_name_length
+try:
+    from PIL import Image
+    _pillow_available = True
+except ImportError:
+    _pillow_available = False
+
+
+def _load_wordnet_ids():
+    with open(os.path.join(os.path.dirname(__file__), '..', 'imagenet21k_wordnet_ids.txt'), 'r') as f:
+        return [line.strip() for line in f if len(line.strip()) > 0]
+
+
+def _load_urls(category_folder: str):
+    urls = {}
+    meta_file_path = os.path.join(category_folder, 'meta.csv')
+    if os.path.exists(meta_file_path):
+        with open(meta_file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.rstrip('\n').split(',')
+                if len(fields) >= 2:
+                    urls[fields[0]] = fields[1]
+    return urls
+
+
+def _list_category_images(category_folder: str):
+    # (file name, (path, offset, length)), length is None for whole files
+    if len(_list_shard_ids(category_folder)) > 0:
+        with ShardReader(category_folder) as reader:
+            return sorted((file_name, reader.locations[file_name]) for file_name in reader.keys())
+    return sorted((file_name, (os.path.join(category_folder, file_name), 0, None))
+                  for file_name in os.listdir(category_folder) if file_name.endswith(_image_file_extensions))
+
+
+def _encode_image(task):
+    # runs in the pool processes
+    label, file_name, (path, offset, length), url, resize, quality = task
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            content = f.read(length) if length is not None else f.read()
+        with Image.open(io.BytesIO(content)) as image:
+            image = image.convert('RGB')
+            if resize > 0 and min(image.size) > resize:
+                scale = resize / min(image.size)
+                image = image.resize((max(round(image.width * scale), 1), max(round(image.height * scale), 1)),
+                                     Image.BICUBIC)
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=quality)
+            return label, file_name, url, buffer.getvalue(), image.width, image.height
+    except Exception as e:
+        return label, file_name, url, None, str(e), None
+
+
+def _load_existing_export(output_dir: str):
+    index_path = os.path.join(output_dir, index_file_name)
+    if not os.path.exists(index_path):
+        return np.empty(0, dtype=index_dtype)
+    return np.load(index_path)
+
+
+def _get_valid_sizes(index: np.ndarray):
+    # bytes past the last indexed record are leftovers of an interrupted export
+    shard_sizes = {}
+    for shard_id in np.unique(index['shard']):
+        records = index[index['shard'] == shard_id]
+        shard_sizes[int(shard_id)] = int((records['offset'] + records['length']).max())
+    urls_size = int((index['url_offset'] + index['url_length']).max()) if len(index) > 0 else 0
+    return shard_sizes, urls_size
+
+
+class _PackedArrayWriter:
+    def __init__(self, output_dir: str, index: np.ndarray, max_shard_size: int):
+        self.output_dir = output_dir
+        self.max_shard_size = max_shard_size
+        self.records = []
+        shard_sizes, urls_size = _get_valid_sizes(index)
+        self.shard_id = max(shard_sizes.keys()) if len(shard_sizes) > 0 else 0
+        self.shard_size = shard_sizes.get(self.shard_id, 0)
+        self.shard_file = self._open(get_packed_file_name(self.shard_id), self.shard_size)
+        self.urls_size = urls_size
+        self.urls_file = self._open(urls_file_name, urls_size)
+
+    def _open(self, file_name: str, valid_size: int):
+        path = os.path.join(self.output_dir, file_name)
+        f = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        f.truncate(valid_size)
+        f.seek(valid_size)
+        return f
+
+    def write(self, label: int, file_name: str, url: str, content: bytes, width: int, height: int):
+        if self.shard_size > 0 and self.shard_size + len(content) > self.max_shard_size:
+            self.shard_file.close()
+            self.shard_id += 1
+            self.shard_size = 0
+            self.shard_file = self._open(get_packed_file_name(self.shard_id), 0)
+        url = url.encode('utf-8')
+        self.records.append((self.shard_id, self.shard_size, len(content), label, width, height, self.urls_size,
+                             len(url), file_name.encode('utf-8')))
+        self.shard_file.write(content)
+        self.shard_size += len(content)
+        self.urls_file.write(url)
+        self.urls_size += len(url)
+
+    def close(self):
+        for f in (self.shard_file, self.urls_file):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        return np.array(self.records, dtype=index_dtype)
+
+
+def _save_index(output_dir: str, index: np.ndarray, export_info: dict):
+    index_path = os.path.join(output_dir, index_file_name)
+    with open(index_path + '.tmp', 'wb') as f:
+        np.save(f, index)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(index_path + '.tmp', index_path)
+    export_info_path = os.path.join(output_dir, export_info_file_name)
+    with open(export_info_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(export_info, f, indent=2)
+    os.replace(export_info_path + '.tmp', export_info_path)
+
+
+def export_packed_arrays(workspace_dir: str, output_dir: str, resize: int, quality: int, max_shard_size: int,
+                         num_workers: int, incremental: bool):
+    if not _pillow_available:
+        raise RuntimeError('Install Pillow')
+    os.makedirs(output_dir, exist_ok=True)
+    wordnet_ids = _load_wordnet_ids()
+    export_info = {'resize': resize, 'quality': quality, 'wordnet_ids': wordnet_ids}
+    index = np.empty(0, dtype=index_dtype)
+    if incremental:
+        index = _load_existing_export(output_dir)
+        export_info_path = os.path.join(output_dir, export_info_file_name)
+        if os.path.exists(export_info_path):
+            with open(export_info_path, 'r', encoding='utf-8') as f:
+                previous_export_info = json.load(f)
+            if previous_export_info['wordnet_ids'] != wordnet_ids or previous_export_info['resize'] != resize or \
+                    previous_export_info['quality'] != quality:
+                raise RuntimeError('The existing export has a different label space or encoding options')
+    else:
+        for file_name in os.listdir(output_dir):
+            if file_name.startswith('packed_') or file_name in (index_file_name, urls_file_name):
+                os.remove(os.path.join(output_dir, file_name))
+    exported = set(zip(index['label'].tolist(), index['file_name'].tolist()))
+
+    tasks = []
+    num_long_names = 0
+    for label, wordnet_id in enumerate(wordnet_ids):
+        category_folder = os.path.join(workspace_dir, wordnet_id)
+        if not os.path.isdir(category_folder):
+            continue
+        urls = _load_urls(category_folder)
+        for file_name, location in _list_category_images(category_folder):
+            if len(file_name.encode('utf-8')) > max_file_name_length:
+                num_long_names += 1
+                print(f'Skipped {wordnet_id}/{file_name}: file name longer than {max_file_name_length} bytes')
+                continue
+            if (label, file_name.encode('utf-8')) in exported:
+                continue
+            tasks.append((label, file_name, location, urls.get(file_name, ''), resize, quality))
+    print(f'{len(index)} images exported before, {len(tasks)} new, {num_long_names} skipped for long file names')
+    if len(tasks) == 0:
+        if not incremental:
+            # the previous export is deleted already, an empty one replaces its export.json
+            export_info['num_images'] = 0
+            open(os.path.join(output_dir, urls_file_name), 'wb').close()
+            _save_index(output_dir, index, export_info)
+        return
+
+    writer = _PackedArrayWriter(output_dir, index, max_shard_size)
+    num_failed = 0
+    try:
+        with multiprocessing.Pool(num_workers) as pool:
+            # imap keeps the label order, so images of a category are contiguous within one export
+            for label, file_name, url, content, width, height in tqdm(pool.imap(_encode_image, tasks, chunksize=16),
+                                                                      total=len(tasks)):
+                if content is None:
+                    num_failed += 1
+                    print(f'Skipped {wordnet_ids[label]}/{file_name}: {width}')
+                    continue
+                writer.write(label, file_name, url, content, width, height)
+    finally:
+        new_index = writer.close()
+        index = np.concatenate((index, new_index))
+        export_info['num_images'] = len(index)
+        _save_index(output_dir, index, export_info)
+    print(f'{len(new_index)} images added, {num_failed} skipped, {len(index)} in total')
+
+
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('Export the workspace to memory mapped packed arrays for training')
+    parser.add_argument('workspace_dir', type=str, help='Path of the workspace')
+    parser.add_argument('output_dir', type=str, help='Path to store the export')
+    parser.add_argument('--resize', type=int, default=256, help='Resize the shorter side to this size, 0 to keep')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality of the re-encoded images')
+    parser.add_argument('--max-shard-size', type=int, default=1024, help='Maximum packed file size (MB)')
+    parser.add_argument('--num-workers', type=int, default=os.cpu_count(), help='Number of encoding processes')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only add images that are not in the existing export')
+    args = parser.parse_args()
+
+    export_packed_arrays(args.workspace_dir, args.output_dir, args.resize, args.quality,
+                         args.max_shard_size * 1024 * 1024, args.num_workers, args.incremental)
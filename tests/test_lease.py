@@ -0,0 +1,123 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import time
+import threading
+import pytest
+from impl.lease import DatabaseLeaseBackend, CoordinatorLeaseBackend, CategoryLease, LeaseCoordinatorServer
+
+
+def _wait_for(condition, timeout: float = 5):
+    end_time = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end_time:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.fixture
+def db_backend(tmp_path):
+    backend = DatabaseLeaseBackend({'backend': 'sqlite', 'database': str(tmp_path / 'leases.sqlite')})
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def coordinator_address():
+    server = LeaseCoordinatorServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_db_lease_taken_over_after_expiry(db_backend):
+    assert db_backend.acquire('n00000001', 'first', 0.3)
+    assert not db_backend.acquire('n00000001', 'second', 0.3)
+    # the first owner stopped renewing
+    time.sleep(0.4)
+    assert db_backend.acquire('n00000001', 'second', 0.3)
+    assert not db_backend.renew('n00000001', 'first', 0.3)
+    assert db_backend.renew('n00000001', 'second', 0.3)
+
+
+def test_heartbeat_keeps_db_lease(db_backend):
+    lease = CategoryLease(db_backend, 'n00000001', 'first', 0.3)
+    assert lease.acquire()
+    time.sleep(0.8)
+    assert lease.is_valid()
+    assert not db_backend.acquire('n00000001', 'second', 0.3)
+    lease.release()
+    assert db_backend.acquire('n00000001', 'second', 0.3)
+
+
+def test_lease_lost_when_another_owner_takes_over(db_backend):
+    lease = CategoryLease(db_backend, 'n00000001', 'first', 0.6)
+    assert lease.acquire()
+    # the heartbeat was too late, e.g. the holder was suspended
+    db_backend.release('n00000001', 'first')
+    assert db_backend.acquire('n00000001', 'second', 0.6)
+    assert _wait_for(lambda: not lease.is_valid())
+    lease.release()
+    # a lost lease is not released, the new owner keeps it
+    assert not db_backend.acquire('n00000001', 'third', 0.6)
+
+
+class _UnreachableBackend:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def acquire(self, name: str, owner: str, ttl: float):
+        return self.backend.acquire(name, owner, ttl)
+
+    def renew(self, name: str, owner: str, ttl: float):
+        raise ConnectionError('backend unreachable')
+
+    def release(self, name: str, owner: str):
+        self.backend.release(name, owner)
+
+
+def test_lease_lost_after_ttl_without_renewal(db_backend):
+    lease = CategoryLease(_UnreachableBackend(db_backend), 'n00000001', 'first', 0.3)
+    assert lease.acquire()
+    # transient renewal errors keep the lease until it may have expired
+    time.sleep(0.15)
+    assert lease.is_valid()
+    assert _wait_for(lambda: not lease.is_valid())
+    lease.release()
+
+
+def test_coordinator_frees_leases_of_a_closed_connection(coordinator_address):
+    first = CoordinatorLeaseBackend(coordinator_address)
+    second = CoordinatorLeaseBackend(coordinator_address)
+    try:
+        assert first.acquire('n00000001', 'first', 60)
+        assert not second.acquire('n00000001', 'second', 60)
+        assert first.renew('n00000001', 'first', 60)
+        # the worker died, its connection closes
+        first.close()
+        assert _wait_for(lambda: second.acquire('n00000001', 'second', 60))
+        assert not first.renew('n00000001', 'first', 60)
+    finally:
+        first.close()
+        second.close()
+
+
+def test_coordinator_lease_taken_over_after_expiry(coordinator_address):
+    first = CoordinatorLeaseBackend(coordinator_address)
+    second = CoordinatorLeaseBackend(coordinator_address)
+    try:
+        assert first.acquire('n00000001', 'first', 0.2)
+        assert not second.acquire('n00000001', 'second', 0.2)
+        time.sleep(0.3)
+        assert second.acquire('n00000001', 'second', 60)
+        assert not first.renew('n00000001', 'first', 60)
+    finally:
+        first.close()
+        second.close()
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import pytest
+from impl.common import DownloaderState
+from impl.manifest import CategoryManifest
+
+
+def _reload(path: str):
+    with CategoryManifest(path) as manifest:
+        return {wordnet_id: (entry['state'], entry['count']) for wordnet_id, entry in manifest.entries.items()}
+
+
+def test_reload_ignores_torn_last_line(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    with CategoryManifest(path) as manifest:
+        manifest.update('n00000001', DownloaderState.Unfinished, 10)
+        manifest.update('n00000001', DownloaderState.Done, 20)
+        manifest.update('n00000002', DownloaderState.Fail, 3)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"wordnet_id": "n00000003", "sta')
+    assert _reload(path) == {'n00000001': ('Done', 20), 'n00000002': ('Fail', 3)}
+    # the torn line is terminated, the next append survives
+    with CategoryManifest(path) as manifest:
+        manifest.update('n00000003', DownloaderState.Done, 5)
+    assert _reload(path)['n00000003'] == ('Done', 5)
+
+
+def test_update_keeps_count_when_not_observed(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    with CategoryManifest(path) as manifest:
+        manifest.update('n00000001', DownloaderState.Unfinished, 300)
+        manifest.update('n00000001', DownloaderState.Skipped, 0)
+        assert manifest.get('n00000001')['count'] == 300
+        # a crashed worker reports no count
+        manifest.update('n00000001', DownloaderState.Fail, None)
+        assert manifest.get('n00000001')['count'] == 300
+        manifest.update('n00000002', DownloaderState.Fail, None)
+        assert manifest.get('n00000002')['count'] == 0
+        assert manifest.needs_download('n00000001', 300) is False
+        assert manifest.needs_download('n00000001', 301) is True
+        assert manifest.needs_download('n00000003', 1) is True
+    assert _reload(path) == {'n00000001': ('Fail', 300), 'n00000002': ('Fail', 0)}
+
+
+def test_runs_sharing_a_workspace(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    first = CategoryManifest(path)
+    second = CategoryManifest(path)
+    first.update('n00000001', DownloaderState.Done, 10)
+    second.update('n00000002', DownloaderState.Done, 20)
+    # compaction keeps what the other run appended, and the other run keeps appending to the live journal
+    first.compact()
+    second.update('n00000003', DownloaderState.Done, 30)
+    first.close()
+    second.close()
+    assert _reload(path) == {'n00000001': ('Done', 10), 'n00000002': ('Done', 20), 'n00000003': ('Done', 30)}
+
+
+def test_compact_keeps_last_entries(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    with CategoryManifest(path) as manifest:
+        for count in range(5):
+            manifest.update('n00000001', DownloaderState.Unfinished, count)
+        manifest.compact()
+    with open(path, 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == 1
+    assert _reload(path) == {'n00000001': ('Unfinished', 4)}
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
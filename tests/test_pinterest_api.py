@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import numpy as np
+import pytest
+from benchmarks.fake_pinterest import FakePinterestServer, FakePinterestOptions
+from impl.common import PInterestImageResolution
+from impl.http_fetcher import PooledImageFetcher
+from impl.io import DownloaderIOOps
+from impl.pinterest_api import PinterestSearchApi, run_api_download_loop
+
+
+def _download(server: FakePinterestServer, workspace_dir: str, target_number: int,
+              target_resolution: PInterestImageResolution):
+    search_api = PinterestSearchApi(server.get_api_base_url(), page_size=server.options.pins_per_page)
+    image_fetcher = PooledImageFetcher()
+    io_operator = DownloaderIOOps('n00000001', workspace_dir, None, 1800)
+    try:
+        with io_operator:
+            num_downloaded_images = np.asarray(0)
+            run_api_download_loop(search_api, 'cat', io_operator, num_downloaded_images, target_number,
+                                  target_resolution, {}, np.random.default_rng(0), None, image_fetcher,
+                                  page_interval=0)
+            return num_downloaded_images.item()
+    finally:
+        image_fetcher.close()
+        search_api.close()
+
+
+def _list_saved_images(workspace_dir: str):
+    return sorted(file_name for file_name in os.listdir(os.path.join(workspace_dir, 'n00000001'))
+                  if file_name.endswith('.jpg'))
+
+
+def test_search_follows_bookmarks_to_the_end():
+    with FakePinterestServer(options=FakePinterestOptions(pins_per_page=5, max_pages=3)) as server:
+        search_api = PinterestSearchApi(server.get_api_base_url(), page_size=5)
+        pages = list(search_api.search('cat'))
+        search_api.close()
+        assert server.num_responses == 3
+    assert [len(pins) for pins in pages] == [5, 5, 5]
+    pin_urls = [pin[PInterestImageResolution.p_736x] for pins in pages for pin in pins]
+    assert len(set(pin_urls)) == 15
+    assert all(PInterestImageResolution.Originals not in pin for pins in pages for pin in pins)
+
+
+def test_download_loop_saves_target_resolution(tmp_path):
+    with FakePinterestServer(options=FakePinterestOptions(pins_per_page=5, max_pages=10)) as server:
+        num_downloaded_images = _download(server, str(tmp_path), 12, PInterestImageResolution.p_736x)
+        image_pool = server.get_image_pool('736x')
+    saved_images = _list_saved_images(str(tmp_path))
+    assert num_downloaded_images >= 12
+    assert len(saved_images) == num_downloaded_images
+    with open(os.path.join(str(tmp_path), 'n00000001', saved_images[0]), 'rb') as f:
+        content = f.read()
+    assert any(content.startswith(image) for image in image_pool)
+
+
+def test_download_loop_stops_when_pages_end(tmp_path):
+    with FakePinterestServer(options=FakePinterestOptions(pins_per_page=5, max_pages=2)) as server:
+        num_downloaded_images = _download(server, str(tmp_path), 100, PInterestImageResolution.p_736x)
+    assert num_downloaded_images == 10
+    assert len(_list_saved_images(str(tmp_path))) == 10
+
+
+def test_download_loop_falls_back_to_lowest_listed_resolution(tmp_path):
+    # only the 236x thumbnails are served, and 236x is the lowest resolution the resource lists
+    options = FakePinterestOptions(pins_per_page=5, max_pages=1, missing_resolutions=('75x75_RS', '170x'),
+                                   missing_resolution_rate=1.)
+    with FakePinterestServer(options=options) as server:
+        num_downloaded_images = _download(server, str(tmp_path), 5, PInterestImageResolution.p_736x)
+        image_pool = server.get_image_pool('236x')
+    assert num_downloaded_images == 5
+    for file_name in _list_saved_images(str(tmp_path)):
+        with open(os.path.join(str(tmp_path), 'n00000001', file_name), 'rb') as f:
+            content = f.read()
+        assert any(content.startswith(image) for image in image_pool)
+
+
+class _NonJsonResponse:
+    status_code = 200
+
+    def json(self):
+        raise ValueError('Expecting value')
+
+
+def test_non_json_page_ends_search(monkeypatch):
+    search_api = PinterestSearchApi('http://127.0.0.1:1', max_retries=2)
+    monkeypatch.setattr(search_api.session, 'get', lambda *args, **kwargs: _NonJsonResponse())
+    monkeypatch.setattr('impl.pinterest_api.time.sleep', lambda seconds: None)
+    assert list(search_api.search('cat')) == []
+    search_api.close()
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
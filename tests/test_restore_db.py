@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import json
+from contextlib import closing
+import pytest
+from impl.db.factory import create_dao
+from db_utils.restore_db import db_restore_records, _RestoreCheckpoint
+
+
+def _create_db(tmp_path):
+    db_config = {'backend': 'sqlite', 'database': str(tmp_path / 'records.sqlite')}
+    dao = create_dao(db_config)
+    with dao:
+        with closing(dao.get_cursor()) as cursor:
+            dao.create_table(cursor)
+    return db_config
+
+
+def _write_csv(path: str, rows):
+    with open(path, 'w', newline='') as f:
+        for wordnet_id, file_name, url in rows:
+            f.write(f'{wordnet_id},{file_name},{url}\n')
+
+
+def _get_rows(num_rows: int, wordnet_id: str = 'n00000001'):
+    return [(wordnet_id, f'{index:032x}.jpg', f'https://i.pinimg.com/736x/{index:032x}.jpg')
+            for index in range(num_rows)]
+
+
+def _list_file_names(db_config: dict, wordnet_id: str = 'n00000001'):
+    dao = create_dao(db_config)
+    with dao:
+        with closing(dao.get_cursor()) as cursor:
+            return sorted(dao.get_file_names_by_wordnet_id(cursor, wordnet_id))
+
+
+def test_checkpoint_records_contiguous_batches_only(tmp_path):
+    checkpoint = _RestoreCheckpoint(str(tmp_path / 'checkpoint.json'))
+    for batch_index in range(3):
+        checkpoint.add_batch('a.csv', batch_index, (batch_index + 1) * 10)
+    checkpoint.set_read_all('a.csv', 3)
+    checkpoint.commit_batch('a.csv', 1)
+    assert checkpoint.get_committed_rows('a.csv') == 0
+    checkpoint.commit_batch('a.csv', 0)
+    assert checkpoint.get_committed_rows('a.csv') == 20
+    assert not checkpoint.is_done('a.csv')
+    checkpoint.commit_batch('a.csv', 2)
+    assert checkpoint.get_committed_rows('a.csv') == 30
+    assert checkpoint.is_done('a.csv')
+    checkpoint.save(True)
+    reloaded = _RestoreCheckpoint(str(tmp_path / 'checkpoint.json'))
+    assert reloaded.is_done('a.csv') and reloaded.get_committed_rows('a.csv') == 30
+
+
+def test_restore_resumes_from_checkpoint(tmp_path, capsys):
+    db_config = _create_db(tmp_path)
+    rows = _get_rows(250)
+    csv_path = str(tmp_path / 'records.csv')
+    _write_csv(csv_path, rows)
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    # an interrupted restore committed the first 100 rows
+    _write_csv(str(tmp_path / 'head.csv'), rows[:100])
+    db_restore_records(db_config, [str(tmp_path / 'head.csv')], num_workers=1)
+    with open(checkpoint_path, 'w') as f:
+        json.dump({'files': {os.path.abspath(csv_path): {'rows': 100, 'done': False}}}, f)
+    capsys.readouterr()
+
+    db_restore_records(db_config, [csv_path], batch_size=40, commit_every=2, num_workers=2,
+                       checkpoint_path=checkpoint_path)
+    # only the rows after the checkpoint are read again
+    assert '150 rows' in capsys.readouterr().out
+    assert _list_file_names(db_config) == sorted(file_name for _, file_name, _ in rows)
+    with open(checkpoint_path) as f:
+        assert json.load(f)['files'][os.path.abspath(csv_path)] == {'rows': 250, 'done': True}
+
+    # a finished file is skipped
+    db_restore_records(db_config, [csv_path], checkpoint_path=checkpoint_path, num_workers=1)
+    assert '0 rows' in capsys.readouterr().out
+
+
+def test_restore_counts_duplicates_and_malformed_rows(tmp_path, capsys):
+    db_config = _create_db(tmp_path)
+    rows = _get_rows(30)
+    csv_path = str(tmp_path / 'records.csv')
+    _write_csv(csv_path, rows + rows[:10])
+    with open(csv_path, 'a') as f:
+        f.write('n00000001,missing_url\n')
+    db_restore_records(db_config, [csv_path], batch_size=8, num_workers=2)
+    summary = capsys.readouterr().out.splitlines()[-1]
+    assert summary.startswith('40 rows')
+    assert summary.endswith('30 inserted, 10 duplicates, 0 failed, 1 malformed')
+    assert len(_list_file_names(db_config)) == 30
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,139 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from contextlib import closing
+import pytest
+import mysql.connector
+from impl.db.factory import create_dao
+from impl.db.DAO import PInterestCrawlerDAO
+from db_utils.migrate_schema_v2 import db_migrate_schema_v2
+
+
+def _create_v1_db(tmp_path, num_records: int):
+    db_config = {'backend': 'sqlite', 'database': str(tmp_path / 'records.sqlite')}
+    dao = create_dao(dict(db_config, schema_version=1))
+    with dao:
+        with closing(dao.get_cursor()) as cursor:
+            dao.create_table(cursor)
+            dao.insert_multiple_and_commit(cursor, ['n00000001'] * num_records,
+                                           [f'{index}.jpg' for index in range(num_records)],
+                                           [f'https://i.pinimg.com/736x/{index}.jpg' for index in range(num_records)])
+    return db_config
+
+
+def test_sqlite_reads_before_and_after_migration(tmp_path):
+    db_config = _create_v1_db(tmp_path, 10)
+    # a downloader connection opened before the migration
+    old_dao = create_dao(db_config)
+    with old_dao:
+        assert old_dao.get_schema_version() == 1
+        with closing(old_dao.get_cursor()) as old_cursor:
+            assert old_dao.count_by_wordnet_id(old_cursor, 'n00000001') == 10
+            db_migrate_schema_v2(db_config)
+            assert old_dao.exists(old_cursor, 'n00000001', '3.jpg')
+            assert old_dao.insert_and_commit(old_cursor, 'n00000001', '10.jpg', 'https://i.pinimg.com/736x/10.jpg')[0]
+            assert old_dao.count_by_wordnet_id(old_cursor, 'n00000001') == 11
+
+    new_dao = create_dao(db_config)
+    with new_dao:
+        assert new_dao.get_schema_version() == 2
+        with closing(new_dao.get_cursor()) as cursor:
+            # the counters include the record the old connection inserted after the migration
+            assert new_dao.count_by_wordnet_id(cursor, 'n00000001') == 11
+            assert new_dao.count_by_wordnet_id(cursor, 'n00000002') == 0
+            assert sorted(new_dao.get_file_names_by_wordnet_id(cursor, 'n00000001')) == \
+                sorted(f'{index}.jpg' for index in range(11))
+            ok, errno, _ = new_dao.insert_and_commit(cursor, 'n00000001', '3.jpg', 'https://i.pinimg.com/736x/3.jpg')
+            assert not ok and errno == 1062
+            assert new_dao.count_by_wordnet_id(cursor, 'n00000001') == 11
+
+
+def test_sqlite_migration_runs_once(tmp_path, capsys):
+    db_config = _create_v1_db(tmp_path, 3)
+    db_migrate_schema_v2(db_config)
+    db_migrate_schema_v2(db_config)
+    assert 'Schema version 2 already' in capsys.readouterr().out
+
+
+class _FakeMySQLCursor:
+    # a Records table of the given schema version, statements of the other version fail like on MySQL
+    def __init__(self, server: dict):
+        self.server = server
+        self.result = None
+
+    def execute(self, statement: str, params=None):
+        if 'information_schema' in statement:
+            self.result = [('wordnet_id_and_file_name',)] if self.server['version'] == 1 else [('wordnet_id',)]
+            return
+        if self.server['error'] is not None:
+            raise self.server['error']
+        if self.server['version'] == 2 and 'wordnet_id_and_file_name' in statement:
+            raise mysql.connector.Error(msg="Unknown column 'wordnet_id_and_file_name'", errno=1054)
+        self.server['statements'].append(statement)
+        self.result = [(1,)]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class _FakeMySQLConnection:
+    def __init__(self, server: dict):
+        self.server = server
+
+    def cursor(self, buffered=False):
+        return _FakeMySQLCursor(self.server)
+
+
+def _open_fake_mysql_dao(server: dict, connection_config: dict = None):
+    dao = PInterestCrawlerDAO(connection_config if connection_config is not None else {})
+    dao.ctx = _FakeMySQLConnection(server)
+    if dao.connection_config.get('schema_version') is None:
+        dao._detect_schema_version()
+    else:
+        dao.schema_version = dao.connection_config['schema_version']
+    return dao
+
+
+def test_mysql_statement_retried_after_rename_swap():
+    server = {'version': 1, 'error': None, 'statements': []}
+    dao = _open_fake_mysql_dao(server)
+    cursor = _FakeMySQLCursor(server)
+    assert dao.exists(cursor, 'n00000001', 'a.jpg')
+    assert 'wordnet_id_and_file_name' in server['statements'][-1]
+    # the migration swapped the tables after the connection was opened
+    server['version'] = 2
+    assert dao.exists(cursor, 'n00000001', 'a.jpg')
+    assert dao.get_schema_version() == 2
+    assert 'wordnet_id_and_file_name' not in server['statements'][-1]
+
+
+def test_mysql_other_errors_are_not_retried():
+    server = {'version': 1, 'error': None, 'statements': []}
+    dao = _open_fake_mysql_dao(server)
+    cursor = _FakeMySQLCursor(server)
+    server['error'] = mysql.connector.Error(msg='Lock wait timeout exceeded', errno=1205)
+    with pytest.raises(mysql.connector.Error):
+        dao.exists(cursor, 'n00000001', 'a.jpg')
+    # the version did not change, the error is the statement's own
+    server['error'] = mysql.connector.Error(msg="Unknown column 'x'", errno=1054)
+    with pytest.raises(mysql.connector.Error):
+        dao.exists(cursor, 'n00000001', 'a.jpg')
+    assert dao.get_schema_version() == 1
+
+
+def test_mysql_forced_schema_version_is_not_detected_again():
+    server = {'version': 2, 'error': None, 'statements': []}
+    dao = _open_fake_mysql_dao(server, {'schema_version': 1})
+    with pytest.raises(mysql.connector.Error):
+        dao.exists(_FakeMySQLCursor(server), 'n00000001', 'a.jpg')
+    assert dao.get_schema_version() == 1
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,77 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import pytest
+from impl.operators.shard_storage import ShardStorageOperators, ShardReader, _index_record_header
+
+
+def _save(folder: str, images: dict, max_shard_size: int = 1024 * 1024):
+    operators = ShardStorageOperators(folder, max_shard_size)
+    for name, content in images.items():
+        operators.save(name, content, True)
+    operators.close()
+
+
+def _read_all(folder: str):
+    with ShardReader(folder) as reader:
+        return dict(reader.items())
+
+
+def test_reopen_after_truncated_write(tmp_path):
+    folder = str(tmp_path)
+    images = {'a.jpg': b'a' * 100, 'b.jpg': b'b' * 200}
+    _save(folder, images)
+    # the data of a third image landed, its index record only partly
+    with open(os.path.join(folder, '00000.shard.active'), 'ab') as f:
+        f.write(b'c' * 300)
+    with open(os.path.join(folder, '00000.index.active'), 'ab') as f:
+        f.write(_index_record_header.pack(300, 300, 5)[:7])
+
+    operators = ShardStorageOperators(folder)
+    assert sorted(operators.list_files()) == ['a.jpg', 'b.jpg']
+    assert os.path.getsize(os.path.join(folder, '00000.shard.active')) == 300
+    operators.save('d.jpg', b'd' * 50, True)
+    operators.close()
+    assert _read_all(folder) == dict(images, **{'d.jpg': b'd' * 50})
+
+
+def test_index_record_without_data_is_dropped(tmp_path):
+    folder = str(tmp_path)
+    _save(folder, {'a.jpg': b'a' * 100, 'b.jpg': b'b' * 200})
+    # the index reached the disk, the tail of the data did not
+    os.truncate(os.path.join(folder, '00000.shard.active'), 150)
+
+    operators = ShardStorageOperators(folder)
+    assert operators.list_files() == ['a.jpg']
+    assert not operators.has_file('b.jpg')
+    operators.close()
+    assert _read_all(folder) == {'a.jpg': b'a' * 100}
+
+
+def test_recover_interrupted_rotation(tmp_path):
+    folder = str(tmp_path)
+    images = {'a.jpg': b'a' * 100, 'b.jpg': b'b' * 100}
+    _save(folder, images)
+    # crashed between renaming the data file and the index of the rotated shard
+    os.rename(os.path.join(folder, '00000.shard.active'), os.path.join(folder, '00000.shard'))
+
+    operators = ShardStorageOperators(folder, 150)
+    assert sorted(operators.list_files()) == ['a.jpg', 'b.jpg']
+    assert os.path.exists(os.path.join(folder, '00000.index'))
+    operators.save('c.jpg', b'c' * 100, True)
+    operators.close()
+    assert os.path.exists(os.path.join(folder, '00001.shard.active'))
+    assert _read_all(folder) == dict(images, **{'c.jpg': b'c' * 100})
+
+
+def test_rotation_seals_full_shards(tmp_path):
+    folder = str(tmp_path)
+    images = {f'{index}.jpg': bytes([index]) * 100 for index in range(5)}
+    _save(folder, images, 250)
+    assert sorted(file_name for file_name in os.listdir(folder) if file_name.endswith('.index')) == \
+        ['00000.index', '00001.index']
+    assert _read_all(folder) == images
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
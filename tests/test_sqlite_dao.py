@@ -0,0 +1,70 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from contextlib import closing
+import pytest
+from impl.db.factory import create_dao
+from impl.image_validation import ImageMeta
+
+
+@pytest.fixture
+def dao(tmp_path):
+    dao = create_dao({'backend': 'sqlite', 'database': str(tmp_path / 'records.sqlite')})
+    with dao:
+        with closing(dao.get_cursor()) as cursor:
+            dao.create_table(cursor)
+        yield dao
+
+
+def test_insert_and_read(dao):
+    with closing(dao.get_cursor()) as cursor:
+        assert dao.insert_and_commit(cursor, 'n00000001', 'a.jpg', 'https://i.pinimg.com/736x/a.jpg') == \
+            (True, None, None)
+        assert dao.insert_multiple_and_commit(cursor, ['n00000001', 'n00000002'], ['b.jpg', 'c.jpg'],
+                                              ['https://i.pinimg.com/736x/b.jpg', 'https://i.pinimg.com/736x/c.jpg'],
+                                              [ImageMeta(64, 48, 'JPEG', 'hash'), None])[0]
+        assert dao.exists(cursor, 'n00000001', 'a.jpg')
+        assert not dao.exists(cursor, 'n00000002', 'a.jpg')
+        assert sorted(dao.get_file_names_by_wordnet_id(cursor, 'n00000001')) == ['a.jpg', 'b.jpg']
+        assert dao.count_by_wordnet_id(cursor, 'n00000001') == 2
+        assert dao.count_all(cursor) == 3
+        assert [row[1:] for row in dao.get_iterator(cursor)] == [
+            ('n00000001', 'a.jpg', 'https://i.pinimg.com/736x/a.jpg'),
+            ('n00000001', 'b.jpg', 'https://i.pinimg.com/736x/b.jpg'),
+            ('n00000002', 'c.jpg', 'https://i.pinimg.com/736x/c.jpg')]
+
+
+def test_duplicate_entry_errno(dao):
+    with closing(dao.get_cursor()) as cursor:
+        dao.insert_and_commit(cursor, 'n00000001', 'a.jpg', 'https://i.pinimg.com/736x/a.jpg')
+        ok, errno, _ = dao.insert_and_commit(cursor, 'n00000001', 'a.jpg', 'https://i.pinimg.com/736x/a.jpg')
+        assert not ok and errno == 1062
+        # the batch is rolled back as a whole
+        ok, errno, _ = dao.insert_multiple_and_commit(cursor, ['n00000001'] * 2, ['b.jpg', 'a.jpg'], ['u', 'u'])
+        assert not ok and errno == 1062
+        assert not dao.exists(cursor, 'n00000001', 'b.jpg')
+        assert dao.insert_multiple_ignore_duplicates(cursor, ['n00000001'] * 2, ['b.jpg', 'a.jpg'], ['u', 'u']) == 1
+        dao.commit()
+        assert dao.count_by_wordnet_id(cursor, 'n00000001') == 2
+
+
+def test_other_integrity_errors_are_not_duplicates(dao):
+    with closing(dao.get_cursor()) as cursor:
+        ok, errno, message = dao.insert_and_commit(cursor, 'n00000001', 'a.jpg', None)
+        assert not ok
+        assert errno != 1062
+        assert 'NOT NULL' in message
+
+
+def test_lease_acquire_conflict(dao):
+    with closing(dao.get_cursor()) as cursor:
+        dao.create_lease_table(cursor)
+        assert dao.try_acquire_lease(cursor, 'n00000001', 'first', 60)
+        assert dao.try_acquire_lease(cursor, 'n00000001', 'first', 60)
+        assert not dao.try_acquire_lease(cursor, 'n00000001', 'second', 60)
+        dao.release_lease(cursor, 'n00000001', 'first')
+        assert dao.try_acquire_lease(cursor, 'n00000001', 'second', 60)
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))